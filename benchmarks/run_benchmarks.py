@@ -0,0 +1,380 @@
+#!/usr/bin/python3
+
+"""
+Benchmarks the throughput and peak memory of the Python scripts on synthetic inputs at several scales,
+and compares the result against a stored baseline to flag regressions. The inputs are generated by
+synthetic_data.py. The throughput is timed inside each script through --metrics-out, so the start up of
+the interpreter and the imports do not count. The throughput of the baseline is scaled by the speed of
+this host relative to the host the baseline was saved on, measured with a fixed calibration workload,
+so a baseline saved on one machine can be checked on another
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+PYTHON_SCRIPT_DIR = os.path.normpath(BENCHMARK_DIR + "/../src/python")
+DEFAULT_BASELINE = BENCHMARK_DIR + "/baseline.json"
+DEFAULT_SEED = 12
+DEFAULT_THRESHOLD = 0.2
+SCALES = {
+    "small": {"samples": 4, "records_per_sample": 2500, "summary_files": 100},
+    "medium": {"samples": 16, "records_per_sample": 10000, "summary_files": 1000},
+    "large": {"samples": 32, "records_per_sample": 50000, "summary_files": 5000}
+}
+SCALE_ORDER = ["small", "medium", "large"]
+# Key of the calibration result in the baseline, not a benchmark
+CALIBRATION_KEY = "calibration"
+# Number of VCF lines split in one run of the calibration workload
+CALIBRATION_LINES = 200000
+# Throughput of benchmarks whose work takes less than this in the baseline is too noisy to compare
+MIN_COMPARED_SECONDS = 0.1
+BENCHMARK_NAMES = ["parse_vcfs", "parse_vcfs_positions", "make_bed_from_vcf", "analyze_false_positive_positions",
+                   "parse_ngswb_results", "parse_ngswb_results_per_sample", "parse_accuracy_results",
+                   "aggregate_results"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-s", "--scales", dest="scales", nargs="+", choices=SCALE_ORDER, default=["small", "medium"],
+        help="Scales to run, default is small and medium"
+    )
+    parser.add_argument(
+        "-b", "--benchmarks", dest="benchmarks", nargs="+", choices=BENCHMARK_NAMES, default=BENCHMARK_NAMES,
+        help="Benchmarks to run, default is all"
+    )
+    parser.add_argument(
+        "-r", "--repeat", dest="repeat", type=int, default=3,
+        help="Number of runs of each benchmark, the fastest run is reported, default is 3"
+    )
+    parser.add_argument(
+        "--seed", dest="seed", type=int, default=DEFAULT_SEED,
+        help="Seed of the synthetic data generators, default is " + str(DEFAULT_SEED)
+    )
+    parser.add_argument(
+        "--baseline", dest="baseline_path", default=DEFAULT_BASELINE,
+        help="Full path to the baseline JSON file, default is benchmarks/baseline.json"
+    )
+    parser.add_argument(
+        "--save-baseline", dest="save_baseline", action="store_true",
+        help="Save the results of this run as the baseline instead of comparing against it"
+    )
+    parser.add_argument(
+        "--threshold", dest="threshold", type=float, default=DEFAULT_THRESHOLD,
+        help="Fraction of throughput loss or peak memory growth over the baseline reported as a regression, "
+             "default is " + str(DEFAULT_THRESHOLD)
+    )
+    parser.add_argument(
+        "--work-directory", dest="work_directory",
+        help="Directory to keep the synthetic data and outputs in, default is a temporary directory removed "
+             "at the end"
+    )
+    parser.add_argument(
+        "-o", dest="output_file",
+        help="Full path to save the results of this run in JSON format"
+    )
+
+    args = parser.parse_args()
+
+    if args.work_directory:
+        work_directory = os.path.abspath(args.work_directory)
+        os.makedirs(work_directory, exist_ok=True)
+    else:
+        work_directory = tempfile.mkdtemp(prefix="vcf_compare_benchmarks_")
+
+    result_dict = {CALIBRATION_KEY: run_calibration(args.repeat)}
+    print(format_result(CALIBRATION_KEY, result_dict[CALIBRATION_KEY]))
+    try:
+        for scale in [scale for scale in SCALE_ORDER if scale in args.scales]:
+            scale_directory = work_directory + "/" + scale
+            print("Generating " + scale + " inputs in " + scale_directory)
+            input_dict = generate_inputs(scale_directory, SCALES[scale], args.seed)
+            for benchmark_name in args.benchmarks:
+                result = run_benchmark(benchmark_name, input_dict, scale_directory, args.repeat)
+                result_dict[benchmark_name + "/" + scale] = result
+                print(format_result(benchmark_name + "/" + scale, result))
+    finally:
+        if not args.work_directory:
+            shutil.rmtree(work_directory)
+
+    if args.output_file:
+        write_json(args.output_file, result_dict)
+
+    if args.save_baseline:
+        baseline_dict = read_baseline(args.baseline_path)
+        baseline_dict.update(result_dict)
+        write_json(args.baseline_path, baseline_dict)
+        print("Baseline saved to " + args.baseline_path)
+        return
+
+    regression_list = compare_to_baseline(result_dict, read_baseline(args.baseline_path), args.threshold)
+    for regression in regression_list:
+        print("REGRESSION: " + regression)
+    if regression_list:
+        sys.exit(1)
+    print("No regressions beyond " + str(int(args.threshold * 100)) + "% of the baseline")
+
+
+def run_calibration(repeat):
+    """
+    Measures the speed of this host with a fixed workload of the same kind as the scripts, splitting
+    VCF lines and their FORMAT and sample columns in pure Python. It is run in a child process and
+    timed inside it, the same as the benchmarks
+    :param repeat:
+    :return: Dictionary of the records and records per second of the fastest run
+    """
+    calibration_code = (
+        "import time\n"
+        "line = 'chr1\\t12345\\t.\\tA\\tG\\t.\\tPASS\\tDP=100\\tGT:AD:AF:DP\\t0/1:50,50:0.5:100'\n"
+        "start_time = time.perf_counter()\n"
+        "total = 0\n"
+        "for _ in range(" + str(CALIBRATION_LINES) + "):\n"
+        "    line_item = line.split('\\t')\n"
+        "    sample_values = dict(zip(line_item[8].split(':'), line_item[9].split(':')))\n"
+        "    total += int(line_item[1]) + sum([int(depth) for depth in sample_values['AD'].split(',')])\n"
+        "print(time.perf_counter() - start_time)\n"
+    )
+    wall_seconds = min([float(subprocess.check_output([sys.executable, "-c", calibration_code]))
+                        for _ in range(max(1, repeat))])
+    return {
+        "records": CALIBRATION_LINES,
+        "wall_seconds": round(wall_seconds, 4),
+        "records_per_second": round(CALIBRATION_LINES / wall_seconds, 1),
+        "peak_rss_mb": 0.0
+    }
+
+
+def get_host_speed_ratio(result_dict, baseline_dict):
+    """
+    Gets the speed of this host relative to the host of the baseline from the calibration runs at the
+    start, 1 if the baseline has no calibration result
+    :param result_dict:
+    :param baseline_dict:
+    :return:
+    """
+    baseline = baseline_dict.get(CALIBRATION_KEY)
+    if baseline is None or CALIBRATION_KEY not in result_dict:
+        print("No calibration in the baseline, comparing the throughput as measured")
+        return 1.0
+    return result_dict[CALIBRATION_KEY]["records_per_second"] / baseline["records_per_second"]
+
+
+def generate_inputs(scale_directory, scale_settings, seed):
+    """
+    Generates the synthetic inputs of a scale in a separate process, so the memory used by the generators
+    is not inherited by the benchmarked processes
+    :param scale_directory:
+    :param scale_settings: Entry of SCALES
+    :param seed:
+    :return: Dictionary of input paths and record counts
+    """
+    exit_status = subprocess.call([
+        sys.executable, BENCHMARK_DIR + "/synthetic_data.py", "-o", scale_directory,
+        "--samples", str(scale_settings["samples"]),
+        "--records-per-sample", str(scale_settings["records_per_sample"]),
+        "--summary-files", str(scale_settings["summary_files"]),
+        "--seed", str(seed)
+    ])
+    if exit_status != 0:
+        sys.exit("Failed to generate the inputs in " + scale_directory)
+    with open(scale_directory + "/inputs.json", "r") as manifest_file:
+        return json.load(manifest_file)
+
+
+def get_benchmark_command(benchmark_name, input_dict, output_directory):
+    """
+    Returns the arguments of the script run by the benchmark and the number of records it processes
+    :param benchmark_name:
+    :param input_dict: Dictionary from generate_inputs
+    :param output_directory:
+    :return: (script name, argument list, record count)
+    """
+    if benchmark_name == "parse_vcfs":
+        return "parse_vcfs.py", ["-i", input_dict["vcf_directory"], "-o", output_directory], input_dict["vcf_records"]
+    elif benchmark_name == "parse_vcfs_positions":
+        return ("parse_vcfs.py", ["-i", input_dict["vcf_directory"], "-o", output_directory, "--positions"],
+                input_dict["vcf_records"])
+    elif benchmark_name == "make_bed_from_vcf":
+        return ("make_bed_from_vcf.py", ["-i"] + input_dict["vcf_paths"] + ["-o", output_directory, "--sorted-merged"],
+                input_dict["vcf_records"])
+    elif benchmark_name == "analyze_false_positive_positions":
+        return ("analyze_false_positive_positions.py", ["-i", input_dict["parsed_vcf_results"], "-o", output_directory],
+                input_dict["vcf_records"])
+    elif benchmark_name == "parse_ngswb_results":
+        return ("parse_ngswb_results.py",
+                ["-i", input_dict["vcf_directory"], "-f", input_dict["ngswb_path"], "-o", output_directory],
+                input_dict["vcf_records"] + input_dict["ngswb_rows"])
+    elif benchmark_name == "parse_ngswb_results_per_sample":
+        return ("parse_ngswb_results.py",
+                ["-i", input_dict["vcf_directory"], "-f", input_dict["ngswb_path"], "-o", output_directory,
+                 "--per-sample", "--keep-order"],
+                input_dict["vcf_records"] + input_dict["ngswb_rows"])
+    elif benchmark_name == "parse_accuracy_results":
+        return ("parse_accuracy_results.py",
+                ["-i", input_dict["mgc_directory"], "-f", input_dict["accuracy_path"], "-o", output_directory],
+                input_dict["accuracy_rows"] * 2)
+    else:
+        return ("aggregate_results.py", ["-i", input_dict["summary_directory"], "-o", output_directory],
+                input_dict["summary_files"])
+
+
+def run_benchmark(benchmark_name, input_dict, scale_directory, repeat):
+    """
+    Runs the script of the benchmark repeat times, with a calibration run before each, so the speed
+    of the host is measured at the same time as the benchmark
+    :param benchmark_name:
+    :param input_dict: Dictionary from generate_inputs
+    :param scale_directory:
+    :param repeat:
+    :return: Dictionary of the records, fastest wall time of the work and of the process, records per second
+    of the work, largest peak RSS and the fastest calibration run between the runs
+    """
+    output_directory = scale_directory + "/" + benchmark_name
+    os.makedirs(output_directory, exist_ok=True)
+    if benchmark_name == "analyze_false_positive_positions":
+        input_dict["parsed_vcf_results"] = get_parsed_vcf_results(input_dict, scale_directory)
+    script_name, argument_list, record_count = get_benchmark_command(benchmark_name, input_dict, output_directory)
+    wall_seconds_list = []
+    process_seconds_list = []
+    peak_rss_list = []
+    calibration_list = []
+    for _ in range(max(1, repeat)):
+        calibration_list.append(run_calibration(1)["records_per_second"])
+        wall_seconds, process_seconds, peak_rss_kb = run_script(script_name, argument_list, output_directory)
+        wall_seconds_list.append(wall_seconds)
+        process_seconds_list.append(process_seconds)
+        peak_rss_list.append(peak_rss_kb)
+    wall_seconds = min(wall_seconds_list)
+    return {
+        "records": record_count,
+        "wall_seconds": round(wall_seconds, 4),
+        "process_seconds": round(min(process_seconds_list), 4),
+        "records_per_second": round(record_count / wall_seconds, 1),
+        "peak_rss_mb": round(max(peak_rss_list) / 1024, 1),
+        "calibration_records_per_second": max(calibration_list)
+    }
+
+
+def get_parsed_vcf_results(input_dict, scale_directory):
+    """
+    Returns the parse_vcfs.py result file of the scale, running parse_vcfs.py if it was not benchmarked
+    :param input_dict:
+    :param scale_directory:
+    :return:
+    """
+    parse_vcfs_directory = scale_directory + "/parse_vcfs"
+    result_path = parse_vcfs_directory + "/parsed_vcf_results.csv"
+    if not os.path.isfile(result_path):
+        os.makedirs(parse_vcfs_directory, exist_ok=True)
+        script_name, argument_list, _ = get_benchmark_command("parse_vcfs", input_dict, parse_vcfs_directory)
+        run_script(script_name, argument_list, parse_vcfs_directory)
+    return result_path
+
+
+def run_script(script_name, argument_list, output_directory):
+    """
+    Runs a script in a child process and measures the peak RSS of that child only. The time is the
+    wall time of the run as written by the script with --metrics-out, which starts after the interpreter
+    started and the modules were imported, so the start up cost of the process does not count
+    :param script_name:
+    :param argument_list:
+    :param output_directory: Directory for the log and the metrics of the script
+    :return: (wall seconds of the work, wall seconds of the process, peak RSS in KB)
+    """
+    metrics_path = output_directory + "/benchmark_metrics.json"
+    if os.path.isfile(metrics_path):
+        os.remove(metrics_path)
+    log_file = open(output_directory + "/benchmark.log", "w")
+    start_time = time.perf_counter()
+    process = subprocess.Popen([sys.executable, PYTHON_SCRIPT_DIR + "/" + script_name] + argument_list +
+                               ["--metrics-out", metrics_path],
+                               stdout=log_file, stderr=subprocess.STDOUT)
+    # wait4 returns the resource usage of this child, unlike RUSAGE_CHILDREN which is the maximum of all children
+    _, exit_status, resource_usage = os.wait4(process.pid, 0)
+    process_seconds = time.perf_counter() - start_time
+    process.returncode = exit_status
+    log_file.close()
+    if exit_status != 0:
+        sys.exit(script_name + " failed, see " + output_directory + "/benchmark.log")
+    with open(metrics_path, "r") as metrics_file:
+        wall_seconds = json.loads(metrics_file.readlines()[-1])["wall_seconds"]
+    peak_rss_kb = resource_usage.ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        peak_rss_kb = peak_rss_kb / 1024
+    return wall_seconds, process_seconds, peak_rss_kb
+
+
+def format_result(benchmark_key, result):
+    return (benchmark_key.ljust(45) + str(result["records"]).rjust(10) + " records " +
+            ("%.1f" % result["records_per_second"]).rjust(12) + " records/sec " +
+            ("%.1f" % result["peak_rss_mb"]).rjust(8) + " MB peak RSS")
+
+
+def compare_to_baseline(result_dict, baseline_dict, threshold):
+    """
+    Compares the results with the baseline. The baseline throughput is scaled by the speed ratio of
+    this host to the baseline host, from the calibration runs made between the runs of the benchmark
+    when both have them, as the speed of a shared host changes during a run. The throughput of the
+    benchmarks shorter than MIN_COMPARED_SECONDS is not compared. The peak memory does not depend on
+    the host and is compared as is
+    :param result_dict:
+    :param baseline_dict:
+    :param threshold: Allowed fraction of throughput loss and peak memory growth
+    :return: List of regression descriptions
+    """
+    speed_ratio = get_host_speed_ratio(result_dict, baseline_dict)
+    print("Host speed relative to the baseline: " + str(round(speed_ratio, 3)))
+    regression_list = []
+    for benchmark_key, result in sorted(result_dict.items()):
+        if benchmark_key == CALIBRATION_KEY:
+            continue
+        baseline = baseline_dict.get(benchmark_key)
+        if baseline is None:
+            print("No baseline for " + benchmark_key)
+            continue
+        if baseline["wall_seconds"] < MIN_COMPARED_SECONDS:
+            print("Throughput of " + benchmark_key + " not compared, the baseline run took less than " +
+                  str(MIN_COMPARED_SECONDS) + " seconds")
+        benchmark_speed_ratio = speed_ratio
+        if "calibration_records_per_second" in result and "calibration_records_per_second" in baseline:
+            benchmark_speed_ratio = (result["calibration_records_per_second"] /
+                                     baseline["calibration_records_per_second"])
+        expected_records_per_second = round(baseline["records_per_second"] * benchmark_speed_ratio, 1)
+        if baseline["wall_seconds"] >= MIN_COMPARED_SECONDS and \
+                result["records_per_second"] < expected_records_per_second * (1 - threshold):
+            regression_list.append(benchmark_key + " throughput " + str(result["records_per_second"]) +
+                                   " records/sec, baseline " + str(expected_records_per_second) +
+                                   " records/sec on this host")
+        if result["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + threshold):
+            regression_list.append(benchmark_key + " peak RSS " + str(result["peak_rss_mb"]) + " MB, baseline " +
+                                   str(baseline["peak_rss_mb"]) + " MB")
+    return regression_list
+
+
+def read_baseline(baseline_path):
+    if not os.path.isfile(baseline_path):
+        return {}
+    with open(baseline_path, "r") as baseline_file:
+        return json.load(baseline_file)
+
+
+def write_json(file_path, content):
+    with open(file_path, "w") as json_file:
+        json.dump(content, json_file, indent=2, sort_keys=True)
+        json_file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,311 @@
+#!/usr/bin/python3
+
+"""
+Seeded generators of synthetic inputs for the benchmarks: VCFs, hap.py *.summary.csv files,
+NGSWB CSVs and CLC accuracy result files with their MGC reported variant VCFs
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import argparse
+import json
+import os
+import random
+
+
+CHROMOSOMES = ["chr" + str(number) for number in range(1, 23)] + ["chrX", "chrY"]
+BASES = "ACGT"
+# FORMAT layouts seen in the MGC and CLC VCFs
+FORMAT_LAYOUTS = ["GT:AD:AF:DP", "GT:AD:DP", "GT:DP:AF:AD:F1R2:F2R1", "GT:AD:AF:DP:SB"]
+VCF_HEADER = (
+    "##fileformat=VCFv4.2\n"
+    "##FILTER=<ID=PASS,Description=\"All filters passed\">\n"
+    "##FILTER=<ID=strand_artifact,Description=\"Strand artifact\">\n"
+    "##INFO=<ID=DP,Number=1,Type=Integer,Description=\"Depth\">\n"
+    "##INFO=<ID=CAVA_GENE,Number=.,Type=String,Description=\"Gene\">\n"
+    "##INFO=<ID=CAVA_CSN,Number=.,Type=String,Description=\"CSN\">\n"
+    "##FORMAT=<ID=GT,Number=1,Type=String,Description=\"Genotype\">\n"
+    "##FORMAT=<ID=AD,Number=R,Type=Integer,Description=\"Allele depth\">\n"
+    "##FORMAT=<ID=AF,Number=A,Type=Float,Description=\"Allele fraction\">\n"
+    "##FORMAT=<ID=DP,Number=1,Type=Integer,Description=\"Depth\">\n"
+)
+SUMMARY_HEADER = ("Type,Filter,TRUTH.TOTAL,TRUTH.TP,TRUTH.FN,QUERY.TOTAL,QUERY.FP,QUERY.UNK,FP.gt,METRIC.Recall,"
+                  "METRIC.Precision,METRIC.Frac_NA,METRIC.F1_Score,TRUTH.TOTAL.TiTv_ratio,QUERY.TOTAL.TiTv_ratio,"
+                  "TRUTH.TOTAL.het_hom_ratio,QUERY.TOTAL.het_hom_ratio\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-o", dest="output_directory", required=True,
+        help="Full path to the directory to save the synthetic inputs"
+    )
+    parser.add_argument(
+        "--samples", dest="sample_count", type=int, default=4,
+        help="Number of samples, default is 4"
+    )
+    parser.add_argument(
+        "--records-per-sample", dest="records_per_sample", type=int, default=2500,
+        help="Number of VCF records per sample, default is 2500"
+    )
+    parser.add_argument(
+        "--summary-files", dest="summary_file_count", type=int, default=100,
+        help="Number of hap.py summary.csv files, default is 100"
+    )
+    parser.add_argument(
+        "--multi-allelic-rate", dest="multi_allelic_rate", type=float, default=0.05,
+        help="Fraction of the VCF records with two alt alleles, default is 0.05"
+    )
+    parser.add_argument(
+        "--format-layouts", dest="format_layouts", nargs="+", default=FORMAT_LAYOUTS,
+        help="FORMAT strings of the VCF records, each must contain AD, default is " + " ".join(FORMAT_LAYOUTS)
+    )
+    parser.add_argument(
+        "--seed", dest="seed", type=int, default=12,
+        help="Seed of the generators, default is 12"
+    )
+
+    args = parser.parse_args()
+
+    output_directory = os.path.abspath(args.output_directory)
+    input_dict = generate_inputs(output_directory, args.sample_count, args.records_per_sample,
+                                 args.summary_file_count, args.seed, args.multi_allelic_rate, args.format_layouts)
+    manifest_file = open(output_directory + "/inputs.json", "w")
+    json.dump(input_dict, manifest_file, indent=2, sort_keys=True)
+    manifest_file.close()
+
+
+def generate_inputs(output_directory, sample_count, records_per_sample, summary_file_count, seed,
+                    multi_allelic_rate=0.05, format_layouts=FORMAT_LAYOUTS):
+    """
+    Generates every synthetic input, the same seed always generates the same files
+    :param output_directory:
+    :param sample_count:
+    :param records_per_sample:
+    :param summary_file_count:
+    :param seed:
+    :param multi_allelic_rate:
+    :param format_layouts:
+    :return: Dictionary of the input paths and record counts
+    """
+    vcf_directory = output_directory + "/vcfs"
+    mgc_directory = output_directory + "/mgc"
+    summary_directory = output_directory + "/summaries"
+    ngswb_path = output_directory + "/ngswb_results.csv"
+    accuracy_path = output_directory + "/accuracy_results.txt"
+    sample_record_dict = generate_vcf_directory(vcf_directory, sample_count, records_per_sample, seed,
+                                                multi_allelic_rate, format_layouts)
+    ngswb_rows = generate_ngswb_csv(ngswb_path, sample_record_dict, max(1, records_per_sample // 10), seed)
+    accuracy_rows = generate_accuracy_inputs(accuracy_path, mgc_directory, sample_record_dict,
+                                             max(1, records_per_sample // 50), seed)
+    generate_summary_directory(summary_directory, summary_file_count, seed)
+    return {
+        "vcf_directory": vcf_directory,
+        "vcf_paths": [vcf_directory + "/" + file for file in sorted(os.listdir(vcf_directory))],
+        "vcf_records": records_per_sample * sample_count,
+        "mgc_directory": mgc_directory,
+        "summary_directory": summary_directory,
+        "summary_files": summary_file_count,
+        "ngswb_path": ngswb_path,
+        "ngswb_rows": ngswb_rows,
+        "accuracy_path": accuracy_path,
+        "accuracy_rows": accuracy_rows
+    }
+
+
+def make_alt(ref, random_generator):
+    """
+    Makes an alt allele that differs from ref: a SNV most of the time, otherwise an insertion or deletion
+    :param ref:
+    :param random_generator:
+    :return:
+    """
+    variant_class = random_generator.random()
+    if variant_class < 0.8:
+        return random_generator.choice([base for base in BASES if base != ref[0]])
+    elif variant_class < 0.9 or len(ref) == 1:
+        return ref[0] + "".join([random_generator.choice(BASES) for _ in range(random_generator.randint(1, 5))])
+    else:
+        return ref[0]
+
+
+def generate_vcf_records(record_count, random_generator, multi_allelic_rate=0.05, format_layouts=FORMAT_LAYOUTS):
+    """
+    Generates sorted VCF data lines spread over CHROMOSOMES
+    :param record_count:
+    :param random_generator: random.Random instance
+    :param multi_allelic_rate: Fraction of the records with two alt alleles
+    :param format_layouts: FORMAT strings to pick from per record
+    :return: List of VCF data lines without the newline
+    """
+    positions_per_chromosome = max(1, record_count // len(CHROMOSOMES) + 1)
+    record_list = []
+    for chromosome in CHROMOSOMES:
+        position = random_generator.randint(10000, 100000)
+        for _ in range(positions_per_chromosome):
+            if len(record_list) == record_count:
+                break
+            position += random_generator.randint(1, 2000)
+            ref = random_generator.choice(BASES)
+            if random_generator.random() < 0.1:
+                ref += "".join([random_generator.choice(BASES) for _ in range(random_generator.randint(1, 5))])
+            alt_list = [make_alt(ref, random_generator)]
+            if random_generator.random() < multi_allelic_rate:
+                alt_list.append(random_generator.choice([base for base in BASES if base not in (ref[0], alt_list[0])]))
+            ref_depth = random_generator.randint(5, 500)
+            alt_depth_list = [random_generator.randint(1, 200) for _ in alt_list]
+            total_depth = ref_depth + sum(alt_depth_list)
+            format_values = {
+                "GT": "0/1" if len(alt_list) == 1 else "1/2",
+                "AD": ",".join([str(depth) for depth in [ref_depth] + alt_depth_list]),
+                "AF": ",".join([str(round(depth / total_depth, 3)) for depth in alt_depth_list]),
+                "DP": str(total_depth),
+                "F1R2": "3,4",
+                "F2R1": "5,6",
+                "SB": "1,2,3,4"
+            }
+            format_layout = random_generator.choice(format_layouts)
+            filter_value = "strand_artifact" if random_generator.random() < 0.1 else "PASS"
+            gene = "GENE" + str(random_generator.randint(1, 500))
+            info = ("DP=" + str(total_depth) + ";CAVA_GENE=" + gene + ";CAVA_CSN=c." + str(position) + ref + ">" +
+                    alt_list[0] + "_p.%3D")
+            record_list.append("\t".join([
+                chromosome, str(position), ".", ref, ",".join(alt_list), "50", filter_value, info, format_layout,
+                ":".join([format_values[key] for key in format_layout.split(":")])
+            ]))
+    return record_list
+
+
+def write_vcf(vcf_path, record_list, sample_name="TUMOR"):
+    """
+    Writes the header and the records to a VCF file
+    :param vcf_path:
+    :param record_list:
+    :param sample_name:
+    :return:
+    """
+    vcf_file = open(vcf_path, "w")
+    vcf_file.write(VCF_HEADER)
+    vcf_file.write("#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\t" + sample_name + "\n")
+    for record in record_list:
+        vcf_file.write(record + "\n")
+    vcf_file.close()
+
+
+def generate_vcf_directory(directory, sample_count, records_per_sample, seed, multi_allelic_rate=0.05,
+                           format_layouts=FORMAT_LAYOUTS):
+    """
+    Writes {sample}_CLC_MGC_false_positives.vcf files for sample_count samples
+    :param directory:
+    :param sample_count:
+    :param records_per_sample:
+    :param seed:
+    :param multi_allelic_rate:
+    :param format_layouts:
+    :return: Dictionary of sample name to its list of VCF data lines
+    """
+    random_generator = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    sample_record_dict = {}
+    for sample_number in range(sample_count):
+        sample_name = "SAMPLE" + str(sample_number).zfill(4)
+        record_list = generate_vcf_records(records_per_sample, random_generator, multi_allelic_rate,
+                                           format_layouts)
+        write_vcf(directory + "/" + sample_name + "_CLC_MGC_false_positives.vcf", record_list)
+        sample_record_dict[sample_name] = record_list
+    return sample_record_dict
+
+
+def generate_summary_directory(directory, sample_count, seed):
+    """
+    Writes a hap.py {sample}_CLC_MGC.summary.csv file per sample
+    :param directory:
+    :param sample_count:
+    :param seed:
+    :return:
+    """
+    random_generator = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for sample_number in range(sample_count):
+        summary_file = open(directory + "/SAMPLE" + str(sample_number).zfill(4) + "_CLC_MGC.summary.csv", "w")
+        summary_file.write(SUMMARY_HEADER)
+        for variant_type in ["INDEL", "SNP"]:
+            for quality_filter in ["ALL", "PASS"]:
+                true_positive = random_generator.randint(1, 5000)
+                false_negative = random_generator.randint(0, 500)
+                false_positive = random_generator.randint(0, 500)
+                recall = round(true_positive / (true_positive + false_negative), 6)
+                precision = round(true_positive / (true_positive + false_positive), 6)
+                summary_file.write(",".join([str(item) for item in [
+                    variant_type, quality_filter, true_positive + false_negative, true_positive, false_negative,
+                    true_positive + false_positive, false_positive, 0, 0, recall, precision, 0.0,
+                    round(2 * precision * recall / (precision + recall), 6), "", "", "", ""
+                ]]) + "\n")
+        summary_file.close()
+
+
+def generate_ngswb_csv(ngswb_path, sample_record_dict, rows_per_sample, seed, hit_rate=0.8):
+    """
+    Writes an NGSWB result CSV with rows picked from the sample VCF records, hit_rate of the rows
+    match a VCF record and the others are shifted by one base
+    :param ngswb_path:
+    :param sample_record_dict: Dictionary of sample name to its list of VCF data lines
+    :param rows_per_sample:
+    :param seed:
+    :param hit_rate:
+    :return: Number of rows written
+    """
+    random_generator = random.Random(seed)
+    ngswb_file = open(ngswb_path, "w")
+    ngswb_file.write("Sample,Gene,Genomic,cDNA,Classification\n")
+    row_count = 0
+    for sample_name, record_list in sample_record_dict.items():
+        for record in random_generator.sample(record_list, min(rows_per_sample, len(record_list))):
+            record_item = record.split("\t")
+            position = int(record_item[1])
+            if random_generator.random() >= hit_rate:
+                position += 1
+            ngswb_file.write(",".join([
+                sample_name, "GENE", record_item[0] + ":g." + str(position) + record_item[3] + ">" +
+                record_item[4].replace(",", ":"), "c.1A>G", "VUS"
+            ]) + "\n")
+            row_count += 1
+    ngswb_file.close()
+    return row_count
+
+
+def generate_accuracy_inputs(accuracy_path, mgc_directory, sample_record_dict, variants_per_sample, seed):
+    """
+    Writes a CLC accuracy result TSV and a {sample}_mgc_reported_variants.vcf per sample, without
+    header lines in the VCFs, the same as the files used by parse_accuracy_results.py
+    :param accuracy_path:
+    :param mgc_directory:
+    :param sample_record_dict: Dictionary of sample name to its list of VCF data lines
+    :param variants_per_sample:
+    :param seed:
+    :return: Number of accuracy rows written
+    """
+    random_generator = random.Random(seed)
+    os.makedirs(mgc_directory, exist_ok=True)
+    accuracy_file = open(accuracy_path, "w")
+    accuracy_file.write("Sample\tGene\tcDNA\tPosition Coverage\tVariant Coverage\tVF\n")
+    row_count = 0
+    for sample_name, record_list in sample_record_dict.items():
+        mgc_vcf = open(mgc_directory + "/" + sample_name + "_mgc_reported_variants.vcf", "w")
+        biallelic_list = [record for record in record_list if "," not in record.split("\t")[4]]
+        for record in random_generator.sample(biallelic_list, min(variants_per_sample, len(biallelic_list))):
+            mgc_vcf.write(record + "\n")
+            record_item = record.split("\t")
+            cdna_variant = record_item[7].split("CAVA_CSN=")[1].split("_p.")[0]
+            gene = record_item[7].split("CAVA_GENE=")[1].split(";")[0]
+            accuracy_file.write("\t".join([sample_name, gene, cdna_variant + ", NM_000000.1", "100", "20",
+                                           "0.2"]) + "\n")
+            row_count += 1
+        mgc_vcf.close()
+    accuracy_file.close()
+    return row_count
+
+
+if __name__ == "__main__":
+    main()
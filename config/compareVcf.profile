@@ -14,4 +14,10 @@ BEDTOOLS="/usr/local/biotools/bedtools/2.20.1/bin/bedtools"
 SAMTOOLS="/usr/local/biotools/hap/0.3.10/bin/samtools"
 DEPTHOFCOVERAGE="/dlmp/sandbox/cgslIS/Jag/gatk-4.1.8.1/gatk DepthOfCoverage"
 QDIR="/usr/local/biotools/oge/ge2011.11/bin/linux-x64"
-QSUB="${QDIR}/qsub"
\ No newline at end of file
+QSUB="${QDIR}/qsub"
+# Site settings of the grid jobs of job_executor.py: the queue, the address mailed when a job is
+# aborted (no mail if empty) and the parallel environment of the jobs with more than one CPU
+QSUB_QUEUE="sandbox.q"
+QSUB_EMAIL=""
+QSUB_PARALLEL_ENVIRONMENT=""
+HAPPY_CACHE_DIR="/dlmp/sandbox/cgslIS/Yuta/happy_cache"
\ No newline at end of file
@@ -23,10 +23,12 @@ Script to analyze the false positive from MGC against the BAM file
 
 Parameters:
 	-i [required] Sample directory - full path to the sample directory
+	-n [optional] native - count the ref and alt reads at the false positive sites with
+	   check_false_positives.py instead of samtools mpileup and bcftools call
 	-h [optional] debug - option to print this menu option
 
 Usage:
-$0 -i {inputDirectory}
+$0 -i {inputDirectory} [-n]
 DOCS
 
 #Show help when no parameters are provided
@@ -53,17 +55,15 @@ SAMPLE=""
 CMD=""
 FALSE_POSITIVE_VCF=""
 PYTHON3=""
-FALSE_POSITIVE_BED=""
-SORTED_BED=""
 SORTED_MERGED_BED=""
-BEDTOOLS=""
-SORT=""
 SAMTOOLS=""
 BCFTOOLS=""
 REF_GENOME=""
 MGC_BAM=""
 FP_CHECK_VCF=""
 REAL_POSITIVE_VCF=""
+FP_BAM_COUNTS=""
+NATIVE="false"
 
 ##################################################
 #Source Pipeline Profile
@@ -104,12 +104,13 @@ set -o nounset
 #BEGIN PROCESSING
 ##################################################
 
-while getopts "hi:" OPTION
+while getopts "hi:n" OPTION
 
 do
   case $OPTION in
     h) echo "${DOCS}" ; rm ${LOG_FILE} ; exit ;;
     i) SAMPLEDIR="${OPTARG}" ;;
+    n) NATIVE="true" ;;
     ?) echo "${DOCS}" ; rm ${LOG_FILE} ; exit ;;
   esac
 done
@@ -136,29 +137,25 @@ CMD="source ${PYTHON3}"
 logInfo "Executing command: ${CMD}"
 eval ${CMD}
 
-# Run make_bed_from_vcf.py
-logInfo "Running make_bed_from_vcf.py to create BED file from false positive vcf"
-CMD="python ${PYTHON_SCRIPT_DIR}/make_bed_from_vcf.py -i ${FALSE_POSITIVE_VCF} -o ${SAMPLEDIR}"
-logInfo "Executing command: ${CMD}"
-eval ${CMD}
-
-# Sort and merge the output BED
-FALSE_POSITIVE_BED="${SAMPLEDIR}/${SAMPLE}_false_positive.bed"
-SORTED_BED="${SAMPLEDIR}/${SAMPLE}_false_positive_sorted.bed"
+# Run make_bed_from_vcf.py to make the sorted and merged BED file
 SORTED_MERGED_BED="${SAMPLEDIR}/${SAMPLE}_false_positive_sorted_merged.bed"
-logInfo "Sorting false_positived.bed"
-CMD="${SORT} -k1,1 -k2,2n ${FALSE_POSITIVE_BED} > ${SORTED_BED}"
-logInfo "Executing command: ${CMD}"
-eval ${CMD}
-logInfo "Merge overlapping region in BED file"
-CMD="${BEDTOOLS} merge -i ${SORTED_BED} > ${SORTED_MERGED_BED}"
-logInfo "Executing command: ${CMD}"
-eval ${CMD}
-logInfo "Removing the original BED file and sorted BED file"
-CMD="rm ${FALSE_POSITIVE_BED} ${SORTED_BED}"
+logInfo "Running make_bed_from_vcf.py to create sorted and merged BED file from false positive vcf"
+CMD="python ${PYTHON_SCRIPT_DIR}/make_bed_from_vcf.py -i ${FALSE_POSITIVE_VCF} -o ${SAMPLEDIR} --sorted-merged -n ${SAMPLE}"
 logInfo "Executing command: ${CMD}"
 eval ${CMD}
 
+if [[ "${NATIVE}" == "true" ]]; then
+    # Count the reads with the ref and alt alleles at each false positive site through the BAM index
+    FP_BAM_COUNTS="${SAMPLEDIR}/${SAMPLE}_fp_bam_counts.csv"
+    logInfo "Running check_false_positives.py to count the reads at the false positive sites"
+    CMD="python ${PYTHON_SCRIPT_DIR}/check_false_positives.py -i ${SAMPLEDIR} -o ${FP_BAM_COUNTS}"
+    logInfo "Executing command: ${CMD}"
+    eval ${CMD}
+
+    logInfo "Script is done running"
+    exit 0
+fi
+
 # Run samtools mpileup and bcftools call to get the VCF out of input BAM
 # using the false positive BED file
 logInfo "Running samtools mpileup and bcftools call"
@@ -17,16 +17,22 @@ echo "${MANIFEST}"
 
 read -r -d '' DOCS <<DOCS
 
-Script to compare the CLC and MGC TNhaplotyper2 VCFs using hap.py
+Script to compare the CLC and MGC TNhaplotyper2 VCFs using hap.py. hap.py is run through
+happy_cache.py, so a comparison already run with the same VCFs, reference and arguments is copied
+from HAPPY_CACHE_DIR of the profile. The script can be rerun on the same sample directory
 
 <DEFINE PARAMETERS>
 
 Parameters:
 	-i [required] Sample directory - full path to the sample directory
+	-n [optional] native - compare with compare_vcfs.py instead of hap.py, a fast pre-check that
+	   does not left align indels against the reference, use hap.py for the final results
+	-s [optional] shards - run hap.py on this many shards of the VCFs at the same time with
+	   sharded_happy.py, default is 1
 	-h [optional] debug - option to print this menu option
 
 Usage:
-$0 -i {inputDirectory}
+$0 -i {inputDirectory} [-n] [-s {shards}]
 DOCS
 
 #Show help when no parameters are provided
@@ -44,14 +50,13 @@ SCRIPT_FILE="${SCRIPT_DIR}/$(basename "${BASH_SOURCE[0]}")"
 SCRIPT_NAME="$(basename ${0})"
 SCRIPT_ROOT="$(cd "${SCRIPT_DIR}/../../" && pwd)"
 PROFILE="${SCRIPT_ROOT}/config/compareVcf.profile"
+PYTHON_SCRIPT_DIR="${SCRIPT_ROOT}/src/python"
 SAMPLEDIR=""
 COMMON_FUNC=""
 LOG_DIR=""
 LOG_FILE=""
 SAMPLE=""
 CLC_VCF=""
-BGZIP=""
-TABIX=""
 CMD=""
 MGC_VCF=""
 BCFTOOLS=""
@@ -65,6 +70,10 @@ FP_VCF=""
 FN_VCF=""
 HAPPY_VCF=""
 ORIGINAL_CLC_VCF=""
+PYTHON3=""
+HAPPY_CACHE_DIR=""
+NATIVE="false"
+SHARDS="1"
 
 ##################################################
 #Source Pipeline Profile
@@ -105,12 +114,14 @@ set -o nounset
 #BEGIN PROCESSING
 ##################################################
 
-while getopts "hi:" OPTION
+while getopts "hi:ns:" OPTION
 
 do
   case $OPTION in
     h) echo "${DOCS}" ; rm ${LOG_FILE} ; exit ;;
     i) SAMPLEDIR="${OPTARG}" ;;
+    n) NATIVE="true" ;;
+    s) SHARDS="${OPTARG}" ;;
     ?) echo "${DOCS}" ; rm ${LOG_FILE} ; exit ;;
   esac
 done
@@ -133,39 +144,50 @@ MGC_VCF="${SAMPLEDIR}/mgc/reports/${SAMPLE}.vcf"
 validateFile "${ORIGINAL_CLC_VCF}"
 validateFile "${MGC_VCF}"
 
-# Source python 2.7.10
-logInfo "Sourcing python 2.7.10"
-CMD="source ${PYTHON2710}"
+# Source python 3.6.3
+logInfo "Sourcing python 3.6.3"
+CMD="source ${PYTHON3}"
 logInfo "Executing command: ${CMD}"
 eval ${CMD}
 
-# bgzip and tabix the original CLC VCF
-logInfo "bgzipping the original CLC VCF: ${ORIGINAL_CLC_VCF}"
-CMD="${BGZIP} ${ORIGINAL_CLC_VCF}"
-logInfo "Executing command: ${CMD}"
-eval ${CMD}
+# bgzip and tabix the original CLC VCF in one pass, keeping the original so the script can be rerun
 CLC_VCF="${SAMPLEDIR}/${SAMPLE}_final.vcf.gz"
-logInfo "tabix-ing the bgzipped CLC VCF: ${CLC_VCF}"
-CMD="${TABIX} -p vcf ${CLC_VCF}"
+logInfo "bgzipping and tabix-ing the original CLC VCF: ${ORIGINAL_CLC_VCF}"
+CMD="python ${PYTHON_SCRIPT_DIR}/prep_vcf.py -i ${ORIGINAL_CLC_VCF} -o ${CLC_VCF}"
 logInfo "Executing command: ${CMD}"
 eval ${CMD}
 
-# Filter the "strand_artifact" variants from MGC VCF
+# Filter the "strand_artifact" variants from MGC VCF, bgzipped and tabix-ed in the same pass
 logInfo "Filtering strand_artifact variants from MGC VCF: ${MGC_VCF}"
-FILTERED_MGC_VCF="${SAMPLEDIR}/mgc/reports/${SAMPLE}_filtered.vcf"
-CMD="${BCFTOOLS} view -e 'FILTER=\"strand_artifact\"' ${MGC_VCF} > ${FILTERED_MGC_VCF}"
+FILTERED_MGC_VCF="${SAMPLEDIR}/mgc/reports/${SAMPLE}_filtered.vcf.gz"
+CMD="python ${PYTHON_SCRIPT_DIR}/prep_vcf.py -i ${MGC_VCF} -o ${FILTERED_MGC_VCF} -e strand_artifact"
 logInfo "Executing command: ${CMD}"
 eval ${CMD}
 
-# Run hap.py
 HAPPY_DIR="${SAMPLEDIR}/hap.py_out"
 logInfo "Creating output directory for hap.py: ${HAPPY_DIR}"
-CMD="mkdir ${HAPPY_DIR}"
+CMD="mkdir -p ${HAPPY_DIR}"
 logInfo "Executing command: ${CMD}"
 eval ${CMD}
+
+if [[ "${NATIVE}" == "true" ]]; then
+    # Writes the summary.csv and the false positive and false negative VCFs with the same names as hap.py
+    logInfo "Running compare_vcfs.py to compare CLC and filtered MGC VCF"
+    CMD="python ${PYTHON_SCRIPT_DIR}/compare_vcfs.py -t ${CLC_VCF} -q ${FILTERED_MGC_VCF} \
+-o ${HAPPY_DIR}/${SAMPLE}_CLC_MGC"
+    logInfo "Executing command: ${CMD}"
+    eval ${CMD}
+
+    logInfo "Script is done running"
+    exit 0
+fi
+
+# Run hap.py through the cache, happy_cache.py sources python 2.7.10 before hap.py
+# The profile values are quoted, an empty HAPPY_CACHE_DIR runs hap.py without the cache
 logInfo "Running hap.py to compare CLC and filtered MGC VCF"
-HAPPY_ARGS="-o ${HAPPY_DIR}/${SAMPLE}_CLC_MGC -r ${REF_GENOME} --engine=scmp-somatic"
-CMD="${HAPPY} ${CLC_VCF} ${FILTERED_MGC_VCF} ${HAPPY_ARGS}"
+HAPPY_ARGS="-o ${HAPPY_DIR}/${SAMPLE}_CLC_MGC -r \"${REF_GENOME}\" --happy \"${HAPPY}\" --python2 \"${PYTHON2710}\" \
+--cache-dir \"${HAPPY_CACHE_DIR}\" --happy-args=--engine=scmp-somatic --shards ${SHARDS}"
+CMD="python ${PYTHON_SCRIPT_DIR}/happy_cache.py -t ${CLC_VCF} -q ${FILTERED_MGC_VCF} ${HAPPY_ARGS}"
 logInfo "Executing command: ${CMD}"
 eval ${CMD}
 
@@ -1,4 +1,5 @@
 #!/bin/bash
 
 # Entry script for qsubbing depthOfCoverage.sh
-/dlmp/sandbox/cgslIS/Yuta/vcf_compare/src/bash/depthOfCoverage.sh $@
\ No newline at end of file
+# VCF_COMPARE_ROOT is exported by runDepthOfCoverageMgc.sh, otherwise the repository of this script is used
+"${VCF_COMPARE_ROOT:-$(cd "$(dirname "${BASH_SOURCE[0]}")/../.." && pwd)}/src/bash/depthOfCoverage.sh" "$@"
\ No newline at end of file
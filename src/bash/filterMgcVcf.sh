@@ -44,6 +44,7 @@ SCRIPT_FILE="${SCRIPT_DIR}/$(basename "${BASH_SOURCE[0]}")"
 SCRIPT_NAME="$(basename ${0})"
 SCRIPT_ROOT="$(cd "${SCRIPT_DIR}/../../" && pwd)"
 PROFILE="${SCRIPT_ROOT}/config/compareVcf.profile"
+PYTHON_SCRIPT_DIR="${SCRIPT_ROOT}/src/python"
 SAMPLEDIR=""
 COMMON_FUNC=""
 LOG_DIR=""
@@ -51,16 +52,11 @@ LOG_FILE=""
 SAMPLE=""
 HAPPY_FP_VCF=""
 HAPPY_FN_VCF=""
-GREP=""
 CMD=""
 HAPPY_DIR=""
-FP_COORDINATES=""
-FN_COORDINATES=""
 AF_FILTERED_MGC_VCF=""
-FP_FILTERED_MGC_VCF=""
-FN_FILTERED_CLC_VCF=""
 CLC_VCF=""
-ZGREP=""
+PYTHON3=""
 
 ##################################################
 #Source Pipeline Profile
@@ -127,7 +123,11 @@ logInfo "Sample Name: ${SAMPLE}"
 HAPPY_DIR="${SAMPLEDIR}/hap.py_out"
 HAPPY_FP_VCF="${HAPPY_DIR}/${SAMPLE}_CLC_MGC_false_positives.vcf"
 HAPPY_FN_VCF="${HAPPY_DIR}/${SAMPLE}_CLC_MGC_false_negatives.vcf"
-AF_FILTERED_MGC_VCF="${SAMPLEDIR}/mgc/reports/${SAMPLE}_filtered.vcf"
+AF_FILTERED_MGC_VCF="${SAMPLEDIR}/mgc/reports/${SAMPLE}_filtered.vcf.gz"
+# Sample directories processed before prep_vcf.py only have the plain filtered MGC VCF
+if [[ ! -f "${AF_FILTERED_MGC_VCF}" && -f "${SAMPLEDIR}/mgc/reports/${SAMPLE}_filtered.vcf" ]]; then
+    AF_FILTERED_MGC_VCF="${SAMPLEDIR}/mgc/reports/${SAMPLE}_filtered.vcf"
+fi
 CLC_VCF="${SAMPLEDIR}/${SAMPLE}_final.vcf.gz"
 validateFile "${HAPPY_FP_VCF}"
 validateFile "${HAPPY_FN_VCF}"
@@ -135,33 +135,17 @@ validateFile "${AF_FILTERED_MGC_VCF}"
 validateFile "${CLC_VCF}"
 
 
-# Grep the coordinates from hap.py FP VCF
-FP_COORDINATES="${HAPPY_DIR}/${SAMPLE}_CLC_MGC_false_positives_coordinates"
-CMD="${GREP} -v \"^#\" ${HAPPY_FP_VCF} | cut -f2 > ${FP_COORDINATES}"
-logInfo "Executing command: ${CMD}"
-eval ${CMD}
-
-# Grep the coordinates from hap.py FN VCF
-FN_COORDINATES="${HAPPY_DIR}/${SAMPLE}_CLC_MGC_false_negatives_coordinates"
-CMD="${GREP} -v \"^#\" ${HAPPY_FN_VCF} | cut -f2 > ${FN_COORDINATES}"
+# Source python 3.6.3
+logInfo "Sourcing python 3.6.3"
+CMD="source ${PYTHON3}"
 logInfo "Executing command: ${CMD}"
 eval ${CMD}
 
-# Filter the MGC VCF to the false positives
-FP_FILTERED_MGC_VCF="${SAMPLEDIR}/${SAMPLE}_MGC_false_positives.vcf"
-CMD="${GREP} \"^#\" ${AF_FILTERED_MGC_VCF} > ${FP_FILTERED_MGC_VCF}"
-logInfo "Executing command: ${CMD}"
-eval ${CMD}
-CMD="${GREP} -f ${FP_COORDINATES} ${AF_FILTERED_MGC_VCF} >> ${FP_FILTERED_MGC_VCF}"
-logInfo "Executing command: ${CMD}"
-eval ${CMD}
-
-# Filter the MGC VCF to the false negatives
-FN_FILTERED_CLC_VCF="${SAMPLEDIR}/${SAMPLE}_CLC_false_negatives.vcf"
-CMD="${ZGREP} \"^#\" ${CLC_VCF} > ${FN_FILTERED_CLC_VCF}"
-logInfo "Executing command: ${CMD}"
-eval ${CMD}
-CMD="${ZGREP} -f ${FN_COORDINATES} ${CLC_VCF} >> ${FN_FILTERED_CLC_VCF}"
+# Filter the MGC VCF to the false positives and the CLC VCF to the false negatives
+# Creates ${SAMPLE}_MGC_false_positives.vcf and ${SAMPLE}_CLC_false_negatives.vcf in SAMPLEDIR
+logInfo "Running filter_false_sites.py to filter the MGC and CLC VCFs to the hap.py false sites"
+CMD="python ${PYTHON_SCRIPT_DIR}/filter_false_sites.py -p ${HAPPY_FP_VCF} -n ${HAPPY_FN_VCF} \
+-m ${AF_FILTERED_MGC_VCF} -c ${CLC_VCF} -s ${SAMPLE} -o ${SAMPLEDIR}"
 logInfo "Executing command: ${CMD}"
 eval ${CMD}
 
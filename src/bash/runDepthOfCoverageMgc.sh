@@ -24,10 +24,12 @@ Script to qsub and run depthOfCoverage on a sample directory analyzed by MGC
 Parameters:
 	-i [required] Sample directory - full path to the sample directory
 	-c [required] Coverage threshold - coverage threshold to use for the summary file
+	-n [optional] native - run target_coverage.py locally instead of submitting DepthOfCoverage to the grid
+	-e [optional] executor - run DepthOfCoverage with the local or grid executor of job_executor.py, default is grid
 	-h [optional] debug - option to print this menu option
 
 Usage:
-$0 -i {inputDirectory}
+$0 -i {inputDirectory} -c {coverageThreshold} [-n] [-e {local|grid}]
 DOCS
 
 #Show help when no parameters are provided
@@ -46,6 +48,7 @@ SCRIPT_NAME="$(basename ${0})"
 SCRIPT_ROOT="$(cd "${SCRIPT_DIR}/../../" && pwd)"
 PROFILE="${SCRIPT_ROOT}/config/compareVcf.profile"
 COVERAGE_SCRIPT="${SCRIPT_ROOT}/src/bash/depthOfCoverageEntry.sh"
+PYTHON_SCRIPT_DIR="${SCRIPT_ROOT}/src/python"
 SAMPLEDIR=""
 SAMPLE=""
 BAM=""
@@ -55,6 +58,9 @@ DEPTHOFCOVERAGE=""
 COVERAGE_THRESHOLD=""
 CMD=""
 QSUB=""
+PYTHON3=""
+NATIVE="false"
+EXECUTOR="grid"
 
 ##################################################
 #Source Pipeline Profile
@@ -95,13 +101,15 @@ set -o nounset
 #BEGIN PROCESSING
 ##################################################
 
-while getopts "hi:c:" OPTION
+while getopts "hi:c:ne:" OPTION
 
 do
   case $OPTION in
     h) echo "${DOCS}" ; rm ${LOG_FILE} ; exit ;;
     i) SAMPLEDIR="${OPTARG}" ;;
     c) COVERAGE_THRESHOLD="${OPTARG}" ;;
+    n) NATIVE="true" ;;
+    e) EXECUTOR="${OPTARG}" ;;
     ?) echo "${DOCS}" ; rm ${LOG_FILE} ; exit ;;
   esac
 done
@@ -147,10 +155,29 @@ CMD="mkdir ${OUTDIR}"
 logInfo "Executing command: ${CMD}"
 ${CMD}
 
-# Qsub and execute the depthOfCoverage.sh script
-QSUB_ARGS="-V -q sandbox.q -l h_vmem=50G -m a -M sakai.yuta@mayo.edu -N DepthOfCoverage -wd ${OUTDIR} \
--o /dlmp/sandbox/cgslIS/Yuta/logs -j y"
-CMD="${QSUB} ${QSUB_ARGS} ${COVERAGE_SCRIPT} -s ${SAMPLE} -b ${BAM} -o ${OUTDIR} -r ${Ref} -t ${TARGET_REGION} \
--c ${COVERAGE_THRESHOLD}"
+# Source python 3.6.3
+logInfo "Sourcing python 3.6.3"
+CMD="source ${PYTHON3}"
 logInfo "Executing command: ${CMD}"
-${CMD}
\ No newline at end of file
+eval ${CMD}
+
+if [[ "${NATIVE}" == "true" ]]; then
+    # Writes ${SAMPLE}.sample_interval_summary and ${SAMPLE}.sample_summary the same as DepthOfCoverage
+    logInfo "Running target_coverage.py to compute the coverage of the target regions"
+    CMD="python ${PYTHON_SCRIPT_DIR}/target_coverage.py -b ${BAM} -t ${TARGET_REGION} -o ${OUTDIR}/${SAMPLE} \
+-s ${SAMPLE} --summary-coverage-threshold ${COVERAGE_THRESHOLD}"
+    logInfo "Executing command: ${CMD}"
+    eval ${CMD}
+
+    logInfo "Script is done running"
+    exit 0
+fi
+
+# Execute the depthOfCoverage.sh script with job_executor.py, the queue and email of the grid come from the profile.
+# On the grid job_executor.py returns once the job is submitted, add --sync to wait for it
+export VCF_COMPARE_ROOT="${SCRIPT_ROOT}"
+CMD="python ${PYTHON_SCRIPT_DIR}/job_executor.py --executor ${EXECUTOR} -n DepthOfCoverage --memory-mb 51200 \
+-l ${OUTDIR} -c \"cd ${OUTDIR} && ${COVERAGE_SCRIPT} -s ${SAMPLE} -b ${BAM} -o ${OUTDIR} -r ${Ref} \
+-t ${TARGET_REGION} -c ${COVERAGE_THRESHOLD}\""
+logInfo "Executing command: ${CMD}"
+eval ${CMD}
@@ -11,6 +11,12 @@ __author__ = "Yuta Sakai"
 import argparse
 import os
 
+from bgzf import open_input_file
+from metrics import RunMetrics, add_metrics_arguments
+from summary_cache import SummaryCache
+from cohort_metrics import VARIANT_TYPES, SUMMARY_COUNT_COLUMNS, COHORT_PERCENTILES, build_cohort_metrics, \
+    get_cohort_statistics
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -22,115 +28,161 @@ def main():
         "-o", dest="output_directory", required=True,
         help="Full path to the output directory to save result files"
     )
+    parser.add_argument(
+        "--npz", dest="save_npz", action="store_true",
+        help="Also save the cohort metric arrays in cohort_metrics.npz"
+    )
+    parser.add_argument(
+        "--cache", dest="cache_path",
+        help="Full path to the cache file of parsed summary files, only new or changed files are parsed"
+    )
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    metrics = RunMetrics("aggregate_results", args.metrics_path, args.cprofile_path)
 
     input_directory = os.path.normpath(args.input_directory)
-    file_list = os.listdir(input_directory)
+    file_list = sorted(os.listdir(input_directory))
     output_directory = os.path.normpath(args.output_directory)
 
-    # Parse all of the .summary.csv files
-    result_dict = {}
-    parse_summary_file(file_list, input_directory, result_dict)
-
-    # Make the result file per variant type
-    write_result_file(output_directory, result_dict, "INDEL")
-    write_result_file(output_directory, result_dict, "SNP")
-    write_result_file(output_directory, result_dict, "ALL")
-
-
-def write_result_file(output_directory, result_dict, variant_type):
+    # Parse all of the .summary.csv files, using the cached results of unchanged files
+    if args.cache_path:
+        summary_cache = SummaryCache(os.path.abspath(args.cache_path))
+    else:
+        summary_cache = None
+    with metrics.phase("parse_summaries"):
+        sample_rows = parse_summary_file(file_list, input_directory, summary_cache)
+    for file in file_list:
+        metrics.add_input(input_directory + "/" + file)
+    metrics.records_read = len(sample_rows)
+    if summary_cache is not None:
+        evicted_count = summary_cache.evict_missing()
+        summary_cache.save()
+        print("Summary files parsed: " + str(summary_cache.misses) + ", read from cache: " +
+              str(summary_cache.hits) + ", removed from cache: " + str(evicted_count))
+        metrics.labels["cache_hits"] = summary_cache.hits
+    with metrics.phase("cohort_metrics"):
+        cohort_metrics = build_cohort_metrics(sample_rows)
+
+    with metrics.phase("write_results"):
+        # Make the result file per variant type
+        write_result_file(output_directory, cohort_metrics, "INDEL")
+        write_result_file(output_directory, cohort_metrics, "SNP")
+        write_result_file(output_directory, cohort_metrics, "ALL")
+
+        # Make the cohort level summary
+        write_cohort_summary_file(output_directory, cohort_metrics)
+        if args.save_npz:
+            cohort_metrics.save_npz(output_directory + "/cohort_metrics.npz")
+            metrics.add_output(output_directory + "/cohort_metrics.npz")
+    for variant_type in VARIANT_TYPES:
+        metrics.add_output(output_directory + "/" + variant_type + ".csv")
+    metrics.add_output(output_directory + "/cohort_summary.csv")
+    metrics.records_written = len(cohort_metrics.sample_names) * len(VARIANT_TYPES)
+    metrics.finish()
+
+
+def write_result_file(output_directory, cohort_metrics, variant_type):
     """
     Writes the csv result file based on the variant_type
     :param output_directory:
-    :param result_dict:
-    :param variant_type: variant_type string in result_dict; "INDEL", "SNP" or "ALL"
+    :param cohort_metrics:
+    :param variant_type: variant_type string in VARIANT_TYPES; "INDEL", "SNP" or "ALL"
     :return:
     """
     result_file = open(output_directory + "/" + variant_type + ".csv", "w")
     result_file.write("Sample,Truth,Query,TP,FP,FN,Precision,Recall\n")
-    for sample in result_dict.keys():
-        truth_total = str(result_dict[sample][variant_type]["truth_total"])
-        query_total = str(result_dict[sample][variant_type]["query_total"])
-        true_positive = str(result_dict[sample][variant_type]["true_positive"])
-        false_positive = str(result_dict[sample][variant_type]["false_positive"])
-        false_negative = str(result_dict[sample][variant_type]["false_negative"])
-        precision = str(result_dict[sample][variant_type]["precision"])
-        recall = str(result_dict[sample][variant_type]["recall"])
-        item_to_write = [sample, truth_total, query_total, true_positive, false_positive, false_negative,
-                         precision, recall]
+    counts = cohort_metrics.counts[:, VARIANT_TYPES.index(variant_type)].tolist()
+    precision = cohort_metrics.get_rate(variant_type, "precision").tolist()
+    recall = cohort_metrics.get_rate(variant_type, "recall").tolist()
+    # The ALL precision and recall are calculated here, so round them the same as hap.py
+    if variant_type == "ALL":
+        precision = [round(value, 7) for value in precision]
+        recall = [round(value, 7) for value in recall]
+    for sample_index, sample in enumerate(cohort_metrics.sample_names):
+        item_to_write = [sample] + [str(count) for count in counts[sample_index]] + \
+                        [str(precision[sample_index]), str(recall[sample_index])]
         result_file.write(",".join(item_to_write))
         result_file.write("\n")
     result_file.close()
 
 
-def parse_summary_file(file_list, input_directory, result_dict):
+def write_cohort_summary_file(output_directory, cohort_metrics):
+    """
+    Writes the mean, median and percentiles of the precision, recall and F1 of the cohort per variant type
+    :param output_directory:
+    :param cohort_metrics:
+    :return:
+    """
+    result_file = open(output_directory + "/cohort_summary.csv", "w")
+    result_file.write("Type,Metric,Samples,Mean,Median," +
+                      ",".join(["P" + str(percentile) for percentile in COHORT_PERCENTILES]) + "\n")
+    for variant_type in VARIANT_TYPES:
+        for metric in ["precision", "recall", "f1"]:
+            statistics = get_cohort_statistics(cohort_metrics.get_rate(variant_type, metric))
+            item_to_write = [variant_type, metric, str(len(cohort_metrics.sample_names))] + \
+                            [str(round(float(value), 7)) for value in statistics]
+            result_file.write(",".join(item_to_write))
+            result_file.write("\n")
+    result_file.close()
+
+
+def parse_summary_file(file_list, input_directory, summary_cache=None):
     """
     Function to parse the individual summary.csv file
     :param file_list:
     :param input_directory:
-    :param result_dict:
-    :return:
+    :param summary_cache: Optional SummaryCache, files that are unchanged since they were cached are not parsed
+    :return: Dictionary of sample name to {variant_type: [COUNT_METRICS..., precision, recall]}
     """
+    sample_rows = {}
     for file in file_list:
         # Get the sample name from the file name
         sample_name = file.split(".")[0].split("_")[0]
-        result_dict[sample_name] = {}
-        # Open the summary.csv file
-        summary_file = open(input_directory + "/" + file, "r")
-        # Get the header info
-        header_line = summary_file.readline().rstrip()
-        header_list = header_line.split(",")
-        all_truth_total = 0
-        all_query_total = 0
-        all_true_positive = 0
-        all_false_negative = 0
-        all_false_positive = 0
-        for line in summary_file:
-            line = line.rstrip()
-            line_item = line.split(",")
-            quality_filter = line_item[header_list.index("Filter")]
-            # Only interested in ALL quality_filter
-            if quality_filter == "PASS":
-                continue
-            else:
-                # Parse out the summary depending on the variant_type
-                variant_type = line_item[header_list.index("Type")]
-                truth_total = int(line_item[header_list.index("TRUTH.TOTAL")])
-                true_positive = int(line_item[header_list.index("TRUTH.TP")])
-                false_negative = int(line_item[header_list.index("TRUTH.FN")])
-                query_total = int(line_item[header_list.index("QUERY.TOTAL")])
-                false_positive = int(line_item[header_list.index("QUERY.FP")])
-                recall = float(line_item[header_list.index("METRIC.Recall")])
-                precision = float(line_item[header_list.index("METRIC.Precision")])
-                result_dict[sample_name][variant_type] = {
-                    "truth_total": truth_total,
-                    "query_total": query_total,
-                    "true_positive": true_positive,
-                    "false_positive": false_positive,
-                    "false_negative": false_negative,
-                    "precision": precision,
-                    "recall": recall
-                }
-                # Sum the numbers from INDEL and SNP
-                all_truth_total += truth_total
-                all_query_total += query_total
-                all_true_positive += true_positive
-                all_false_negative += false_negative
-                all_false_positive += false_positive
-        # Calculate the overall precision and recall
-        all_precision = round((all_true_positive / (all_true_positive + all_false_positive)), 7)
-        all_recall = round((all_true_positive / (all_true_positive + all_false_negative)), 7)
-        result_dict[sample_name]["ALL"] = {
-            "truth_total": all_truth_total,
-            "query_total": all_query_total,
-            "true_positive": all_true_positive,
-            "false_positive": all_false_positive,
-            "false_negative": all_false_negative,
-            "precision": all_precision,
-            "recall": all_recall
-        }
-        summary_file.close()
+        file_path = input_directory + "/" + file
+        if summary_cache is None:
+            sample_rows[sample_name] = parse_summary_rows(file_path)
+            continue
+        summary_rows = summary_cache.get(file_path)
+        if summary_rows is None:
+            summary_rows = parse_summary_rows(file_path)
+            summary_cache.put(file_path, summary_rows)
+        sample_rows[sample_name] = summary_rows
+    return sample_rows
+
+
+def parse_summary_rows(file_path):
+    """
+    Parses the INDEL and SNP rows of a summary.csv file
+    :param file_path:
+    :return: Dictionary of variant_type to [COUNT_METRICS..., precision, recall]
+    """
+    summary_rows = {}
+    # Open the summary.csv file
+    summary_file = open_input_file(file_path)
+    # Get the header info
+    header_line = summary_file.readline().rstrip()
+    header_list = header_line.split(",")
+    filter_index = header_list.index("Filter")
+    type_index = header_list.index("Type")
+    # Columns in the order of COUNT_METRICS
+    count_index_list = [header_list.index(column) for column in SUMMARY_COUNT_COLUMNS]
+    precision_index = header_list.index("METRIC.Precision")
+    recall_index = header_list.index("METRIC.Recall")
+    for line in summary_file:
+        line = line.rstrip()
+        line_item = line.split(",")
+        quality_filter = line_item[filter_index]
+        # Only interested in ALL quality_filter
+        if quality_filter == "PASS":
+            continue
+        else:
+            # Parse out the summary depending on the variant_type
+            variant_type = line_item[type_index]
+            summary_rows[variant_type] = [int(line_item[index]) for index in count_index_list] + \
+                                         [float(line_item[precision_index]), float(line_item[recall_index])]
+    summary_file.close()
+    return summary_rows
 
 
 if __name__ == "__main__":
@@ -9,7 +9,19 @@ __author__ = "Yuta Sakai"
 
 
 import argparse
+import heapq
+import itertools
 import os
+import shutil
+import tempfile
+
+from bgzf import open_input_file
+from metrics import RunMetrics, add_metrics_arguments
+from vcf_reader import chromosome_sort_key
+
+
+# Most run files open at the same time while merging, more runs are merged in several passes
+MAX_MERGE_RUNS = 64
 
 
 def main():
@@ -22,59 +34,98 @@ def main():
         "-o", dest="output_directory", required=True,
         help="Full path to the output directory to save result files"
     )
+    parser.add_argument(
+        "--max-records", dest="max_records", type=int,
+        help="Bound the memory by spilling sorted runs of this many records to disk and merging them, "
+             "the positions in the result file are then sorted by chromosome and position"
+    )
+    parser.add_argument(
+        "--temp-directory", dest="temporary_directory",
+        help="Directory for the sorted runs used with --max-records, default is the system temporary directory"
+    )
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    metrics = RunMetrics("analyze_false_positive_positions", args.metrics_path, args.cprofile_path)
 
     input_file_path = os.path.abspath(args.input_file)
     output_directory = os.path.normpath(args.output_directory)
 
     # Open the input file and skip the header line
-    input_file = open(input_file_path, "r")
+    input_file = open_input_file(input_file_path)
     input_file.readline()
+    metrics.add_input(input_file_path)
+    input_lines = metrics.count_read(input_file)
 
-    # Parse the result into a dictionary
-    result_dict, sample_name_list = parse_input_file(input_file)
+    if args.max_records:
+        # Spill sorted runs to disk and merge them into the result file
+        with metrics.phase("external_sort"):
+            sample_name_list, location_count = make_result_file_external(
+                output_directory, iterate_input_records(input_lines), args.max_records, args.temporary_directory)
+    else:
+        # Parse the result into a dictionary
+        with metrics.phase("parse_input"):
+            result_dict, sample_name_list = parse_input_file(input_lines)
+        location_count = len(result_dict)
 
-    # Make result file
-    result_file = make_result_file(output_directory, result_dict, sample_name_list)
+        # Make result file
+        with metrics.phase("write_results"):
+            result_file = make_result_file(output_directory, result_dict, sample_name_list)
+            result_file.close()
 
     print("Number of samples in samples analyzed: " + str(len(sample_name_list)))
 
     input_file.close()
-    result_file.close()
+    metrics.add_output(output_directory + "/variant_positions.csv")
+    metrics.records_written = location_count
+    metrics.finish()
 
 
-def make_result_file(output_directory, result_dict, sample_name_list):
-    result_file = open(output_directory + "/variant_positions.csv", "w")
-    # Write header
+def write_header(result_file, sample_name_list):
+    """
+    Writes the header line of the result file
+    :param result_file:
+    :param sample_name_list:
+    :return:
+    """
     result_file.write(",")
     result_file.write(",".join(sample_name_list) + ",")
     result_file.write("Total Count\n")
+
+
+def write_variant_location(result_file, variant_location, sample_alt_dict, sample_count):
+    """
+    Writes the line of a variant location with the alt allele in the column of each sample found
+    at the location, and the total number of samples found
+    :param result_file:
+    :param variant_location:
+    :param sample_alt_dict: Dictionary of sample ID to the alt allele
+    :param sample_count: Total number of samples in the result file
+    :return:
+    """
+    cells = [""] * sample_count
+    for sample_id, alt in sample_alt_dict.items():
+        cells[sample_id] = alt
+    result_file.write(variant_location + "," + "".join([cell + "," for cell in cells]) +
+                      str(len(sample_alt_dict)) + "\n")
+
+
+def make_result_file(output_directory, result_dict, sample_name_list):
+    result_file = open(output_directory + "/variant_positions.csv", "w")
+    # Write header
+    write_header(result_file, sample_name_list)
     # Iterate through the variant location in result_dict
-    for variant_location in result_dict.keys():
-        result_file.write(variant_location + ",")
-        # Go through the entire sample_name_list per variant_location
-        for sample_name in sample_name_list:
-            # Write in the alt allele if the sample_name exists in result_dict[variant_location]
-            if sample_name in result_dict[variant_location].keys():
-                result_file.write(result_dict[variant_location][sample_name] + ",")
-            # Otherwise keep it blank
-            else:
-                result_file.write(",")
-        # Add the total number of samples found in the variant_location
-        result_file.write(str(len(result_dict[variant_location].keys())))
-        result_file.write("\n")
+    for variant_location, sample_alt_dict in result_dict.items():
+        write_variant_location(result_file, variant_location, sample_alt_dict, len(sample_name_list))
     return result_file
 
 
-def parse_input_file(input_file):
+def iterate_input_records(input_file):
     """
-    Parses the file from parse_vcfs.py and create a dictionary of variant locations
+    Yields the sample name, chromosome, position and alt of each line from parse_vcfs.py
     :param input_file:
     :return:
     """
-    result_dict = {}
-    sample_name_list = []
     for line in input_file:
         line = line.rstrip()
         line_item = line.split(",")
@@ -82,23 +133,158 @@ def parse_input_file(input_file):
         # Skip the bioinformatics replicate samples
         if "rep" in sample_name:
             continue
+        yield sample_name, line_item[1], line_item[2], line_item[4]
+
+
+def parse_input_file(input_file):
+    """
+    Parses the file from parse_vcfs.py and create a dictionary of variant locations
+    :param input_file:
+    :return: result_dict of {variant_location: {sample_id: alt}} and sample_name_list
+    """
+    return aggregate_records(iterate_input_records(input_file))
+
+
+def aggregate_records(records):
+    """
+    Creates a dictionary of variant locations from the records
+    Samples are stored by their integer ID, the index in sample_name_list
+    :param records: Iterable of (sample_name, chromosome, position, alt)
+    :return: result_dict of {variant_location: {sample_id: alt}} and sample_name_list
+    """
+    result_dict = {}
+    sample_id_dict = {}
+    sample_name_list = []
+    for sample_name, chromosome, position, alt in records:
+        sample_id = sample_id_dict.get(sample_name)
+        if sample_id is None:
+            sample_id = len(sample_name_list)
+            sample_id_dict[sample_name] = sample_id
+            sample_name_list.append(sample_name)
+        variant_location = chromosome + ":" + position
+        sample_alt_dict = result_dict.get(variant_location)
+        if sample_alt_dict is None:
+            result_dict[variant_location] = {sample_id: alt}
         else:
-            if sample_name not in sample_name_list:
-                sample_name_list.append(sample_name)
-            chromosome = line_item[1]
-            position = line_item[2]
-            ref = line_item[3]
-            alt = line_item[4]
-            depth = line_item[5]
-            allele_frequency = line_item[7]
-            variant_location = chromosome + ":" + position
-            if variant_location not in result_dict.keys():
-                result_dict[variant_location] = {sample_name: alt}
-            else:
-                result_to_add = {sample_name: alt}
-                result_dict[variant_location].update(result_to_add)
+            sample_alt_dict[sample_id] = alt
     return result_dict, sample_name_list
 
 
+def write_sorted_run(run_records, temporary_directory):
+    """
+    Sorts the records by chromosome, position, sample ID and input order and writes them to a run file
+    :param run_records: List of (chromosome, position, sample_id, record_number, alt)
+    :param temporary_directory:
+    :return: Path to the run file
+    """
+    run_records.sort(key=get_run_sort_key)
+    run_file = tempfile.NamedTemporaryFile("w", dir=temporary_directory, suffix=".run", delete=False)
+    for run_record in run_records:
+        write_run_record(run_file, run_record)
+    run_file.close()
+    return run_file.name
+
+
+def get_run_sort_key(run_record):
+    return chromosome_sort_key(run_record[0]), run_record[1], run_record[2], run_record[3]
+
+
+def iterate_run_file(run_path):
+    """
+    Reads back the records of a run file
+    :param run_path:
+    :return:
+    """
+    with open(run_path, "r") as run_file:
+        for line in run_file:
+            chromosome, position, sample_id, record_number, alt = line.rstrip("\n").split("\t")
+            yield chromosome, int(position), int(sample_id), int(record_number), alt
+
+
+def write_run_record(run_file, run_record):
+    run_file.write("\t".join([str(item) for item in run_record]) + "\n")
+
+
+def merge_run_files(run_path_list, temporary_directory, max_merge_runs=MAX_MERGE_RUNS):
+    """
+    Merges the run files into fewer, longer runs until there are at most max_merge_runs, so the
+    final merge never opens more files than that at the same time. Merged run files are deleted
+    :param run_path_list:
+    :param temporary_directory:
+    :param max_merge_runs:
+    :return: List of the run file paths left
+    """
+    while len(run_path_list) > max_merge_runs:
+        merged_path_list = []
+        for run_index in range(0, len(run_path_list), max_merge_runs):
+            group_path_list = run_path_list[run_index:run_index + max_merge_runs]
+            if len(group_path_list) == 1:
+                merged_path_list.append(group_path_list[0])
+                continue
+            run_file = tempfile.NamedTemporaryFile("w", dir=temporary_directory, suffix=".run", delete=False)
+            for run_record in heapq.merge(*[iterate_run_file(run_path) for run_path in group_path_list],
+                                          key=get_run_sort_key):
+                write_run_record(run_file, run_record)
+            run_file.close()
+            for run_path in group_path_list:
+                os.remove(run_path)
+            merged_path_list.append(run_file.name)
+        run_path_list = merged_path_list
+    return run_path_list
+
+
+def make_result_file_external(output_directory, records, max_records, temporary_directory=None):
+    """
+    Makes the result file with bounded memory: the records are spilled to disk in sorted runs of
+    max_records and the runs are k-way merged, at most MAX_MERGE_RUNS at a time, so only the sample
+    names and one variant location are held in memory while writing. The variant locations are written
+    sorted by chromosome and position
+    :param output_directory:
+    :param records: Iterable of (sample_name, chromosome, position, alt)
+    :param max_records: Number of records held in memory before they are written to a run file
+    :param temporary_directory:
+    :return: sample_name_list and the number of variant locations written
+    """
+    run_directory = tempfile.mkdtemp(prefix="variant_positions_", dir=temporary_directory)
+    try:
+        sample_id_dict = {}
+        sample_name_list = []
+        run_path_list = []
+        run_records = []
+        for record_number, (sample_name, chromosome, position, alt) in enumerate(records):
+            sample_id = sample_id_dict.get(sample_name)
+            if sample_id is None:
+                sample_id = len(sample_name_list)
+                sample_id_dict[sample_name] = sample_id
+                sample_name_list.append(sample_name)
+            run_records.append((chromosome, int(position), sample_id, record_number, alt))
+            if len(run_records) >= max_records:
+                run_path_list.append(write_sorted_run(run_records, run_directory))
+                run_records = []
+        if run_records:
+            run_path_list.append(write_sorted_run(run_records, run_directory))
+
+        run_path_list = merge_run_files(run_path_list, run_directory)
+
+        result_file = open(output_directory + "/variant_positions.csv", "w")
+        write_header(result_file, sample_name_list)
+        location_count = 0
+        merged_records = heapq.merge(*[iterate_run_file(run_path) for run_path in run_path_list],
+                                     key=get_run_sort_key)
+        for (chromosome, position), location_records in itertools.groupby(
+                merged_records, key=lambda run_record: (run_record[0], run_record[1])):
+            # Records are in input order within a sample, so the last alt of a sample is kept
+            sample_alt_dict = {}
+            for run_record in location_records:
+                sample_alt_dict[run_record[2]] = run_record[4]
+            write_variant_location(result_file, chromosome + ":" + str(position), sample_alt_dict,
+                                   len(sample_name_list))
+            location_count += 1
+        result_file.close()
+    finally:
+        shutil.rmtree(run_directory)
+    return sample_name_list, location_count
+
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+
+"""
+Reader for BAM files with a .bai index. Only the BGZF blocks of the index chunks overlapping a region
+are decompressed, the same way tabix.py reads bgzipped VCFs
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import io
+import os
+import struct
+
+from bgzf import BgzfReader
+from tabix import TabixIndex, TBI_MIN_SHIFT, TBI_DEPTH, read_chunk
+
+
+BAM_MAGIC = b"BAM\x01"
+BAI_MAGIC = b"BAI\x01"
+SEQUENCE_CODES = "=ACMGRSVTWYHKDBN"
+# Fixed length part of an alignment record after block_size
+RECORD_STRUCT = struct.Struct("<iiBBHHHiiii")
+CIGAR_MATCH = 0
+CIGAR_INSERTION = 1
+CIGAR_DELETION = 2
+CIGAR_SKIP = 3
+CIGAR_SOFT_CLIP = 4
+CIGAR_SEQUENCE_MATCH = 7
+CIGAR_SEQUENCE_MISMATCH = 8
+# CIGAR operations that consume the reference
+REFERENCE_OPERATIONS = (CIGAR_MATCH, CIGAR_DELETION, CIGAR_SKIP, CIGAR_SEQUENCE_MATCH, CIGAR_SEQUENCE_MISMATCH)
+FLAG_UNMAPPED = 0x4
+FLAG_SECONDARY = 0x100
+FLAG_QC_FAIL = 0x200
+FLAG_DUPLICATE = 0x400
+# Reads skipped by default, the same as samtools mpileup
+DEFAULT_SKIP_FLAGS = FLAG_UNMAPPED | FLAG_SECONDARY | FLAG_QC_FAIL | FLAG_DUPLICATE
+
+
+class BamIndex(TabixIndex):
+    """
+    Bins, chunks and linear index of a .bai index, which has the layout of a .tbi index without the
+    header and is not compressed. The reference names come from the BAM header
+    """
+
+    def __init__(self, index_path, names):
+        self.index_path = index_path
+        self.bin_list = []
+        self.linear_index_list = []
+        self.names = names
+        self.min_shift = TBI_MIN_SHIFT
+        self.depth = TBI_DEPTH
+        index_file = open(index_path, "rb")
+        data = index_file.read()
+        index_file.close()
+        if data[:4] != BAI_MAGIC:
+            raise IOError("Not a BAM index: " + index_path)
+        (reference_count,) = struct.unpack_from("<i", data, 4)
+        self._parse_linear_references(data, 8, reference_count)
+        self.name_index = {name: index for index, name in enumerate(self.names)}
+
+
+class BamRead(object):
+    """
+    Alignment record of a BAM file, the sequence is kept packed with two bases per byte
+    """
+
+    __slots__ = ["reference_id", "reference_start", "reference_end", "mapping_quality", "flag", "cigar",
+                 "packed_sequence", "qualities"]
+
+    def __init__(self, reference_id, reference_start, mapping_quality, flag, cigar, packed_sequence, qualities):
+        self.reference_id = reference_id
+        self.reference_start = reference_start
+        self.mapping_quality = mapping_quality
+        self.flag = flag
+        self.cigar = cigar
+        self.packed_sequence = packed_sequence
+        self.qualities = qualities
+        reference_length = sum([length for operation, length in cigar if operation in REFERENCE_OPERATIONS])
+        self.reference_end = reference_start + max(reference_length, 1)
+
+    def get_base(self, query_index):
+        """
+        Returns the base of the read at query_index
+        :param query_index: 0 based index in the read sequence
+        :return:
+        """
+        code = self.packed_sequence[query_index >> 1]
+        if query_index & 1:
+            return SEQUENCE_CODES[code & 0xF]
+        return SEQUENCE_CODES[code >> 4]
+
+
+def find_bam_index(bam_path):
+    """
+    Finds the .bai index of a BAM, named either {name}.bam.bai or {name}.bai
+    :param bam_path:
+    :return: Path to the index, None if there is none
+    """
+    for index_path in [bam_path + ".bai", os.path.splitext(bam_path)[0] + ".bai"]:
+        if os.path.isfile(index_path):
+            return index_path
+    return None
+
+
+def parse_bam_records(data):
+    """
+    Yields the alignment records in a block of uncompressed BAM data that starts and ends at record boundaries
+    :param data:
+    :return:
+    """
+    offset = 0
+    while offset + 4 <= len(data):
+        (block_size,) = struct.unpack_from("<i", data, offset)
+        (reference_id, reference_start, name_length, mapping_quality, _, cigar_count, flag, sequence_length, _, _,
+         _) = RECORD_STRUCT.unpack_from(data, offset + 4)
+        cigar_offset = offset + 4 + RECORD_STRUCT.size + name_length
+        cigar_values = struct.unpack_from("<" + str(cigar_count) + "I", data, cigar_offset)
+        sequence_offset = cigar_offset + cigar_count * 4
+        quality_offset = sequence_offset + (sequence_length + 1) // 2
+        yield BamRead(reference_id, reference_start, mapping_quality, flag,
+                      [(value & 0xF, value >> 4) for value in cigar_values],
+                      data[sequence_offset:quality_offset], data[quality_offset:quality_offset + sequence_length])
+        offset += 4 + block_size
+
+
+class BamFile(object):
+    """
+    BAM file opened for reading the reads of regions through its .bai index
+    """
+
+    def __init__(self, bam_path, index_path=None):
+        self.bam_path = bam_path
+        self.references, self.reference_lengths = read_bam_header(bam_path)
+        if index_path is None:
+            index_path = find_bam_index(bam_path)
+            if index_path is None:
+                raise IOError("No .bai index found for " + bam_path)
+        self.index = BamIndex(index_path, self.references)
+        self._handle = open(bam_path, "rb")
+
+    def fetch(self, chromosome, begin, end):
+        """
+        Yields the reads overlapping the 0 based interval [begin, end) in the order of the BAM
+        :param chromosome:
+        :param begin:
+        :param end:
+        :return:
+        """
+        reference_id = self.index.name_index.get(chromosome)
+        if reference_id is None:
+            return
+        for chunk_begin, chunk_end in self.index.get_chunks(chromosome, begin, end):
+            for read in parse_bam_records(read_chunk(self._handle, chunk_begin, chunk_end)):
+                if read.reference_id != reference_id:
+                    continue
+                # The reads are sorted by position, so the rest of the chunk is after the region
+                if read.reference_start >= end:
+                    break
+                if read.reference_end > begin:
+                    yield read
+
+    def close(self):
+        self._handle.close()
+
+
+def read_bam_header(bam_path):
+    """
+    Reads the reference names and lengths from the header of a BAM
+    :param bam_path:
+    :return: references, reference_lengths
+    """
+    bam_file = io.BufferedReader(BgzfReader(bam_path, threads=1))
+    try:
+        if bam_file.read(4) != BAM_MAGIC:
+            raise IOError("Not a BAM file: " + bam_path)
+        (text_length,) = struct.unpack("<i", bam_file.read(4))
+        bam_file.read(text_length)
+        (reference_count,) = struct.unpack("<i", bam_file.read(4))
+        references = []
+        reference_lengths = []
+        for _ in range(reference_count):
+            (name_length,) = struct.unpack("<i", bam_file.read(4))
+            references.append(bam_file.read(name_length).rstrip(b"\x00").decode())
+            reference_lengths.append(struct.unpack("<i", bam_file.read(4))[0])
+    finally:
+        bam_file.close()
+    return references, reference_lengths
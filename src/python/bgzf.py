@@ -0,0 +1,225 @@
+#!/usr/bin/python3
+
+"""
+Reader and writer for gzip and BGZF compressed files. BGZF files are made of independent gzip blocks,
+so the blocks are decompressed and compressed in a thread pool (zlib releases the GIL) and streamed
+in order
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import collections
+import concurrent.futures
+import gzip
+import io
+import os
+import struct
+import zlib
+
+
+GZIP_MAGIC = b"\x1f\x8b"
+# Index files that sit next to bgzipped VCFs in the input directories
+INDEX_EXTENSIONS = (".tbi", ".csi")
+BGZF_HEADER_SIZE = 18
+DEFAULT_THREADS = min(4, os.cpu_count() or 1)
+# Number of blocks decompressed ahead of the reader per thread
+READ_AHEAD_PER_THREAD = 4
+# Uncompressed size of a full block, the same as htslib so a block always fits in 64 KB compressed
+BGZF_BLOCK_SIZE = 0xff00
+# Empty block that marks the end of a BGZF file
+BGZF_EOF = b"\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00BC\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00"
+DEFAULT_COMPRESS_LEVEL = 6
+
+
+def is_bgzf_header(header):
+    """
+    Checks if the bytes are the start of a BGZF block: a gzip member with the "BC" extra subfield
+    :param header: First 18 bytes of a block
+    :return:
+    """
+    return (len(header) == BGZF_HEADER_SIZE and header[:4] == b"\x1f\x8b\x08\x04" and
+            header[12:14] == b"BC" and header[14:16] == b"\x02\x00")
+
+
+def read_bgzf_block(handle):
+    """
+    Reads one raw BGZF block from the current position of handle
+    :param handle: File object opened in binary mode
+    :return: The full compressed block as bytes, None at the end of the file
+    """
+    header = handle.read(BGZF_HEADER_SIZE)
+    if not header:
+        return None
+    if not is_bgzf_header(header):
+        raise IOError("Invalid BGZF block header at offset " + str(handle.tell() - len(header)))
+    block_size = struct.unpack("<H", header[16:18])[0] + 1
+    remainder = handle.read(block_size - BGZF_HEADER_SIZE)
+    if len(remainder) != block_size - BGZF_HEADER_SIZE:
+        raise IOError("Truncated BGZF block at offset " + str(handle.tell() - len(header) - len(remainder)))
+    return header + remainder
+
+
+def decompress_bgzf_block(block):
+    """
+    Decompresses a raw BGZF block and checks its CRC32
+    :param block:
+    :return: Uncompressed bytes
+    """
+    data = zlib.decompress(block[BGZF_HEADER_SIZE:-8], -15)
+    crc, input_size = struct.unpack("<II", block[-8:])
+    if len(data) != input_size or zlib.crc32(data) != crc:
+        raise IOError("BGZF block failed the CRC check")
+    return data
+
+
+def compress_bgzf_block(data, compress_level=DEFAULT_COMPRESS_LEVEL):
+    """
+    Compresses data of at most BGZF_BLOCK_SIZE bytes into a BGZF block
+    :param data:
+    :param compress_level:
+    :return: The full compressed block as bytes
+    """
+    compressor = zlib.compressobj(compress_level, zlib.DEFLATED, -15)
+    compressed = compressor.compress(data) + compressor.flush()
+    header = struct.pack("<4sIBBH2sHH", b"\x1f\x8b\x08\x04", 0, 0, 255, 6, b"BC", 2,
+                         BGZF_HEADER_SIZE + len(compressed) + 8 - 1)
+    return header + compressed + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+class BgzfReader(io.RawIOBase):
+    """
+    Raw binary reader for a BGZF file that decompresses blocks ahead of the reader in a thread pool
+    """
+
+    def __init__(self, file_path, threads=DEFAULT_THREADS):
+        super().__init__()
+        self._handle = open(file_path, "rb")
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self._pending = collections.deque()
+        self._read_ahead = threads * READ_AHEAD_PER_THREAD
+        self._buffer = b""
+        self._buffer_offset = 0
+        self._end_of_file = False
+
+    def readable(self):
+        return True
+
+    def _queue_blocks(self):
+        while not self._end_of_file and len(self._pending) < self._read_ahead:
+            block = read_bgzf_block(self._handle)
+            if block is None:
+                self._end_of_file = True
+            else:
+                self._pending.append(self._executor.submit(decompress_bgzf_block, block))
+
+    def readinto(self, buffer):
+        while self._buffer_offset >= len(self._buffer):
+            self._queue_blocks()
+            if not self._pending:
+                return 0
+            self._buffer = self._pending.popleft().result()
+            self._buffer_offset = 0
+        size = min(len(buffer), len(self._buffer) - self._buffer_offset)
+        buffer[:size] = self._buffer[self._buffer_offset:self._buffer_offset + size]
+        self._buffer_offset += size
+        return size
+
+    def close(self):
+        if not self.closed:
+            for future in self._pending:
+                future.cancel()
+            self._executor.shutdown(wait=True)
+            self._handle.close()
+        super().close()
+
+
+class BgzfWriter(object):
+    """
+    Writer for a BGZF file that compresses full blocks in a thread pool and writes them in order.
+    tell() returns the position of the next byte as (block number, offset in the block), which
+    get_virtual_offset() turns into a virtual offset once the block has been written
+    """
+
+    def __init__(self, file_path, threads=DEFAULT_THREADS, compress_level=DEFAULT_COMPRESS_LEVEL):
+        self._handle = open(file_path, "wb")
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self._pending = collections.deque()
+        self._write_ahead = threads * READ_AHEAD_PER_THREAD
+        self._compress_level = compress_level
+        self._buffer = bytearray()
+        self._block_count = 0
+        # Compressed offset of every block written so far, and of the end of the last one
+        self.block_offsets = []
+        self._compressed_offset = 0
+        self.closed = False
+
+    def write(self, data):
+        self._buffer += data
+        while len(self._buffer) >= BGZF_BLOCK_SIZE:
+            self._queue_block(bytes(self._buffer[:BGZF_BLOCK_SIZE]))
+            del self._buffer[:BGZF_BLOCK_SIZE]
+
+    def tell(self):
+        return self._block_count, len(self._buffer)
+
+    def _queue_block(self, data):
+        self._pending.append(self._executor.submit(compress_bgzf_block, data, self._compress_level))
+        self._block_count += 1
+        while len(self._pending) > self._write_ahead:
+            self._write_block(self._pending.popleft().result())
+
+    def _write_block(self, block):
+        self.block_offsets.append(self._compressed_offset)
+        self._handle.write(block)
+        self._compressed_offset += len(block)
+
+    def get_virtual_offset(self, position):
+        """
+        Converts a position from tell() to a virtual offset, the compressed offset of the block shifted
+        left by 16 bits plus the offset in the uncompressed block
+        :param position: (block number, offset in the block)
+        :return:
+        """
+        block_number, block_offset = position
+        if block_number < len(self.block_offsets):
+            return (self.block_offsets[block_number] << 16) | block_offset
+        if block_number == len(self.block_offsets) and block_offset == 0 and not self._pending:
+            # The end of the data, where the next block would start
+            return self._compressed_offset << 16
+        raise ValueError("The block of the position has not been written yet")
+
+    def close(self):
+        """
+        Writes the last partial block and the end of file marker
+        :return:
+        """
+        if self.closed:
+            return
+        if self._buffer:
+            self._queue_block(bytes(self._buffer))
+            self._buffer = bytearray()
+        while self._pending:
+            self._write_block(self._pending.popleft().result())
+        self._executor.shutdown(wait=True)
+        self._handle.write(BGZF_EOF)
+        self._handle.close()
+        self.closed = True
+
+
+def open_input_file(file_path, threads=DEFAULT_THREADS):
+    """
+    Opens an input file for reading text. BGZF files are read with BgzfReader, other gzip files
+    with the gzip module and anything else as plain text
+    :param file_path:
+    :param threads: Number of threads to decompress BGZF blocks
+    :return: Text file object
+    """
+    with open(file_path, "rb") as handle:
+        header = handle.read(BGZF_HEADER_SIZE)
+    if is_bgzf_header(header):
+        return io.TextIOWrapper(io.BufferedReader(BgzfReader(file_path, threads)))
+    elif header.startswith(GZIP_MAGIC):
+        return gzip.open(file_path, "rt")
+    else:
+        return open(file_path, "r")
@@ -0,0 +1,236 @@
+#!/usr/bin/python3
+
+"""
+Script to check the false positive sites of the MGC VCF in the MGC BAM without samtools mpileup and
+bcftools call. The reads overlapping each site are read through the .bai index and the reads with the
+ref and alt alleles are counted, and the counts are written with the VCF items of parse_vcfs.py
+in one table for all samples
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import argparse
+import bisect
+import os
+
+from bam_reader import BamFile, DEFAULT_SKIP_FLAGS, CIGAR_MATCH, CIGAR_INSERTION, CIGAR_DELETION, CIGAR_SKIP, \
+    CIGAR_SOFT_CLIP, CIGAR_SEQUENCE_MATCH, CIGAR_SEQUENCE_MISMATCH
+from bgzf import open_input_file
+from metrics import RunMetrics, add_metrics_arguments
+from parse_vcfs import get_result_items
+from pipeline_profile import expand_sample_directories
+from vcf_reader import read_vcf_records, chromosome_sort_key
+
+
+# Sites closer than this are counted from the same reads
+SITE_CLUSTER_DISTANCE = 1000
+RESULT_HEADER = "Sample,CHROM,POS,REF,ALT,DP,Called AF,Real AF,BAM DP,REF Reads,ALT Reads,Other Reads,BAM AF," \
+                "Found in BAM"
+ALIGNED_OPERATIONS = (CIGAR_MATCH, CIGAR_SEQUENCE_MATCH, CIGAR_SEQUENCE_MISMATCH)
+
+
+class SiteCounts(object):
+    """
+    A site of the false positive VCF and the number of reads with each of its alleles
+    """
+
+    __slots__ = ["result_items", "begin", "end", "ref", "alts", "trailing_insertions", "depth", "ref_count",
+                 "alt_counts", "other_count"]
+
+    def __init__(self, result_items, ref, alts):
+        self.result_items = result_items
+        # 0 based span of the ref allele
+        self.begin = int(result_items[2]) - 1
+        self.end = self.begin + len(ref)
+        self.ref = ref.upper()
+        self.alts = [alt.upper() for alt in alts]
+        # Bases inserted after the last ref base are part of the allele only for insertions
+        self.trailing_insertions = any([len(alt) > len(ref) for alt in alts])
+        self.depth = 0
+        self.ref_count = 0
+        self.alt_counts = [0] * len(alts)
+        self.other_count = 0
+
+    def add_allele(self, allele):
+        self.depth += 1
+        if allele == self.ref:
+            self.ref_count += 1
+        elif allele in self.alts:
+            self.alt_counts[self.alts.index(allele)] += 1
+        else:
+            self.other_count += 1
+
+    def get_result_line(self, min_alt_reads):
+        alt_count = sum(self.alt_counts)
+        bam_allele_frequency = str(round(alt_count / self.depth, 4)) if self.depth else "NA"
+        found_in_bam = "Y" if max(self.alt_counts) >= min_alt_reads else "N"
+        return ",".join(self.result_items + [str(self.depth), str(self.ref_count),
+                                             ":".join([str(count) for count in self.alt_counts]),
+                                             str(self.other_count), bam_allele_frequency, found_in_bam]) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", dest="sample_directories", required=True, nargs="+",
+        help="Full path to the sample directories with {sample}_MGC_false_positives.vcf and "
+             "mgc/alignment/{sample}.bam, glob patterns are expanded"
+    )
+    parser.add_argument(
+        "-o", dest="output_file", required=True,
+        help="Full path to the CSV file to save the read counts of all samples"
+    )
+    parser.add_argument(
+        "-q", "--min-MQ", dest="min_mapping_quality", type=int, default=0,
+        help="Skip the reads with a mapping quality below this, default is 0 the same as samtools mpileup"
+    )
+    parser.add_argument(
+        "-Q", "--min-BQ", dest="min_base_quality", type=int, default=13,
+        help="Skip the reads with a base quality below this in the allele, default is 13 the same as "
+             "samtools mpileup"
+    )
+    parser.add_argument(
+        "--min-alt-reads", dest="min_alt_reads", type=int, default=2,
+        help="Number of reads with the alt allele for the site to be found in the BAM, default is 2"
+    )
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    metrics = RunMetrics("check_false_positives", args.metrics_path, args.cprofile_path)
+
+    sample_directory_list = expand_sample_directories(args.sample_directories)
+    if not sample_directory_list:
+        parser.error("No sample directories found")
+
+    result_file = open(args.output_file, "w")
+    result_file.write(RESULT_HEADER + "\n")
+    for sample_directory in sample_directory_list:
+        sample = os.path.basename(sample_directory)
+        vcf_path = sample_directory + "/" + sample + "_MGC_false_positives.vcf"
+        bam_path = sample_directory + "/mgc/alignment/" + sample + ".bam"
+        missing_paths = [path for path in [vcf_path, bam_path] if not os.path.isfile(path)]
+        if missing_paths:
+            print("Skipping " + sample + ", missing " + ", ".join(missing_paths))
+            continue
+        print("Processing sample: " + sample)
+        with metrics.phase("count:" + sample):
+            site_list = load_sites(vcf_path, sample)
+            bam_file = BamFile(bam_path)
+            count_site_reads(bam_file, site_list, args.min_mapping_quality, args.min_base_quality)
+            bam_file.close()
+        for site in site_list:
+            result_file.write(site.get_result_line(args.min_alt_reads))
+        metrics.records_read += len(site_list)
+        metrics.records_written += len(site_list)
+        metrics.add_input(vcf_path)
+        metrics.add_input(bam_path)
+    result_file.close()
+    metrics.add_output(args.output_file)
+    metrics.finish()
+
+
+def load_sites(vcf_path, sample):
+    """
+    Loads the sites of the false positive VCF in the order of the VCF
+    :param vcf_path:
+    :param sample:
+    :return: List of SiteCounts
+    """
+    site_list = []
+    vcf_file = open_input_file(vcf_path)
+    for record in read_vcf_records(vcf_file):
+        site_list.append(SiteCounts(get_result_items(sample, record), record.ref, record.alt.split(",")))
+    vcf_file.close()
+    return site_list
+
+
+def cluster_sites(site_list):
+    """
+    Groups the sites by chromosome into clusters of nearby sites sorted by position
+    :param site_list:
+    :return: List of (chromosome, begin, end, sites of the cluster)
+    """
+    cluster_list = []
+    for site in sorted(site_list, key=lambda site: (chromosome_sort_key(site.result_items[1]), site.begin)):
+        chromosome = site.result_items[1]
+        if cluster_list and cluster_list[-1][0] == chromosome and \
+                site.begin <= cluster_list[-1][2] + SITE_CLUSTER_DISTANCE:
+            cluster = cluster_list[-1]
+            cluster_list[-1] = (chromosome, cluster[1], max(cluster[2], site.end), cluster[3] + [site])
+        else:
+            cluster_list.append((chromosome, site.begin, site.end, [site]))
+    return cluster_list
+
+
+def count_site_reads(bam_file, site_list, min_mapping_quality, min_base_quality):
+    """
+    Counts the alleles of the reads covering each site, reading the reads of each cluster of sites once
+    :param bam_file: BamFile
+    :param site_list: List of SiteCounts
+    :param min_mapping_quality:
+    :param min_base_quality:
+    :return:
+    """
+    for chromosome, begin, end, cluster in cluster_sites(site_list):
+        begin_list = [site.begin for site in cluster]
+        for read in bam_file.fetch(chromosome, begin, end):
+            if read.flag & DEFAULT_SKIP_FLAGS or read.mapping_quality < min_mapping_quality:
+                continue
+            # Sites that start inside the read
+            for site_index in range(bisect.bisect_left(begin_list, read.reference_start),
+                                    bisect.bisect_left(begin_list, read.reference_end)):
+                site = cluster[site_index]
+                if site.end > read.reference_end:
+                    continue
+                allele = get_read_allele(read, site.begin, site.end, site.trailing_insertions, min_base_quality)
+                if allele is not None:
+                    site.add_allele(allele)
+
+
+def get_read_allele(read, begin, end, trailing_insertions, min_base_quality):
+    """
+    Gets the sequence of the read aligned to the reference span [begin, end), with the bases inserted
+    inside the span and, if trailing_insertions is set, right after it
+    :param read: BamRead covering the span
+    :param begin: 0 based begin
+    :param end: 0 based end, exclusive
+    :param trailing_insertions:
+    :param min_base_quality:
+    :return: The allele, None if a base of the allele is below min_base_quality or the span is in an intron
+    """
+    last_position = end - 1 if trailing_insertions else end - 2
+    reference_position = read.reference_start
+    query_index = 0
+    allele_bases = []
+    for operation, length in read.cigar:
+        if reference_position >= end and operation != CIGAR_INSERTION:
+            break
+        if operation in ALIGNED_OPERATIONS:
+            for offset in range(max(begin - reference_position, 0), min(end - reference_position, length)):
+                if read.qualities[query_index + offset] < min_base_quality:
+                    return None
+                allele_bases.append(read.get_base(query_index + offset))
+            reference_position += length
+            query_index += length
+        elif operation == CIGAR_INSERTION:
+            # Inserted after the reference base before reference_position
+            if begin <= reference_position - 1 <= last_position:
+                for offset in range(length):
+                    if read.qualities[query_index + offset] < min_base_quality:
+                        return None
+                    allele_bases.append(read.get_base(query_index + offset))
+            query_index += length
+        elif operation == CIGAR_DELETION:
+            reference_position += length
+        elif operation == CIGAR_SKIP:
+            if reference_position < end and reference_position + length > begin:
+                return None
+            reference_position += length
+        elif operation == CIGAR_SOFT_CLIP:
+            query_index += length
+    return "".join(allele_bases)
+
+
+if __name__ == "__main__":
+    main()
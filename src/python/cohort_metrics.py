@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+
+"""
+Columnar cohort metrics for the hap.py summary results. The counts of every sample are held in
+a samples x variant type x metric NumPy array so the ALL totals, precision, recall, F1 and the
+cohort level statistics are computed in vectorized form
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import numpy
+
+
+VARIANT_TYPES = ["INDEL", "SNP", "ALL"]
+COUNT_METRICS = ["truth_total", "query_total", "true_positive", "false_positive", "false_negative"]
+# hap.py summary.csv columns in the order of COUNT_METRICS
+SUMMARY_COUNT_COLUMNS = ["TRUTH.TOTAL", "QUERY.TOTAL", "TRUTH.TP", "QUERY.FP", "TRUTH.FN"]
+RATE_METRICS = ["precision", "recall"]
+COHORT_PERCENTILES = [5, 25, 75, 95]
+
+
+class CohortMetrics(object):
+    """
+    Metrics of all samples in a cohort
+    counts: int64 array of samples x VARIANT_TYPES x COUNT_METRICS
+    precision, recall, f1: float64 arrays of samples x VARIANT_TYPES
+    """
+
+    def __init__(self, sample_names, counts, precision, recall):
+        self.sample_names = sample_names
+        self.counts = counts
+        self.precision = precision
+        self.recall = recall
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            self.f1 = 2 * precision * recall / (precision + recall)
+
+    def get_count(self, variant_type, metric):
+        """
+        Returns the column of a count metric for every sample
+        :param variant_type:
+        :param metric: One of COUNT_METRICS
+        :return:
+        """
+        return self.counts[:, VARIANT_TYPES.index(variant_type), COUNT_METRICS.index(metric)]
+
+    def get_rate(self, variant_type, metric):
+        """
+        Returns the column of precision, recall or f1 for every sample
+        :param variant_type:
+        :param metric: "precision", "recall" or "f1"
+        :return:
+        """
+        return getattr(self, metric)[:, VARIANT_TYPES.index(variant_type)]
+
+    def save_npz(self, npz_path):
+        """
+        Saves the arrays in a compressed .npz file
+        :param npz_path:
+        :return:
+        """
+        numpy.savez_compressed(
+            npz_path, sample_names=numpy.array(self.sample_names), variant_types=numpy.array(VARIANT_TYPES),
+            count_metrics=numpy.array(COUNT_METRICS), counts=self.counts, precision=self.precision,
+            recall=self.recall, f1=self.f1
+        )
+
+
+def build_cohort_metrics(sample_rows):
+    """
+    Builds the cohort arrays from the parsed summary rows and computes the ALL variant type
+    :param sample_rows: Dictionary of sample name to {variant_type: [COUNT_METRICS..., precision, recall]}
+                        for the INDEL and SNP variant types
+    :return: CohortMetrics
+    """
+    sample_names = list(sample_rows.keys())
+    counts = numpy.zeros((len(sample_names), len(VARIANT_TYPES), len(COUNT_METRICS)), dtype=numpy.int64)
+    rates = numpy.full((len(sample_names), len(VARIANT_TYPES), len(RATE_METRICS)), numpy.nan)
+    for sample_index, sample_name in enumerate(sample_names):
+        for variant_type, row in sample_rows[sample_name].items():
+            if variant_type not in VARIANT_TYPES:
+                continue
+            type_index = VARIANT_TYPES.index(variant_type)
+            counts[sample_index, type_index] = row[:len(COUNT_METRICS)]
+            rates[sample_index, type_index] = row[len(COUNT_METRICS):]
+    # Sum the numbers from INDEL and SNP and calculate the overall precision and recall
+    all_index = VARIANT_TYPES.index("ALL")
+    counts[:, all_index] = counts[:, VARIANT_TYPES.index("INDEL")] + counts[:, VARIANT_TYPES.index("SNP")]
+    true_positive = counts[:, all_index, COUNT_METRICS.index("true_positive")]
+    false_positive = counts[:, all_index, COUNT_METRICS.index("false_positive")]
+    false_negative = counts[:, all_index, COUNT_METRICS.index("false_negative")]
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        rates[:, all_index, RATE_METRICS.index("precision")] = true_positive / (true_positive + false_positive)
+        rates[:, all_index, RATE_METRICS.index("recall")] = true_positive / (true_positive + false_negative)
+    return CohortMetrics(sample_names, counts, rates[:, :, 0], rates[:, :, 1])
+
+
+def get_cohort_statistics(values):
+    """
+    Calculates the mean, median and COHORT_PERCENTILES of the values, ignoring NaN
+    :param values:
+    :return: List of mean, median and the percentiles
+    """
+    values = values[~numpy.isnan(values)]
+    if values.size == 0:
+        return [numpy.nan] * (2 + len(COHORT_PERCENTILES))
+    return [numpy.mean(values), numpy.median(values)] + list(numpy.percentile(values, COHORT_PERCENTILES))
@@ -0,0 +1,247 @@
+#!/usr/bin/python3
+
+"""
+Script to compare the CLC and filtered MGC VCFs without hap.py, as a fast pre-check for re-runs and
+parameter sweeps. The alleles of both VCFs are normalized and joined on (chrom, pos, ref, alt), and the
+results are written as a hap.py style summary.csv with the false positive and false negative VCFs, so
+aggregate_results.py and filterMgcVcf.sh can use them the same way as the hap.py results.
+Indels are only trimmed, not left aligned against the reference, so use hap.py for the final results
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import argparse
+import os
+
+from bgzf import open_input_file
+from metrics import RunMetrics, add_metrics_arguments
+from vcf_reader import read_vcf_records
+
+
+VARIANT_TYPES = ["INDEL", "SNP"]
+FILTER_ALL = "ALL"
+FILTER_PASS = "PASS"
+SUMMARY_HEADER = "Type,Filter,TRUTH.TOTAL,TRUTH.TP,TRUTH.FN,QUERY.TOTAL,QUERY.FP,QUERY.UNK,FP.gt,METRIC.Recall," \
+                 "METRIC.Precision,METRIC.Frac_NA,METRIC.F1_Score,TRUTH.TOTAL.TiTv_ratio,QUERY.TOTAL.TiTv_ratio," \
+                 "TRUTH.TOTAL.het_hom_ratio,QUERY.TOTAL.het_hom_ratio"
+TRANSITIONS = {("A", "G"), ("G", "A"), ("C", "T"), ("T", "C")}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-t", dest="truth_vcf", required=True,
+        help="Full path to the truth VCF, the CLC VCF"
+    )
+    parser.add_argument(
+        "-q", dest="query_vcf", required=True,
+        help="Full path to the query VCF, the filtered MGC VCF"
+    )
+    parser.add_argument(
+        "-o", dest="output_prefix", required=True,
+        help="Output prefix the same as hap.py -o, makes {prefix}.summary.csv, {prefix}_false_positives.vcf "
+             "and {prefix}_false_negatives.vcf"
+    )
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    metrics = RunMetrics("compare_vcfs", args.metrics_path, args.cprofile_path)
+
+    truth_vcf_path = os.path.abspath(args.truth_vcf)
+    query_vcf_path = os.path.abspath(args.query_vcf)
+    output_prefix = os.path.abspath(args.output_prefix)
+    summary_path = output_prefix + ".summary.csv"
+    false_positive_vcf_path = output_prefix + "_false_positives.vcf"
+    false_negative_vcf_path = output_prefix + "_false_negatives.vcf"
+
+    with metrics.phase("load_truth"):
+        truth_variants = load_variants(truth_vcf_path)
+    with metrics.phase("load_query"):
+        query_variants = load_variants(query_vcf_path)
+    metrics.records_read = len(truth_variants) + len(query_variants)
+
+    # Hash join on the normalized alleles in both directions
+    with metrics.phase("compare"):
+        summary_rows = get_summary_rows(truth_variants, query_variants)
+        write_summary_file(summary_path, summary_rows)
+        false_positive_count = write_unmatched_records(query_vcf_path, truth_variants, false_positive_vcf_path)
+        false_negative_count = write_unmatched_records(truth_vcf_path, query_variants, false_negative_vcf_path)
+    print("False positive records: " + str(false_positive_count))
+    print("False negative records: " + str(false_negative_count))
+
+    metrics.records_written = false_positive_count + false_negative_count + len(summary_rows)
+    metrics.add_input(truth_vcf_path)
+    metrics.add_input(query_vcf_path)
+    for output_path in [summary_path, false_positive_vcf_path, false_negative_vcf_path]:
+        metrics.add_output(output_path)
+    metrics.finish()
+
+
+def normalize_allele(chrom, pos, ref, alt):
+    """
+    Trims the bases shared by ref and alt, first from the end and then from the start, keeping one
+    base in both for indels. Multi nucleotide substitutions are split into SNPs, the same as the
+    decomposition of the hap.py pre-processing
+    :param chrom:
+    :param pos: Integer position
+    :param ref:
+    :param alt:
+    :return: List of (chrom, pos, ref, alt) keys
+    """
+    ref = ref.upper()
+    alt = alt.upper()
+    while len(ref) > 1 and len(alt) > 1 and ref[-1] == alt[-1]:
+        ref = ref[:-1]
+        alt = alt[:-1]
+    while len(ref) > 1 and len(alt) > 1 and ref[0] == alt[0]:
+        ref = ref[1:]
+        alt = alt[1:]
+        pos += 1
+    if len(ref) == len(alt) and len(ref) > 1:
+        return [(chrom, pos + offset, ref_base, alt_base) for offset, (ref_base, alt_base) in
+                enumerate(zip(ref, alt)) if ref_base != alt_base]
+    return [(chrom, pos, ref, alt)]
+
+
+def get_record_keys(record):
+    """
+    Makes the normalized keys of every alt allele of a record, skipping the symbolic, missing and
+    spanning deletion alleles
+    :param record:
+    :return:
+    """
+    record_keys = []
+    for alt in record.alt.split(","):
+        if alt in (".", "*") or alt.startswith("<") or "[" in alt or "]" in alt:
+            continue
+        record_keys.extend(normalize_allele(record.chrom, int(record.pos), record.ref, alt))
+    return record_keys
+
+
+def is_pass(record):
+    return record.filter in ("PASS", ".")
+
+
+def load_variants(vcf_path):
+    """
+    Loads the normalized alleles of a VCF
+    :param vcf_path:
+    :return: Dictionary of (chrom, pos, ref, alt) to True if any record with the allele passed the filters
+    """
+    variants = {}
+    vcf_file = open_input_file(vcf_path)
+    for record in read_vcf_records(vcf_file):
+        record_pass = is_pass(record)
+        for variant_key in get_record_keys(record):
+            variants[variant_key] = variants.get(variant_key, False) or record_pass
+    vcf_file.close()
+    return variants
+
+
+def get_variant_type(variant_key):
+    if len(variant_key[2]) == 1 and len(variant_key[3]) == 1:
+        return "SNP"
+    return "INDEL"
+
+
+def get_ratio(numerator, denominator):
+    """
+    Returns the ratio rounded the same as hap.py, 0.0 if the denominator is 0
+    :param numerator:
+    :param denominator:
+    :return:
+    """
+    if denominator == 0:
+        return 0.0
+    return round(numerator / denominator, 6)
+
+
+def get_titv_ratio(variant_keys):
+    """
+    Returns the transition to transversion ratio of the SNPs as a string, empty if there are no transversions
+    :param variant_keys:
+    :return:
+    """
+    transition_count = 0
+    transversion_count = 0
+    for variant_key in variant_keys:
+        if (variant_key[2], variant_key[3]) in TRANSITIONS:
+            transition_count += 1
+        else:
+            transversion_count += 1
+    if transversion_count == 0:
+        return ""
+    return str(round(transition_count / transversion_count, 6))
+
+
+def get_summary_rows(truth_variants, query_variants):
+    """
+    Counts the truth and query alleles of each type. The ALL rows use every allele and the PASS rows
+    only the alleles that passed the filters in their VCF, in both the truth and the query
+    :param truth_variants: Dictionary from load_variants
+    :param query_variants: Dictionary from load_variants
+    :return: List of the summary.csv rows as lists of strings
+    """
+    summary_rows = []
+    for variant_type in VARIANT_TYPES:
+        for quality_filter in [FILTER_ALL, FILTER_PASS]:
+            truth_keys = {variant_key for variant_key, variant_pass in truth_variants.items()
+                          if get_variant_type(variant_key) == variant_type and
+                          (quality_filter == FILTER_ALL or variant_pass)}
+            query_keys = {variant_key for variant_key, variant_pass in query_variants.items()
+                          if get_variant_type(variant_key) == variant_type and
+                          (quality_filter == FILTER_ALL or variant_pass)}
+            true_positive = len(truth_keys & query_keys)
+            false_negative = len(truth_keys) - true_positive
+            false_positive = len(query_keys) - true_positive
+            recall = get_ratio(true_positive, true_positive + false_negative)
+            precision = get_ratio(true_positive, true_positive + false_positive)
+            f1_score = get_ratio(2 * true_positive, 2 * true_positive + false_positive + false_negative)
+            if variant_type == "SNP":
+                truth_titv_ratio = get_titv_ratio(truth_keys)
+                query_titv_ratio = get_titv_ratio(query_keys)
+            else:
+                truth_titv_ratio = ""
+                query_titv_ratio = ""
+            summary_rows.append([variant_type, quality_filter, str(len(truth_keys)), str(true_positive),
+                                 str(false_negative), str(len(query_keys)), str(false_positive), "0", "0",
+                                 str(recall), str(precision), "0.0", str(f1_score), truth_titv_ratio,
+                                 query_titv_ratio, "", ""])
+    return summary_rows
+
+
+def write_summary_file(summary_path, summary_rows):
+    summary_file = open(summary_path, "w")
+    summary_file.write(SUMMARY_HEADER + "\n")
+    for summary_row in summary_rows:
+        summary_file.write(",".join(summary_row) + "\n")
+    summary_file.close()
+
+
+def write_unmatched_records(vcf_path, other_variants, output_vcf_path):
+    """
+    Writes the header and the records with an allele that is not in other_variants to the output VCF.
+    The records are written as they are in the input VCF, so they keep the FORMAT values used by
+    parse_vcfs.py and match the sites of filter_false_sites.py exactly
+    :param vcf_path:
+    :param other_variants: Dictionary from load_variants of the other VCF
+    :param output_vcf_path:
+    :return: Number of records written
+    """
+    vcf_file = open_input_file(vcf_path)
+    output_vcf = open(output_vcf_path, "w")
+    record_count = 0
+    for record in read_vcf_records(vcf_file, header_callback=output_vcf.write):
+        for variant_key in get_record_keys(record):
+            if variant_key not in other_variants:
+                output_vcf.write("\t".join(record.line_item) + "\n")
+                record_count += 1
+                break
+    vcf_file.close()
+    output_vcf.close()
+    return record_count
+
+
+if __name__ == "__main__":
+    main()
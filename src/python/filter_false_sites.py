@@ -0,0 +1,136 @@
+#!/usr/bin/python3
+
+"""
+Script to subset the MGC VCF to the hap.py false positives and the CLC VCF to the hap.py
+false negatives, matching the sites on chromosome, position, ref and alt. The alleles of both sides are
+trimmed and the MNPs split into SNPs the same as compare_vcfs.py, because hap.py writes its output VCF
+after decomposing the records
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import argparse
+import os
+
+from bgzf import open_input_file
+from compare_vcfs import normalize_allele
+from metrics import RunMetrics, add_metrics_arguments
+from vcf_reader import read_vcf_records
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-p", dest="false_positive_vcf", required=True,
+        help="Full path to the false positive VCF from hap.py"
+    )
+    parser.add_argument(
+        "-n", dest="false_negative_vcf", required=True,
+        help="Full path to the false negative VCF from hap.py"
+    )
+    parser.add_argument(
+        "-m", dest="mgc_vcf", required=True,
+        help="Full path to the filtered MGC VCF"
+    )
+    parser.add_argument(
+        "-c", dest="clc_vcf", required=True,
+        help="Full path to the CLC VCF"
+    )
+    parser.add_argument(
+        "-s", dest="sample_name", required=True,
+        help="Sample name used for the result file names"
+    )
+    parser.add_argument(
+        "-o", dest="output_directory", required=True,
+        help="Full path to the output directory to save the filtered VCFs"
+    )
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    metrics = RunMetrics("filter_false_sites", args.metrics_path, args.cprofile_path)
+    metrics.labels["sample"] = args.sample_name
+
+    output_directory = os.path.normpath(args.output_directory)
+    sample_name = args.sample_name
+
+    # Filter the MGC VCF to the false positives
+    false_positive_vcf_path = output_directory + "/" + sample_name + "_MGC_false_positives.vcf"
+    with metrics.phase("filter_false_positives"):
+        false_positive_sites = load_sites(os.path.abspath(args.false_positive_vcf))
+        metrics.records_read += len(false_positive_sites)
+        filtered_count = filter_vcf(os.path.abspath(args.mgc_vcf), false_positive_sites, false_positive_vcf_path)
+    print("False positive records found in MGC VCF: " + str(filtered_count))
+    metrics.records_written += filtered_count
+
+    # Filter the CLC VCF to the false negatives
+    false_negative_vcf_path = output_directory + "/" + sample_name + "_CLC_false_negatives.vcf"
+    with metrics.phase("filter_false_negatives"):
+        false_negative_sites = load_sites(os.path.abspath(args.false_negative_vcf))
+        metrics.records_read += len(false_negative_sites)
+        filtered_count = filter_vcf(os.path.abspath(args.clc_vcf), false_negative_sites, false_negative_vcf_path)
+    print("False negative records found in CLC VCF: " + str(filtered_count))
+    metrics.records_written += filtered_count
+
+    for input_vcf in [args.false_positive_vcf, args.mgc_vcf, args.false_negative_vcf, args.clc_vcf]:
+        metrics.add_input(os.path.abspath(input_vcf))
+    metrics.add_output(false_positive_vcf_path)
+    metrics.add_output(false_negative_vcf_path)
+    metrics.finish()
+
+
+def get_site_keys(record):
+    """
+    Makes the normalized (chrom, pos, ref, alt) keys of every alt allele of the record, one for each
+    SNP of an MNP. Symbolic, missing and spanning deletion alleles are kept as they are
+    :param record:
+    :return:
+    """
+    pos = int(record.pos)
+    site_keys = []
+    for alt in record.alt.split(","):
+        if alt in (".", "*") or alt.startswith("<") or "[" in alt or "]" in alt:
+            site_keys.append((record.chrom, pos, record.ref.upper(), alt))
+        else:
+            site_keys.extend(normalize_allele(record.chrom, pos, record.ref, alt))
+    return site_keys
+
+
+def load_sites(vcf_path):
+    """
+    Loads the sites in the VCF into a set of (chrom, pos, ref, alt) keys
+    :param vcf_path:
+    :return:
+    """
+    sites = set()
+    vcf_file = open_input_file(vcf_path)
+    for record in read_vcf_records(vcf_file):
+        sites.update(get_site_keys(record))
+    vcf_file.close()
+    return sites
+
+
+def filter_vcf(vcf_path, sites, output_vcf_path):
+    """
+    Writes the header and the records that have any normalized allele in sites to the output VCF
+    :param vcf_path:
+    :param sites: Set of (chrom, pos, ref, alt) keys
+    :param output_vcf_path:
+    :return: Number of records written
+    """
+    vcf_file = open_input_file(vcf_path)
+    output_vcf = open(output_vcf_path, "w")
+    filtered_count = 0
+    for record in read_vcf_records(vcf_file, header_callback=output_vcf.write):
+        for site_key in get_site_keys(record):
+            if site_key in sites:
+                output_vcf.write("\t".join(record.line_item) + "\n")
+                filtered_count += 1
+                break
+    vcf_file.close()
+    output_vcf.close()
+    return filtered_count
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+#!/usr/bin/python3
+
+"""
+Script to run hap.py through a content addressed cache of its results. The cache key is a hash of
+the CLC VCF, the filtered MGC VCF, the reference and the hap.py command, so a comparison that was
+already run with the same inputs is copied from the cache instead of running hap.py again, and only
+the samples with changed inputs run hap.py. With --shards hap.py is run by sharded_happy.py
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import argparse
+import errno
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from bgzf import open_input_file
+from metrics import RunMetrics, add_metrics_arguments
+from pipeline_profile import DEFAULT_PROFILE, PYTHON_SCRIPT_DIR, load_profile
+
+
+CACHE_VERSION = 1
+DEFAULT_HAPPY_ARGS = "--engine=scmp-somatic"
+# Name of the hap.py output prefix inside a cache entry
+ENTRY_PREFIX = "happy"
+# Written last, so only complete entries are used
+ENTRY_KEY_FILE = "key.json"
+# Header lines that change between runs with the same variants
+VOLATILE_HEADER_PREFIXES = ("##fileDate", "##bcftools_", "##tabix_")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-t", dest="truth_vcf", required=True,
+        help="Full path to the truth VCF, the bgzipped CLC VCF"
+    )
+    parser.add_argument(
+        "-q", dest="query_vcf", required=True,
+        help="Full path to the query VCF, the filtered MGC VCF"
+    )
+    parser.add_argument(
+        "-o", dest="output_prefix", required=True,
+        help="Output prefix the same as hap.py -o"
+    )
+    parser.add_argument(
+        "-p", dest="profile_path", default=DEFAULT_PROFILE,
+        help="Full path to the pipeline profile for the defaults of -r, --happy, --python2 and --cache-dir, "
+             "default is config/compareVcf.profile"
+    )
+    parser.add_argument(
+        "-r", dest="reference",
+        help="Full path to the reference FASTA, default is REF_GENOME of the profile"
+    )
+    parser.add_argument(
+        "-a", "--happy-args", dest="happy_args", default=DEFAULT_HAPPY_ARGS,
+        help="Other arguments of hap.py as one string, default is " + DEFAULT_HAPPY_ARGS
+    )
+    parser.add_argument(
+        "--happy", dest="happy",
+        help="Full path to hap.py, default is HAPPY of the profile"
+    )
+    parser.add_argument(
+        "--python2", dest="python2_profile",
+        help="Full path to the python 2.7 PKG_PROFILE sourced before hap.py, default is PYTHON2710 of the profile"
+    )
+    parser.add_argument(
+        "--cache-dir", dest="cache_directory",
+        help="Directory of the cache, default is HAPPY_CACHE_DIR of the profile. hap.py is run without the "
+             "cache if it is empty"
+    )
+    parser.add_argument(
+        "-s", "--shards", dest="shard_count", type=int, default=1,
+        help="Run hap.py on this many shards of the VCFs at the same time with sharded_happy.py, default is 1"
+    )
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    metrics = RunMetrics("happy_cache", args.metrics_path, args.cprofile_path)
+
+    profile = load_profile(os.path.abspath(args.profile_path))
+    reference = args.reference if args.reference else profile["REF_GENOME"]
+    happy = args.happy if args.happy else profile["HAPPY"]
+    python2_profile = args.python2_profile if args.python2_profile is not None else profile.get("PYTHON2710", "")
+    cache_directory = args.cache_directory if args.cache_directory is not None else \
+        profile.get("HAPPY_CACHE_DIR", "")
+    truth_vcf_path = os.path.abspath(args.truth_vcf)
+    query_vcf_path = os.path.abspath(args.query_vcf)
+    output_prefix = os.path.abspath(args.output_prefix)
+    os.makedirs(os.path.dirname(output_prefix), exist_ok=True)
+    metrics.add_input(truth_vcf_path)
+    metrics.add_input(query_vcf_path)
+    if args.shard_count > 1:
+        # sharded_happy.py makes the same outputs, so it is used in place of hap.py
+        happy_runner = HappyRunner(happy, python2_profile, reference, args.happy_args, args.shard_count,
+                                   os.path.abspath(args.profile_path))
+    else:
+        happy_runner = HappyRunner(happy, python2_profile, reference, args.happy_args)
+
+    if not cache_directory:
+        print("No cache directory, running hap.py without the cache")
+        with metrics.phase("happy"):
+            exit_status = happy_runner.run(truth_vcf_path, query_vcf_path, output_prefix)
+        metrics.labels["cache"] = "disabled"
+        metrics.finish()
+        sys.exit(exit_status)
+
+    with metrics.phase("hash_inputs"):
+        key_items = get_key_items(truth_vcf_path, query_vcf_path, reference, happy, args.happy_args,
+                                  args.shard_count > 1)
+        cache_key = get_cache_key(key_items)
+    entry_directory = get_entry_directory(cache_directory, cache_key)
+    print("Cache key: " + cache_key)
+    metrics.labels["cache_key"] = cache_key
+
+    if os.path.isfile(entry_directory + "/" + ENTRY_KEY_FILE):
+        print("Using the cached hap.py results in " + entry_directory)
+        metrics.labels["cache"] = "hit"
+    else:
+        print("No cached hap.py results, running hap.py")
+        metrics.labels["cache"] = "miss"
+        with metrics.phase("happy"):
+            exit_status = add_cache_entry(cache_directory, entry_directory, key_items, happy_runner,
+                                          truth_vcf_path, query_vcf_path)
+        if exit_status != 0:
+            print("hap.py failed with exit status " + str(exit_status))
+            metrics.finish()
+            sys.exit(exit_status)
+
+    with metrics.phase("copy_results"):
+        output_path_list = copy_entry_results(entry_directory, output_prefix)
+    for output_path in output_path_list:
+        metrics.add_output(output_path)
+    metrics.records_written = len(output_path_list)
+    metrics.finish()
+
+
+def get_vcf_digest(vcf_path):
+    """
+    Hashes the lines of a VCF, plain or compressed, without the header lines that change between
+    runs with the same variants and without trailing whitespace
+    :param vcf_path:
+    :return: Hex digest
+    """
+    digest = hashlib.sha256()
+    vcf_file = open_input_file(vcf_path)
+    for line in vcf_file:
+        line = line.rstrip()
+        if not line or line.startswith(VOLATILE_HEADER_PREFIXES):
+            continue
+        digest.update(line.encode())
+        digest.update(b"\n")
+    vcf_file.close()
+    return digest.hexdigest()
+
+
+def get_reference_digest(reference):
+    """
+    Hashes the identity of the reference from its .fai index, which has the name, length and offset
+    of every contig, so the FASTA itself is not read. Without an index the path and size are used
+    :param reference:
+    :return: Hex digest
+    """
+    digest = hashlib.sha256()
+    fai_path = reference + ".fai"
+    if os.path.isfile(fai_path):
+        fai_file = open(fai_path, "rb")
+        digest.update(fai_file.read())
+        fai_file.close()
+    else:
+        digest.update(os.path.abspath(reference).encode())
+    digest.update(str(os.path.getsize(reference)).encode())
+    return digest.hexdigest()
+
+
+def get_key_items(truth_vcf_path, query_vcf_path, reference, happy, happy_args, sharded=False):
+    """
+    Makes the items the cache key is computed from, saved with the entry to show what it was made from
+    :param truth_vcf_path:
+    :param query_vcf_path:
+    :param reference:
+    :param happy:
+    :param happy_args:
+    :param sharded: The results are made by sharded_happy.py, which has the same counts but not all
+    the outputs of hap.py, so they are kept apart from the results of a single hap.py run
+    :return: Dictionary of the key items
+    """
+    return {
+        "version": CACHE_VERSION,
+        "truth_vcf": get_vcf_digest(truth_vcf_path),
+        "query_vcf": get_vcf_digest(query_vcf_path),
+        "reference": get_reference_digest(reference),
+        "happy": happy,
+        "happy_args": happy_args.split(),
+        "sharded": sharded
+    }
+
+
+def get_cache_key(key_items):
+    return hashlib.sha256(json.dumps(key_items, sort_keys=True).encode()).hexdigest()
+
+
+def get_entry_directory(cache_directory, cache_key):
+    # The first two characters are a subdirectory so a large cache does not make one huge directory
+    return os.path.abspath(cache_directory) + "/" + cache_key[:2] + "/" + cache_key
+
+
+def get_happy_command(happy, python2_profile, truth_vcf_path, query_vcf_path, output_prefix, reference, happy_args):
+    """
+    Makes the bash command that runs hap.py after sourcing python 2.7. The paths are quoted, happy_args
+    is added as it is so it can hold several options
+    :param happy:
+    :param python2_profile: PKG_PROFILE to source, nothing is sourced if it is empty
+    :param truth_vcf_path:
+    :param query_vcf_path:
+    :param output_prefix:
+    :param reference:
+    :param happy_args:
+    :return:
+    """
+    command = shlex.quote(happy) + " " + shlex.quote(truth_vcf_path) + " " + shlex.quote(query_vcf_path) + \
+        " -o " + shlex.quote(output_prefix) + " -r " + shlex.quote(reference) + " " + happy_args
+    if python2_profile:
+        command = "source " + shlex.quote(python2_profile) + " && " + command
+    return command
+
+
+class HappyRunner(object):
+    """
+    Runs hap.py on a truth and query VCF, either once or with sharded_happy.py if shard_count is more than 1
+    """
+
+    def __init__(self, happy, python2_profile, reference, happy_args, shard_count=1, profile_path=DEFAULT_PROFILE):
+        self.happy = happy
+        self.python2_profile = python2_profile
+        self.reference = reference
+        self.happy_args = happy_args
+        self.shard_count = shard_count
+        self.profile_path = profile_path
+
+    def get_command(self, truth_vcf_path, query_vcf_path, output_prefix):
+        if self.shard_count > 1:
+            return shlex.quote(sys.executable) + " " + shlex.quote(PYTHON_SCRIPT_DIR + "/sharded_happy.py") + \
+                " -t " + shlex.quote(truth_vcf_path) + " -q " + shlex.quote(query_vcf_path) + \
+                " -o " + shlex.quote(output_prefix) + " -s " + str(self.shard_count) + \
+                " -p " + shlex.quote(self.profile_path) + " -r " + shlex.quote(self.reference) + \
+                " --happy " + shlex.quote(self.happy) + " --python2 " + shlex.quote(self.python2_profile) + \
+                " --happy-args=" + shlex.quote(self.happy_args)
+        return get_happy_command(self.happy, self.python2_profile, truth_vcf_path, query_vcf_path, output_prefix,
+                                 self.reference, self.happy_args)
+
+    def run(self, truth_vcf_path, query_vcf_path, output_prefix):
+        """
+        Runs the command in bash
+        :param truth_vcf_path:
+        :param query_vcf_path:
+        :param output_prefix:
+        :return: Exit status of the command
+        """
+        command = self.get_command(truth_vcf_path, query_vcf_path, output_prefix)
+        print("Executing command: " + command)
+        sys.stdout.flush()
+        return subprocess.call(["bash", "-c", "set -o errexit -o pipefail; " + command])
+
+
+def add_cache_entry(cache_directory, entry_directory, key_items, happy_runner, truth_vcf_path, query_vcf_path):
+    """
+    Runs hap.py in a temporary directory of the cache and moves it in place as the entry once it has
+    succeeded, so a failed or interrupted run never leaves an entry behind
+    :param cache_directory:
+    :param entry_directory:
+    :param key_items:
+    :param happy_runner: HappyRunner
+    :param truth_vcf_path:
+    :param query_vcf_path:
+    :return: Exit status of hap.py
+    """
+    os.makedirs(os.path.dirname(entry_directory), exist_ok=True)
+    run_directory = tempfile.mkdtemp(prefix="happy_run_", dir=cache_directory)
+    try:
+        exit_status = happy_runner.run(truth_vcf_path, query_vcf_path, run_directory + "/" + ENTRY_PREFIX)
+        if exit_status != 0:
+            return exit_status
+        key_file = open(run_directory + "/" + ENTRY_KEY_FILE, "w")
+        json.dump(key_items, key_file, sort_keys=True, indent=2)
+        key_file.close()
+        if os.path.isdir(entry_directory):
+            # Added by a concurrent run with the same inputs
+            return 0
+        try:
+            os.rename(run_directory, entry_directory)
+        except OSError as error:
+            # A concurrent run with the same inputs renamed its entry in place after the check above,
+            # rename fails with ENOTEMPTY or EEXIST and the complete entry of that run is used
+            if error.errno not in (errno.ENOTEMPTY, errno.EEXIST) or \
+                    not os.path.isfile(entry_directory + "/" + ENTRY_KEY_FILE):
+                raise
+    finally:
+        if os.path.isdir(run_directory):
+            shutil.rmtree(run_directory)
+    return 0
+
+
+def copy_entry_results(entry_directory, output_prefix):
+    """
+    Copies the hap.py outputs of a cache entry to the output prefix, {entry}/happy.summary.csv is
+    copied to {prefix}.summary.csv and so on
+    :param entry_directory:
+    :param output_prefix:
+    :return: List of the copied output paths
+    """
+    output_path_list = []
+    for file_name in sorted(os.listdir(entry_directory)):
+        if not file_name.startswith(ENTRY_PREFIX + "."):
+            continue
+        output_path = output_prefix + file_name[len(ENTRY_PREFIX):]
+        shutil.copyfile(entry_directory + "/" + file_name, output_path)
+        output_path_list.append(output_path)
+    return output_path_list
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+#!/usr/bin/python3
+
+"""
+Executors that run the bash commands of the pipeline either on the grid with qsub or on the local
+server. The local executor queues the jobs and starts them when their declared memory and CPUs fit in
+the budget of the server, so many jobs can be packed on a node without a scheduler. Both executors
+retry failed jobs and collect the exit status of every job.
+Run as a script to execute a single command or a file of jobs
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import argparse
+import collections
+import concurrent.futures
+import os
+import shlex
+import subprocess
+import sys
+import threading
+import time
+
+from pipeline_profile import DEFAULT_PROFILE, load_profile
+
+
+EXECUTOR_LOCAL = "local"
+EXECUTOR_GRID = "grid"
+DEFAULT_JOB_MEMORY_MB = 2048
+DEFAULT_JOB_CPUS = 1
+
+
+class Job(object):
+    """
+    A bash command with the memory and CPUs it needs. The output of the command is appended to log_path
+    """
+
+    def __init__(self, name, command, memory_mb=DEFAULT_JOB_MEMORY_MB, cpus=DEFAULT_JOB_CPUS, log_path=None,
+                 working_directory=None):
+        self.name = name
+        self.command = command
+        self.memory_mb = memory_mb
+        self.cpus = cpus
+        self.log_path = log_path
+        self.working_directory = working_directory
+
+
+class JobResult(object):
+
+    def __init__(self, name, exit_status, attempts, seconds):
+        self.name = name
+        self.exit_status = exit_status
+        self.attempts = attempts
+        self.seconds = seconds
+
+
+def add_executor_arguments(parser):
+    """
+    Adds the options to choose and configure the executor to the argument parser of a script
+    :param parser:
+    :return:
+    """
+    parser.add_argument(
+        "--executor", dest="executor", choices=[EXECUTOR_LOCAL, EXECUTOR_GRID], default=EXECUTOR_LOCAL,
+        help="Run the jobs on this server or submit them to the grid with qsub, default is local"
+    )
+    parser.add_argument(
+        "--max-memory-mb", dest="max_memory_mb", type=int,
+        help="Memory budget of the local executor in MB, default is the physical memory of the server"
+    )
+    parser.add_argument(
+        "--max-cpus", dest="max_cpus", type=int,
+        help="CPU budget of the local executor, default is the number of CPUs of the server"
+    )
+    parser.add_argument(
+        "--retries", dest="retries", type=int, default=0,
+        help="Number of times a failed job is run again, default is 0"
+    )
+
+
+def make_executor(args, profile, sync=True):
+    """
+    Makes the executor chosen with the options of add_executor_arguments
+    :param args:
+    :param profile: Dictionary of the pipeline profile, used for the qsub settings
+    :param sync: Wait for the grid jobs to finish, needed by the callers that use the exit status of the jobs
+    :return: LocalExecutor or GridExecutor
+    """
+    if args.executor == EXECUTOR_GRID:
+        return GridExecutor(profile, args.retries, sync)
+    return LocalExecutor(args.max_memory_mb, args.max_cpus, args.retries)
+
+
+def get_physical_memory_mb():
+    return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+
+
+class Executor(object):
+    """
+    Runs jobs with retries and keeps their results. Subclasses implement _run_attempt
+    """
+
+    def __init__(self, retries=0):
+        self.retries = retries
+        self.results = []
+        self._results_lock = threading.Lock()
+
+    def _run_attempt(self, job, log_file):
+        raise NotImplementedError
+
+    def get_max_workers(self, job_list):
+        """
+        Gets the number of threads to run the jobs with, one per job unless the executor limits how
+        many jobs run at the same time
+        :param job_list:
+        :return:
+        """
+        return len(job_list)
+
+    def run_job(self, job):
+        """
+        Runs a job until it succeeds or runs out of retries, blocking until it is done
+        :param job:
+        :return: JobResult
+        """
+        start_time = time.time()
+        attempts = 0
+        exit_status = None
+        while attempts <= self.retries:
+            attempts += 1
+            log_file = open(job.log_path, "a") if job.log_path else None
+            if attempts > 1 and log_file is not None:
+                log_file.write("Retrying " + job.name + ", attempt " + str(attempts) + "\n")
+                log_file.flush()
+            try:
+                exit_status = self._run_attempt(job, log_file)
+            finally:
+                if log_file is not None:
+                    log_file.close()
+            if exit_status == 0:
+                break
+        result = JobResult(job.name, exit_status, attempts, round(time.time() - start_time, 3))
+        with self._results_lock:
+            self.results.append(result)
+        return result
+
+    def run_jobs(self, job_list):
+        """
+        Runs the jobs concurrently, the executor decides how many run at the same time
+        :param job_list:
+        :return: List of JobResult in the order of job_list
+        """
+        if not job_list:
+            return []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.get_max_workers(job_list)) as thread_executor:
+            return list(thread_executor.map(self.run_job, job_list))
+
+
+class LocalExecutor(Executor):
+    """
+    Runs the jobs on this server. A job waits in a first in, first out queue until its memory and CPUs
+    fit in what the running jobs leave of the budget. A job larger than the whole budget runs alone
+    """
+
+    def __init__(self, max_memory_mb=None, max_cpus=None, retries=0):
+        super().__init__(retries)
+        self.max_memory_mb = max_memory_mb if max_memory_mb else get_physical_memory_mb()
+        self.max_cpus = max_cpus if max_cpus else (os.cpu_count() or 1)
+        self._used_memory_mb = 0
+        self._used_cpus = 0
+        self._running_count = 0
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+
+    def get_max_workers(self, job_list):
+        """
+        Gets the most jobs that can fit in the budget at the same time, from the smallest memory and CPUs
+        of the jobs, so no thread is started only to wait for the budget
+        :param job_list:
+        :return:
+        """
+        smallest_memory_mb = max(min([job.memory_mb for job in job_list]), 1)
+        smallest_cpus = max(min([job.cpus for job in job_list]), 1)
+        return max(min(len(job_list), self.max_memory_mb // smallest_memory_mb, self.max_cpus // smallest_cpus), 1)
+
+    def _fits(self, job):
+        if self._running_count == 0:
+            return True
+        return (self._used_memory_mb + job.memory_mb <= self.max_memory_mb and
+                self._used_cpus + job.cpus <= self.max_cpus)
+
+    def _acquire(self, job):
+        ticket = object()
+        with self._condition:
+            self._queue.append(ticket)
+            while self._queue[0] is not ticket or not self._fits(job):
+                self._condition.wait()
+            self._queue.popleft()
+            self._used_memory_mb += job.memory_mb
+            self._used_cpus += job.cpus
+            self._running_count += 1
+            # The next job in the queue may also fit
+            self._condition.notify_all()
+
+    def _release(self, job):
+        with self._condition:
+            self._used_memory_mb -= job.memory_mb
+            self._used_cpus -= job.cpus
+            self._running_count -= 1
+            self._condition.notify_all()
+
+    def _run_attempt(self, job, log_file):
+        self._acquire(job)
+        try:
+            return subprocess.call(["bash", "-c", job.command], cwd=job.working_directory,
+                                   stdout=log_file, stderr=subprocess.STDOUT if log_file is not None else None)
+        finally:
+            self._release(job)
+
+
+class GridExecutor(Executor):
+    """
+    Submits the jobs with qsub. With sync the jobs are submitted with -sync y, so qsub waits for the job
+    and returns its exit status, otherwise qsub returns once the job is submitted and the exit status
+    is the one of the submission. The queue, email and parallel environment come from the QSUB_QUEUE,
+    QSUB_EMAIL and QSUB_PARALLEL_ENVIRONMENT settings of the profile
+    """
+
+    def __init__(self, profile, retries=0, sync=True):
+        super().__init__(retries)
+        self.sync = sync
+        self.qsub = profile["QSUB"]
+        self.queue = profile.get("QSUB_QUEUE", "")
+        self.email = profile.get("QSUB_EMAIL", "")
+        self.parallel_environment = profile.get("QSUB_PARALLEL_ENVIRONMENT", "")
+        self.log_directory = profile.get("LOG_DIR", "")
+
+    def get_qsub_arguments(self, job):
+        """
+        Makes the qsub arguments of a job
+        :param job:
+        :return: List of arguments
+        """
+        # The command of a binary job is run by the shell of the execution host, so it is quoted
+        qsub_arguments = [self.qsub]
+        if self.sync:
+            qsub_arguments.extend(["-sync", "y"])
+        qsub_arguments.extend(["-b", "y", "-shell", "y", "-V", "-N", job.name, "-l",
+                               "h_vmem=" + str(job.memory_mb) + "M", "-j", "y"])
+        if self.queue:
+            qsub_arguments.extend(["-q", self.queue])
+        if self.email:
+            qsub_arguments.extend(["-m", "a", "-M", self.email])
+        if self.parallel_environment and job.cpus > 1:
+            qsub_arguments.extend(["-pe", self.parallel_environment, str(job.cpus)])
+        if job.working_directory:
+            qsub_arguments.extend(["-wd", job.working_directory])
+        else:
+            qsub_arguments.append("-cwd")
+        if job.log_path:
+            qsub_arguments.extend(["-o", job.log_path])
+        elif self.log_directory:
+            qsub_arguments.extend(["-o", self.log_directory])
+        qsub_arguments.extend(["bash", "-c", shlex.quote(job.command)])
+        return qsub_arguments
+
+    def _run_attempt(self, job, log_file):
+        # The log file is written by the grid engine, qsub only reports the submission
+        return subprocess.call(self.get_qsub_arguments(job), stdout=subprocess.DEVNULL)
+
+
+def read_job_file(job_file_path):
+    """
+    Reads a tab separated file of jobs with the name, memory in MB, CPUs and command on each line
+    :param job_file_path:
+    :return: List of Job
+    """
+    job_list = []
+    job_file = open(job_file_path, "r")
+    for line in job_file:
+        if not line.strip() or line.startswith("#"):
+            continue
+        name, memory_mb, cpus, command = line.rstrip("\n").split("\t", 3)
+        job_list.append(Job(name, command, int(memory_mb), int(cpus)))
+    job_file.close()
+    return job_list
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c", dest="command",
+        help="Bash command to run as a single job"
+    )
+    parser.add_argument(
+        "-f", dest="job_file",
+        help="Full path to a tab separated file of jobs with the name, memory in MB, CPUs and command on each line"
+    )
+    parser.add_argument(
+        "-n", "--name", dest="name", default="job",
+        help="Name of the job given with -c, default is job"
+    )
+    parser.add_argument(
+        "--memory-mb", dest="memory_mb", type=int, default=DEFAULT_JOB_MEMORY_MB,
+        help="Memory of the job given with -c in MB, default is " + str(DEFAULT_JOB_MEMORY_MB)
+    )
+    parser.add_argument(
+        "--cpus", dest="cpus", type=int, default=DEFAULT_JOB_CPUS,
+        help="CPUs of the job given with -c, default is " + str(DEFAULT_JOB_CPUS)
+    )
+    parser.add_argument(
+        "-l", dest="log_directory",
+        help="Directory to save the output of each job as {name}.log, default is the standard output"
+    )
+    parser.add_argument(
+        "-p", dest="profile_path", default=DEFAULT_PROFILE,
+        help="Full path to the pipeline profile, default is config/compareVcf.profile"
+    )
+    parser.add_argument(
+        "--sync", dest="sync", action="store_true",
+        help="Wait for the grid jobs to finish and report their exit status, by default qsub returns once "
+             "the jobs are submitted and the exit status is the one of the submission"
+    )
+    add_executor_arguments(parser)
+
+    args = parser.parse_args()
+    if bool(args.command) == bool(args.job_file):
+        parser.error("Specify either -c or -f")
+
+    if args.command:
+        job_list = [Job(args.name, args.command, args.memory_mb, args.cpus)]
+    else:
+        job_list = read_job_file(args.job_file)
+    if args.log_directory:
+        log_directory = os.path.abspath(args.log_directory)
+        os.makedirs(log_directory, exist_ok=True)
+        for job in job_list:
+            job.log_path = log_directory + "/" + job.name + ".log"
+
+    executor = make_executor(args, load_profile(os.path.abspath(args.profile_path)), args.sync)
+    result_list = executor.run_jobs(job_list)
+    print("Job\tExit status\tAttempts\tSeconds")
+    for result in result_list:
+        print(result.name + "\t" + str(result.exit_status) + "\t" + str(result.attempts) + "\t" + str(result.seconds))
+    if any([result.exit_status != 0 for result in result_list]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,37 +8,158 @@ __author__ = "Yuta Sakai"
 
 
 import argparse
+import array
 import os
 
+from metrics import RunMetrics, add_metrics_arguments
+from tabix import add_region_arguments, get_regions, open_vcf
+from vcf_reader import read_vcf_records, chromosome_sort_key
+
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "-i", dest="input_vcf", required=True,
-        help="Full path to the vcf file"
+        "-i", dest="input_vcf", required=True, nargs="+",
+        help="Full path to the vcf file, multiple vcf files can be given"
     )
     parser.add_argument(
         "-o", dest="output_directory", required=True,
         help="Full path to the output directory to save the converted bed file"
     )
+    parser.add_argument(
+        "--sorted-merged", dest="sorted_merged", action="store_true",
+        help="Sort and merge the overlapping regions of all input vcf files into a single BED file"
+    )
+    parser.add_argument(
+        "-n", dest="output_name",
+        help="Name used for the sorted and merged BED file, default is the sample name of the vcf file "
+             "or \"cohort\" if multiple vcf files are given"
+    )
+    add_region_arguments(parser)
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    metrics = RunMetrics("make_bed_from_vcf", args.metrics_path, args.cprofile_path)
+    regions = get_regions(args, parser)
 
-    input_file_path = os.path.abspath(args.input_vcf)
+    input_file_paths = [os.path.abspath(input_vcf) for input_vcf in args.input_vcf]
     output_directory = os.path.normpath(args.output_directory)
 
-    # Get the sample name from the file name
-    sample_name = os.path.basename(input_file_path).split("_")[0]
-    print(sample_name)
-
-    vcf_file = open(input_file_path, "r")
-    bed_file = open(output_directory + "/" + sample_name + "_false_positive.bed", "w")
+    if args.sorted_merged:
+        if args.output_name:
+            output_name = args.output_name
+        elif len(input_file_paths) == 1:
+            output_name = get_sample_name(input_file_paths[0])
+        else:
+            output_name = "cohort"
+        print(output_name)
+        # Collect the regions from all vcf files
+        interval_dict = {}
+        with metrics.phase("collect_intervals"):
+            for input_file_path in input_file_paths:
+                vcf_file = open_vcf(input_file_path, regions)
+                collect_intervals(vcf_file, interval_dict)
+                vcf_file.close()
+                metrics.add_input(input_file_path)
+        metrics.records_read = sum([len(start_positions) for start_positions, _ in interval_dict.values()])
+        bed_file_path = output_directory + "/" + output_name + "_false_positive_sorted_merged.bed"
+        bed_file = open(bed_file_path, "w")
+        with metrics.phase("sort_merge"):
+            metrics.records_written = write_sorted_merged_bed(bed_file, interval_dict)
+        bed_file.close()
+        metrics.add_output(bed_file_path)
+    else:
+        for input_file_path in input_file_paths:
+            sample_name = get_sample_name(input_file_path)
+            print(sample_name)
+
+            vcf_file = open_vcf(input_file_path, regions)
+            bed_file_path = output_directory + "/" + sample_name + "_false_positive.bed"
+            bed_file = open(bed_file_path, "w")
+
+            # Parse the vcf file and make it into a bed file
+            with metrics.phase("make_bed:" + sample_name):
+                record_count = make_bed_from_vcf(bed_file, vcf_file)
+            metrics.records_read += record_count
+            metrics.records_written += record_count
+            metrics.add_input(input_file_path)
+            metrics.add_output(bed_file_path)
+
+            vcf_file.close()
+            bed_file.close()
+    metrics.finish()
+
+
+def get_sample_name(input_file_path):
+    """
+    Get the sample name from the file name
+    :param input_file_path:
+    :return:
+    """
+    return os.path.basename(input_file_path).split("_")[0]
 
-    # Parse the vcf file and make it into a bed file
-    make_bed_from_vcf(bed_file, vcf_file)
 
-    vcf_file.close()
-    bed_file.close()
+def get_bed_interval(record):
+    """
+    Makes the 0 based BED start and stop positions of a VCF record
+    :param record:
+    :return: bed_start_position, bed_stop_position
+    """
+    # Make the bed start position 0 based
+    bed_start_position = int(record.pos) - 1
+    # The end region should be the length of REF or ALT, whichever one is longer
+    # If they are the same length, take the REF length
+    if len(record.ref) >= len(record.alt):
+        bed_stop_position = bed_start_position + len(record.ref)
+    else:
+        bed_stop_position = bed_start_position + len(record.alt)
+    return bed_start_position, bed_stop_position
+
+
+def collect_intervals(vcf_file, interval_dict):
+    """
+    Adds the BED intervals of the vcf file to interval_dict, which holds a pair of
+    start and stop position arrays per chromosome
+    :param vcf_file:
+    :param interval_dict:
+    :return:
+    """
+    for record in read_vcf_records(vcf_file):
+        if not record.chrom.startswith("chr"):
+            continue
+        if record.chrom not in interval_dict:
+            interval_dict[record.chrom] = (array.array("l"), array.array("l"))
+        start_positions, stop_positions = interval_dict[record.chrom]
+        bed_start_position, bed_stop_position = get_bed_interval(record)
+        start_positions.append(bed_start_position)
+        stop_positions.append(bed_stop_position)
+
+
+def write_sorted_merged_bed(bed_file, interval_dict):
+    """
+    Sorts the intervals in natural chromosome order and merges the overlapping and adjacent intervals,
+    same as sort -k1,1 -k2,2n followed by bedtools merge
+    :param bed_file:
+    :param interval_dict:
+    :return: Number of merged intervals written
+    """
+    interval_count = 0
+    for chrom in sorted(interval_dict.keys(), key=chromosome_sort_key):
+        start_positions, stop_positions = interval_dict[chrom]
+        sorted_index = sorted(range(len(start_positions)), key=start_positions.__getitem__)
+        merged_start = start_positions[sorted_index[0]]
+        merged_stop = stop_positions[sorted_index[0]]
+        for index in sorted_index[1:]:
+            if start_positions[index] <= merged_stop:
+                merged_stop = max(merged_stop, stop_positions[index])
+            else:
+                bed_file.write(chrom + "\t" + str(merged_start) + "\t" + str(merged_stop) + "\n")
+                interval_count += 1
+                merged_start = start_positions[index]
+                merged_stop = stop_positions[index]
+        bed_file.write(chrom + "\t" + str(merged_start) + "\t" + str(merged_stop) + "\n")
+        interval_count += 1
+    return interval_count
 
 
 def make_bed_from_vcf(bed_file, vcf_file):
@@ -46,31 +167,19 @@ def make_bed_from_vcf(bed_file, vcf_file):
     Parses out the vcf file and makes it into a 0 based BED file
     :param bed_file:
     :param vcf_file:
-    :return:
+    :return: Number of records written
     """
-    for line in vcf_file:
-        # Get header information
-        if line.startswith("#CHROM"):
-            line = line.rstrip()
-            header_items = line.split("\t")
-        elif line.startswith("chr"):
-            line = line.rstrip()
-            line_item = line.split("\t")
-            chrom = line_item[header_items.index("#CHROM")]
-            position = line_item[header_items.index("POS")]
-            ref = line_item[header_items.index("REF")]
-            alt = line_item[header_items.index("ALT")]
-            # Make the bed start position 0 based
-            bed_start_position = int(position) - 1
-            # The end region should be the length of REF or ALT, whichever one is longer
-            # If they are the same length, take the REF length
-            if len(ref) >= len(alt):
-                bed_stop_position = bed_start_position + len(ref)
-            else:
-                bed_stop_position = bed_start_position + len(alt)
-            # write out the result to the bed file
-            result_to_write = [chrom, str(bed_start_position), str(bed_stop_position)]
-            bed_file.write("\t".join(result_to_write) + "\n")
+    record_count = 0
+    for record in read_vcf_records(vcf_file):
+        # Only the records on the chr contigs are written, the same as before the shared reader
+        if not record.chrom.startswith("chr"):
+            continue
+        bed_start_position, bed_stop_position = get_bed_interval(record)
+        # write out the result to the bed file
+        result_to_write = [record.chrom, str(bed_start_position), str(bed_stop_position)]
+        bed_file.write("\t".join(result_to_write) + "\n")
+        record_count += 1
+    return record_count
 
 
 if __name__ == "__main__":
@@ -10,6 +10,8 @@ __author__ = "Yuta Sakai"
 import argparse
 import os
 
+from metrics import RunMetrics, add_metrics_arguments
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -21,8 +23,10 @@ def main():
         "-o", dest="output_directory", required=True,
         help="Full path to the directory to save files"
     )
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    metrics = RunMetrics("make_cdna_variant_file", args.metrics_path, args.cprofile_path)
 
     input_file = os.path.abspath(args.input_file)
     output_directory = os.path.normpath(args.output_directory)
@@ -34,12 +38,19 @@ def main():
     accuracy_result_dict = {}
 
     # Parse the accuracy result file
-    parse_accuracy_result_file(accuracy_result_dict, accuracy_result_file)
+    with metrics.phase("parse_accuracy_file"):
+        parse_accuracy_result_file(accuracy_result_dict, metrics.count_read(accuracy_result_file))
+    metrics.add_input(input_file)
 
     # Make individual sample files with cDNA positions
-    make_cdna_position_file(accuracy_result_dict, output_directory)
+    with metrics.phase("write_results"):
+        make_cdna_position_file(accuracy_result_dict, output_directory)
+    for sample in accuracy_result_dict.keys():
+        metrics.add_output(output_directory + "/" + sample + "_cdna_variants")
+        metrics.records_written += len(accuracy_result_dict[sample])
 
     accuracy_result_file.close()
+    metrics.finish()
 
 
 def make_cdna_position_file(accuracy_result_dict, output_directory):
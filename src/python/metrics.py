@@ -0,0 +1,146 @@
+#!/usr/bin/python3
+
+"""
+Instrumentation shared by the scripts: per phase wall time, records read and written, bytes of I/O
+and peak RSS, appended as a JSON line to the file given with --metrics-out, and an optional cProfile
+dump given with --profile
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import contextlib
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+
+
+def add_metrics_arguments(parser):
+    """
+    Adds the --metrics-out and --profile options to the argument parser of a script
+    :param parser:
+    :return:
+    """
+    parser.add_argument(
+        "--metrics-out", dest="metrics_path",
+        help="Full path to a file to append the run metrics to as a JSON line"
+    )
+    parser.add_argument(
+        "--profile", dest="cprofile_path",
+        help="Full path to save a cProfile dump of the run, readable with the pstats module"
+    )
+
+
+def get_peak_rss_mb(who=resource.RUSAGE_SELF):
+    """
+    Returns the peak resident set size in MB
+    :param who: resource.RUSAGE_SELF or resource.RUSAGE_CHILDREN
+    :return:
+    """
+    peak_rss = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    if sys.platform == "darwin":
+        peak_rss = peak_rss / 1024
+    return round(peak_rss / 1024, 1)
+
+
+class RunMetrics(object):
+    """
+    Metrics of a script run. The profiler starts when the object is made and the metrics are
+    written by finish()
+    """
+
+    def __init__(self, script_name, metrics_path=None, cprofile_path=None):
+        self.script_name = script_name
+        self.metrics_path = metrics_path
+        self.cprofile_path = cprofile_path
+        self.labels = {}
+        self.phases = []
+        self.records_read = 0
+        self.records_written = 0
+        self.input_paths = []
+        self.output_paths = []
+        self.start_timestamp = time.time()
+        self.start_time = time.perf_counter()
+        self.profiler = None
+        if cprofile_path:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    @contextlib.contextmanager
+    def phase(self, phase_name):
+        """
+        Times the code run inside the with block as a phase of the run
+        :param phase_name:
+        :return:
+        """
+        phase_start_time = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.add_phase_time(phase_name, time.perf_counter() - phase_start_time)
+
+    def add_phase_time(self, phase_name, seconds):
+        self.phases.append({"name": phase_name, "seconds": round(seconds, 4)})
+
+    def add_input(self, file_path):
+        """
+        Adds a file read by the run, its size is counted in bytes_read
+        :param file_path:
+        :return:
+        """
+        self.input_paths.append(file_path)
+
+    def add_output(self, file_path):
+        """
+        Adds a file written by the run, its size when the run finishes is counted in bytes_written
+        :param file_path:
+        :return:
+        """
+        self.output_paths.append(file_path)
+
+    def count_read(self, records):
+        """
+        Yields the records of an iterable and counts them in records_read
+        :param records:
+        :return:
+        """
+        for record in records:
+            self.records_read += 1
+            yield record
+
+    def to_dict(self):
+        wall_seconds = time.perf_counter() - self.start_time
+        return {
+            "script": self.script_name,
+            "start_time": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.start_timestamp)),
+            "argv": sys.argv[1:],
+            "labels": self.labels,
+            "wall_seconds": round(wall_seconds, 4),
+            "phases": self.phases,
+            "records_read": self.records_read,
+            "records_written": self.records_written,
+            "records_per_second": round(self.records_read / wall_seconds, 1) if wall_seconds > 0 else None,
+            "bytes_read": sum([os.path.getsize(path) for path in self.input_paths if os.path.isfile(path)]),
+            "bytes_written": sum([os.path.getsize(path) for path in self.output_paths if os.path.isfile(path)]),
+            "peak_rss_mb": get_peak_rss_mb(),
+            "peak_children_rss_mb": get_peak_rss_mb(resource.RUSAGE_CHILDREN)
+        }
+
+    def finish(self):
+        """
+        Stops the profiler and saves its dump, and appends the metrics to the metrics file
+        :return: Dictionary of the metrics
+        """
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.dump_stats(self.cprofile_path)
+        metrics_dict = self.to_dict()
+        if self.metrics_path:
+            metrics_file = open(self.metrics_path, "a")
+            metrics_file.write(json.dumps(metrics_dict, sort_keys=True) + "\n")
+            metrics_file.close()
+        return metrics_dict
@@ -10,6 +10,14 @@ __author__ = "Yuta Sakai"
 import argparse
 import os
 
+from bgzf import open_input_file, INDEX_EXTENSIONS
+from metrics import RunMetrics, add_metrics_arguments
+from vcf_reader import read_vcf_records, get_allele_depth, parse_info
+
+
+# Number of leading characters of a CLC cDNA variant used as its key in CdnaVariantIndex
+GRAM_LENGTH = 4
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -25,28 +33,37 @@ def main():
         "-o", dest="output_directory", required=True,
         help="Full path to directory to save the result file"
     )
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    metrics = RunMetrics("parse_accuracy_results", args.metrics_path, args.cprofile_path)
 
     input_directory = os.path.normpath(args.input_directory)
     accuracy_file_path = os.path.abspath(args.accuracy_file_path)
     output_directory = os.path.normpath(args.output_directory)
 
     # Open accuracy file and skip the header
-    accuracy_file = open(accuracy_file_path, "r")
+    accuracy_file = open_input_file(accuracy_file_path)
     accuracy_file.readline()
 
     accuracy_result_dict = {}
 
     # Parse the accuracy file to gather CLC reported variant info
-    parse_accuracy_file(accuracy_file, accuracy_result_dict)
+    with metrics.phase("parse_accuracy_file"):
+        parse_accuracy_file(metrics.count_read(accuracy_file), accuracy_result_dict)
     accuracy_file.close()
+    metrics.add_input(accuracy_file_path)
 
     # Parse the MGC VCFs to gather MGC reported variant info
-    parse_mgc_vcf(accuracy_result_dict, input_directory)
+    with metrics.phase("parse_mgc_vcfs"):
+        parse_mgc_vcf(accuracy_result_dict, input_directory, metrics)
 
     # Write the result out to a file
-    make_result_file(accuracy_result_dict, output_directory)
+    with metrics.phase("write_results"):
+        make_result_file(accuracy_result_dict, output_directory)
+    metrics.add_output(output_directory + "/parsed_accuracy_results.txt")
+    metrics.records_written = sum([len(clc_result_dict) for clc_result_dict in accuracy_result_dict.values()])
+    metrics.finish()
 
 
 def make_result_file(accuracy_result_dict, output_directory):
@@ -90,47 +107,95 @@ def write_result(dict, key_string, file):
         file.write("NA\t")
 
 
-def parse_mgc_vcf(accuracy_result_dict, input_directory):
+class CdnaVariantIndex(object):
+    """
+    Index of the CLC cDNA variants of a sample. A CLC variant matches every MGC cDNA variant it is a
+    substring of, regardless of the gene. The variants are indexed by their first GRAM_LENGTH
+    characters, so only the variants whose first characters appear somewhere in the MGC variant are
+    tested with the substring check
+    """
+
+    def __init__(self):
+        self.gram_dict = {}
+        self.short_variant_list = []
+
+    def add(self, cdna_variant):
+        """
+        Adds a CLC cDNA variant to the index
+        :param cdna_variant: Key of the variant in accuracy_result_dict
+        :return:
+        """
+        if len(cdna_variant) < GRAM_LENGTH:
+            # Too short to index, tested against every MGC variant
+            self.short_variant_list.append(cdna_variant)
+        else:
+            self.gram_dict.setdefault(cdna_variant[:GRAM_LENGTH], []).append(cdna_variant)
+
+    def find(self, cdna_variant):
+        """
+        Finds the CLC cDNA variants that are a substring of the MGC variant
+        :param cdna_variant:
+        :return: List of the matching keys in accuracy_result_dict
+        """
+        match_list = [key for key in self.short_variant_list if key in cdna_variant]
+        seen_gram_set = set()
+        for gram_start in range(len(cdna_variant) - GRAM_LENGTH + 1):
+            gram = cdna_variant[gram_start:gram_start + GRAM_LENGTH]
+            if gram in seen_gram_set:
+                continue
+            seen_gram_set.add(gram)
+            for key in self.gram_dict.get(gram, []):
+                if key in cdna_variant:
+                    match_list.append(key)
+        return match_list
+
+
+def parse_mgc_vcf(accuracy_result_dict, input_directory, metrics=None):
     """
     Parses the MGC VCF and adds the result to accuracy_result_dict
     :param accuracy_result_dict:
     :param input_directory:
+    :param metrics: RunMetrics to count the MGC VCF records and files in
     :return:
     """
+    # Index the CLC cDNA variants of each sample for the lookup of the MGC variants
+    cdna_index_dict = {}
+    for sample_name, clc_result_dict in accuracy_result_dict.items():
+        cdna_index_dict[sample_name] = CdnaVariantIndex()
+        for clc_cdna_variant in clc_result_dict.keys():
+            cdna_index_dict[sample_name].add(clc_cdna_variant)
     mgc_vcf_list = os.listdir(input_directory)
     for file in mgc_vcf_list:
-        mgc_vcf_file = open(input_directory + "/" + file, "r")
+        # Skip the tabix index files of bgzipped VCFs
+        if file.endswith(INDEX_EXTENSIONS):
+            continue
+        mgc_vcf_file = open_input_file(input_directory + "/" + file)
         sample_name = file.split("_")[0]
-        for line in mgc_vcf_file:
-            line = line.rstrip()
-            line_item = line.split("\t")
-            chromosome = line_item[0]
-            position = line_item[1]
-            ref = line_item[3]
-            alt = line_item[4]
-            info_item = line_item[7].split(";")
+        mgc_records = read_vcf_records(mgc_vcf_file)
+        if metrics is not None:
+            metrics.add_input(input_directory + "/" + file)
+            mgc_records = metrics.count_read(mgc_records)
+        for record in mgc_records:
+            info_dict = parse_info(record.info)
             # Get the gene from info line under "CAVA_GENE="
-            mgc_gene = [i for i in info_item if "CAVA_GENE" in i][0].split("=")[1]
+            mgc_gene = info_dict["CAVA_GENE"]
             # Get the cDNA variant position from info line under "CAVA_CSN="
             # CAVA_CSN has both the cDNA variant and protein variant separated by "_p."
-            mgc_cdna_variant = [i for i in info_item if "CAVA_CSN" in i][0].split("=")[1].split("_p.")[0]
+            mgc_cdna_variant = info_dict["CAVA_CSN"].split("_p.")[0]
             # Gather position coverage, variant coverage and variant frequency
-            format_header = line_item[8].split(":")
-            sample_result = line_item[9].split(":")
-            allele_depth = sample_result[format_header.index("AD")].split(",")
-            mgc_position_coverage = int(allele_depth[0]) + int(allele_depth[1])
-            mgc_variant_coverage = int(allele_depth[1])
+            ref_depth, alt_depth = get_allele_depth(record)
+            mgc_position_coverage = ref_depth + alt_depth
+            mgc_variant_coverage = alt_depth
             mgc_vf = round(mgc_variant_coverage / mgc_position_coverage, 4)
-            for key in accuracy_result_dict[sample_name].keys():
-                if key in mgc_cdna_variant:
-                    update_dict = {
-                        "mgc_gene": mgc_gene,
-                        "mgc_cdna_variant": mgc_cdna_variant,
-                        "mgc_position_coverage": str(mgc_position_coverage),
-                        "mgc_variant_coverage": str(mgc_variant_coverage),
-                        "mgc_vf": str(mgc_vf)
-                    }
-                    accuracy_result_dict[sample_name][key].update(update_dict)
+            for key in cdna_index_dict[sample_name].find(mgc_cdna_variant):
+                update_dict = {
+                    "mgc_gene": mgc_gene,
+                    "mgc_cdna_variant": mgc_cdna_variant,
+                    "mgc_position_coverage": str(mgc_position_coverage),
+                    "mgc_variant_coverage": str(mgc_variant_coverage),
+                    "mgc_vf": str(mgc_vf)
+                }
+                accuracy_result_dict[sample_name][key].update(update_dict)
         mgc_vcf_file.close()
 
 
@@ -1,7 +1,8 @@
 #!/usr/bin/python3
 
 """
-Script to compare the clinical NGSWB results to VCF results
+Script to compare the clinical NGSWB results to VCF results. With --per-sample the NGSWB rows are
+grouped by sample and only one sample's VCF is held in memory at a time
 """
 
 __author__ = "Yuta Sakai"
@@ -9,8 +10,61 @@ __author__ = "Yuta Sakai"
 
 import argparse
 import os
+import shutil
 import sys
-import re
+import tempfile
+
+from bgzf import open_input_file, INDEX_EXTENSIONS
+from metrics import RunMetrics, add_metrics_arguments
+from tabix import add_region_arguments, get_regions, open_vcf
+from vcf_reader import read_vcf_records, get_allele_depth
+
+
+RESULT_HEADER_SUFFIX = ",Found in MGC,MGC Genomic,MGC Position Coverage,MGC Variant Coverage,MGC Variant Frequency\n"
+NOT_FOUND_SUFFIX = ",N\n"
+# Number of NGSWB rows buffered in memory before they are appended to the per-sample row files
+NGSWB_BUFFER_ROWS = 100000
+
+
+class NgswbVariant(object):
+    """
+    Compact VCF variant kept for the NGSWB comparison. The chromosome name is interned and the depths
+    are stored as numbers, None if AD is not available. The allele frequency is only computed and
+    formatted when a found result is written
+    """
+    __slots__ = ("chrom", "ref", "alt", "alt_depth", "total_depth")
+
+    def __init__(self, chrom, ref, alt, alt_depth, total_depth):
+        self.chrom = chrom
+        self.ref = ref
+        self.alt = alt
+        self.alt_depth = alt_depth
+        self.total_depth = total_depth
+
+    def get_allele_frequency(self):
+        if self.total_depth is None:
+            return None
+        return round(self.alt_depth / self.total_depth, 4)
+
+    def get_result_string(self, position):
+        """
+        Makes the MGC columns of a found result
+        :param position: Position string of the NGSWB result
+        :return:
+        """
+        return (self.chrom + ":g." + position + self.ref + ">" + self.alt + "," + format_value(self.total_depth) +
+                "," + format_value(self.alt_depth) + "," + format_value(self.get_allele_frequency()))
+
+
+def format_value(value):
+    """
+    Formats a number of NgswbVariant, None is written as NA
+    :param value:
+    :return:
+    """
+    if value is None:
+        return "NA"
+    return str(value)
 
 
 def main():
@@ -27,24 +81,56 @@ def main():
         "-o", dest="output_directory", required=True,
         help="Full path to the directory to save the result file"
     )
+    parser.add_argument(
+        "--per-sample", dest="per_sample", action="store_true",
+        help="Group the NGSWB rows by sample and load one sample's VCF at a time, the rows are written "
+             "grouped by sample unless --keep-order is given"
+    )
+    parser.add_argument(
+        "--keep-order", dest="keep_order", action="store_true",
+        help="With --per-sample, write the rows in the order of the NGSWB file"
+    )
+    parser.add_argument(
+        "--temp-directory", dest="temporary_directory",
+        help="Directory for the per-sample row files used with --per-sample, default is the system temporary "
+             "directory"
+    )
+    add_region_arguments(parser)
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    metrics = RunMetrics("parse_ngswb_results", args.metrics_path, args.cprofile_path)
+    regions = get_regions(args, parser)
 
     input_directory = os.path.normpath(args.input_directory)
     ngswb_file_path = os.path.abspath(args.ngswb_file)
     output_directory = os.path.normpath(args.output_directory)
 
-    # Parse the VCFs to gather all variant information
-    vcf_result_dict = parse_vcf_to_dict(input_directory)
+    result_file_path = output_directory + "/NGSWB_Compare_Results.csv"
+    metrics.add_input(ngswb_file_path)
+    metrics.add_output(result_file_path)
 
-    # Create the result file
-    result_file = open(output_directory + "/NGSWB_Compare_Results.csv", "w")
+    if args.per_sample:
+        result_file = open(result_file_path, "w")
+        with metrics.phase("join_ngswb_per_sample"):
+            ngswb_row_count = join_ngswb_per_sample(ngswb_file_path, result_file, input_directory, args.keep_order,
+                                                    args.temporary_directory, metrics, regions)
+    else:
+        # Parse the VCFs to gather all variant information
+        with metrics.phase("parse_vcfs"):
+            vcf_result_dict = parse_vcf_to_dict(input_directory, metrics, regions)
 
-    # Parse the NGSWB input file and copy the results to the new result file and append results, if found
-    ngswb_file = parse_ngswb_file_and_write_results(ngswb_file_path, result_file, vcf_result_dict)
+        # Create the result file
+        result_file = open(result_file_path, "w")
+
+        # Parse the NGSWB input file and copy the results to the new result file and append results, if found
+        with metrics.phase("join_ngswb"):
+            ngswb_row_count = parse_ngswb_file_and_write_results(ngswb_file_path, result_file, vcf_result_dict)
 
-    ngswb_file.close()
     result_file.close()
+    metrics.records_read += ngswb_row_count
+    metrics.records_written = ngswb_row_count
+    metrics.finish()
 
 
 def parse_ngswb_file_and_write_results(ngswb_file_path, result_file, vcf_result_dict):
@@ -53,124 +139,268 @@ def parse_ngswb_file_and_write_results(ngswb_file_path, result_file, vcf_result_
     to the result file
     :param ngswb_file_path: This NGSWB result file needs to be in CSV format
     :param result_file:
-    :param vcf_result_dict:
-    :return:
+    :param vcf_result_dict: Samples without a VCF are added with no variants, so they are reported once
+    :return: Number of NGSWB rows
     """
-    ngswb_file = open(ngswb_file_path, "r")
-    header_line = ngswb_file.readline().rstrip()
-    result_file.write(header_line)
-    header_item = header_line.split(",")
-    result_file.write(",Found in MGC,MGC Genomic,MGC Position Coverage,MGC Variant Coverage,MGC Variant Frequency\n")
+    ngswb_row_count = 0
+    ngswb_file = open_input_file(ngswb_file_path)
+    sample_index, genomic_index = write_result_header(ngswb_file, result_file)
     for line in ngswb_file:
-        results_written = False
+        ngswb_row_count += 1
         line = line.rstrip()
-        result_file.write(line)
         line_item = line.split(",")
-        sample = line_item[header_item.index("Sample")]
-        # Get the chromosome, position, ref and alt from the "Genomic" cell
-        genomic_position = line_item[header_item.index("Genomic")]
-        chromosome = genomic_position.split(":")[0]
-        position_string = genomic_position.split(".")[1]
-        position = ''.join(filter(str.isdigit, position_string))
-        genomic_change = position_string.replace(position, "")
-        ref = genomic_change.split(">")[0]
-        alt = genomic_change.split(">")[1]
-        # Each position needs to be searched for multi-allelic sites
-        for position_key in vcf_result_dict[sample].keys():
-            if re.search(position, position_key):
-                # See if the chromosome, ref and alt matches
-                if (chromosome == vcf_result_dict[sample][position_key]["chrom"] and
-                        ref == vcf_result_dict[sample][position_key]["ref"] and
-                        alt == vcf_result_dict[sample][position_key]["alt"]):
-                    mgc_genomic_string = (vcf_result_dict[sample][position_key]["chrom"] + ":g." +
-                                          position + vcf_result_dict[sample][position_key]["ref"] + ">" +
-                                          vcf_result_dict[sample][position_key]["alt"])
-                    result_file.write(",Y," + mgc_genomic_string + "," +
-                                      vcf_result_dict[sample][position_key]["total_depth"] + "," +
-                                      vcf_result_dict[sample][position_key]["alt_depth"] + "," +
-                                      vcf_result_dict[sample][position_key]["allele_frequency"] + "," +
-                                      position_key + "\n")
-                    results_written = True
-                else:
-                    continue
+        sample = line_item[sample_index]
+        sample_variant_dict = vcf_result_dict.get(sample)
+        if sample_variant_dict is None:
+            # Same as --per-sample, the rows of a sample without a VCF are written as not found
+            print("No VCF found for sample: " + sample)
+            sample_variant_dict = {}
+            vcf_result_dict[sample] = sample_variant_dict
+        result_file.write(line + get_result_suffix(line_item[genomic_index], sample_variant_dict))
+    ngswb_file.close()
+    return ngswb_row_count
+
+
+def write_result_header(ngswb_file, result_file):
+    """
+    Reads the header line of the NGSWB file and writes the header of the result file
+    :param ngswb_file:
+    :param result_file:
+    :return: Index of the Sample and Genomic columns
+    """
+    header_line = ngswb_file.readline().rstrip()
+    result_file.write(header_line + RESULT_HEADER_SUFFIX)
+    header_item = header_line.split(",")
+    return header_item.index("Sample"), header_item.index("Genomic")
+
+
+def get_result_suffix(genomic_position, sample_variant_dict):
+    """
+    Searches the variant of the "Genomic" cell in the variants of the sample and makes the result columns
+    appended to the NGSWB row, with a line per found variant
+    :param genomic_position: "Genomic" cell of the NGSWB row
+    :param sample_variant_dict: Dictionary of (chromosome, position) to the list of NgswbVariant of the sample
+    :return:
+    """
+    # Get the chromosome, position, ref and alt from the "Genomic" cell
+    chromosome = genomic_position.split(":")[0]
+    position_string = genomic_position.split(".")[1]
+    position = ''.join(filter(str.isdigit, position_string))
+    genomic_change = position_string.replace(position, "")
+    ref = genomic_change.split(">")[0]
+    alt = genomic_change.split(">")[1]
+    # Positions are stored as integers, a Genomic cell without digits can not match
+    position_key = (chromosome, int(position)) if position else None
+    result_suffix = ""
+    # Each position can have multiple alleles for multi-allelic sites
+    for allele_number, variant in enumerate(sample_variant_dict.get(position_key, [])):
+        # See if the ref and alt matches
+        if ref == variant.ref and alt == variant.alt:
+            result_suffix += (",Y," + variant.get_result_string(position) + "," +
+                              get_position_key(position, allele_number) + "\n")
+    # If no results are found, go to the next line
+    if not result_suffix:
+        return NOT_FOUND_SUFFIX
+    return result_suffix
+
+
+def join_ngswb_per_sample(ngswb_file_path, result_file, input_directory, keep_order=False,
+                          temporary_directory=None, metrics=None, regions=None):
+    """
+    Groups the NGSWB rows by sample in temporary row files, then loads the VCF of one sample at a time
+    and joins the rows of that sample. The rows are written grouped by sample in the order the samples
+    first appear, or in the original order if keep_order is set, in which case the result columns of
+    every row are kept and the NGSWB file is read again
+    :param ngswb_file_path:
+    :param result_file:
+    :param input_directory:
+    :param keep_order:
+    :param temporary_directory:
+    :param metrics: RunMetrics to count the VCF records and files in
+    :param regions: Regions from tabix.get_regions to restrict the VCF records to, None for all records
+    :return: Number of NGSWB rows
+    """
+    sample_vcf_dict = get_sample_vcf_dict(input_directory)
+    row_directory = tempfile.mkdtemp(prefix="ngswb_rows_", dir=temporary_directory)
+    try:
+        ngswb_file = open_input_file(ngswb_file_path)
+        sample_index, genomic_index = write_result_header(ngswb_file, result_file)
+        sample_row_path_dict, ngswb_row_count = group_rows_by_sample(ngswb_file, sample_index, row_directory)
+        ngswb_file.close()
+        result_suffix_list = [None] * ngswb_row_count if keep_order else None
+        for sample, row_path in sample_row_path_dict.items():
+            if sample in sample_vcf_dict:
+                print("Processing sample: " + sample)
+                sample_variant_dict = parse_sample_vcf(sample_vcf_dict[sample], sample, metrics, regions)
             else:
-                continue
-        # If no results are found, go to the next line
-        if results_written == False:
-            result_file.write(",N\n")
-    return ngswb_file
+                print("No VCF found for sample: " + sample)
+                sample_variant_dict = {}
+            row_file = open(row_path, "r")
+            for row in row_file:
+                row_number, line = row.rstrip("\n").split("\t", 1)
+                result_suffix = get_result_suffix(line.split(",")[genomic_index], sample_variant_dict)
+                if keep_order:
+                    result_suffix_list[int(row_number)] = result_suffix
+                else:
+                    result_file.write(line + result_suffix)
+            row_file.close()
+            # Release the variants of the sample before the next sample is loaded
+            del sample_variant_dict
+        if keep_order:
+            ngswb_file = open_input_file(ngswb_file_path)
+            ngswb_file.readline()
+            for row_number, line in enumerate(ngswb_file):
+                result_file.write(line.rstrip() + result_suffix_list[row_number])
+            ngswb_file.close()
+    finally:
+        shutil.rmtree(row_directory)
+    return ngswb_row_count
 
 
-def parse_vcf_to_dict(input_directory):
+def group_rows_by_sample(ngswb_file, sample_index, row_directory):
+    """
+    Writes the rows of each sample, with their row number, to a row file per sample. Rows are buffered
+    up to NGSWB_BUFFER_ROWS and then appended to the row files, so only one row file is open at a time
+    :param ngswb_file: NGSWB file after the header line
+    :param sample_index:
+    :param row_directory:
+    :return: Dictionary of sample to its row file in the order the samples first appear, and number of rows
+    """
+    sample_row_path_dict = {}
+    row_buffer_dict = {}
+    buffered_row_count = 0
+    row_count = 0
+    for row_number, line in enumerate(ngswb_file):
+        line = line.rstrip()
+        sample = line.split(",")[sample_index]
+        if sample not in sample_row_path_dict:
+            sample_row_path_dict[sample] = row_directory + "/" + str(len(sample_row_path_dict)) + ".rows"
+            row_buffer_dict[sample] = []
+        row_buffer_dict[sample].append(str(row_number) + "\t" + line + "\n")
+        buffered_row_count += 1
+        row_count += 1
+        if buffered_row_count >= NGSWB_BUFFER_ROWS:
+            flush_row_buffers(row_buffer_dict, sample_row_path_dict)
+            buffered_row_count = 0
+    flush_row_buffers(row_buffer_dict, sample_row_path_dict)
+    return sample_row_path_dict, row_count
+
+
+def flush_row_buffers(row_buffer_dict, sample_row_path_dict):
+    """
+    Appends the buffered rows to the row files of their samples and empties the buffers
+    :param row_buffer_dict:
+    :param sample_row_path_dict:
+    :return:
+    """
+    for sample, row_buffer in row_buffer_dict.items():
+        if not row_buffer:
+            continue
+        row_file = open(sample_row_path_dict[sample], "a")
+        row_file.write("".join(row_buffer))
+        row_file.close()
+        row_buffer_dict[sample] = []
+
+
+def get_position_key(position, allele_number):
+    """
+    Makes the position key written at the end of a found result: {position} for the first allele
+    at the position and {position}-{number} for the following multi-allelic variants
+    :param position:
+    :param allele_number: 0 based index of the allele at the position
+    :return:
+    """
+    if allele_number == 0:
+        return position
+    return position + "-" + str(allele_number + 1)
+
+
+def parse_vcf_to_dict(input_directory, metrics=None, regions=None):
     """
     Parses VCF results into python dictionary
-    For each sample, it uses the variant position as the key, for multi-allelic variant, it will append
-    a number for each multi-allelic variant: {position}-{number}
+    For each sample, it uses (chromosome, integer position) as the key to a list of NgswbVariant at that
+    position, multi-allelic variants are appended to the list
     :param input_directory:
+    :param metrics: RunMetrics to count the VCF records and files in
+    :param regions: Regions from tabix.get_regions to restrict the VCF records to, None for all records
     :return:
     """
     vcf_result_dict = {}
     vcf_list = os.listdir(input_directory)
     for file in vcf_list:
-        vcf = open(input_directory + "/" + file, "r")
-        for line in vcf:
-            if line.startswith("#CHROM"):
-                line = line.rstrip()
-                header_items = line.split("\t")
-                sample_name = file.split(".")[0].split("_")[0]
-                muti_allelic_site = []
-                if sample_name not in vcf_result_dict.keys():
-                    print("Processing sample: " + sample_name)
-                    vcf_result_dict[sample_name] = {}
-                else:
-                    print("Duplicate sample found in VCF list, exiting script")
-                    sys.exit()
-            elif line.startswith("chr"):
-                line = line.rstrip()
-                line_item = line.split("\t")
-                chrom = line_item[header_items.index("#CHROM")]
-                position = line_item[header_items.index("POS")]
-                ref = line_item[header_items.index("REF")]
-                alt = line_item[header_items.index("ALT")].replace(",", ":")
-                format_line = line_item[header_items.index("FORMAT")].split(":")
-                sample_result = line_item[-1].split(":")
-                try:
-                    allele_depth = sample_result[format_line.index("AD")].split(",")
-                    ref_depth = allele_depth[0]
-                    alt_depth = allele_depth[1]
-                    total_depth = int(ref_depth) + int(alt_depth)
-                    real_allele_frequency = round(int(alt_depth) / total_depth, 4)
-                except ValueError:
-                    alt_depth = "NA"
-                    total_depth = "NA"
-                    real_allele_frequency = "NA"
-                if position not in vcf_result_dict[sample_name].keys():
-                    vcf_result_dict[sample_name][position] = {
-                        "chrom": chrom,
-                        "ref": ref,
-                        "alt": alt,
-                        "alt_depth": alt_depth,
-                        "total_depth": str(total_depth),
-                        "allele_frequency": str(real_allele_frequency)
-                    }
-                    muti_allelic_site.append(position)
-                else:
-                    # If a multi-allelic variant, append a number after the position
-                    print("Duplicate variant position found for: ")
-                    print(sample_name + ": " + chrom + " " + position)
-                    new_position = position + "-" + str(muti_allelic_site.count(position) + 1)
-                    vcf_result_dict[sample_name][new_position] = {
-                        "chrom": chrom,
-                        "ref": ref,
-                        "alt": alt,
-                        "alt_depth": alt_depth,
-                        "total_depth": str(total_depth),
-                        "allele_frequency": str(real_allele_frequency)
-                    }
-                    muti_allelic_site.append(position)
-        vcf.close()
+        # Skip the tabix index files of bgzipped VCFs
+        if file.endswith(INDEX_EXTENSIONS):
+            continue
+        sample_name = file.split(".")[0].split("_")[0]
+        if sample_name not in vcf_result_dict.keys():
+            print("Processing sample: " + sample_name)
+        else:
+            print("Duplicate sample found in VCF list, exiting script")
+            sys.exit()
+        vcf_result_dict[sample_name] = parse_sample_vcf(input_directory + "/" + file, sample_name, metrics,
+                                                        regions)
     return vcf_result_dict
 
 
+def get_sample_vcf_dict(input_directory):
+    """
+    Finds the VCF of each sample in the input directory
+    :param input_directory:
+    :return: Dictionary of sample name to the path of its VCF
+    """
+    sample_vcf_dict = {}
+    for file in sorted(os.listdir(input_directory)):
+        # Skip the tabix index files of bgzipped VCFs
+        if file.endswith(INDEX_EXTENSIONS):
+            continue
+        sample_name = file.split(".")[0].split("_")[0]
+        if sample_name in sample_vcf_dict:
+            print("Duplicate sample found in VCF list, exiting script")
+            sys.exit()
+        sample_vcf_dict[sample_name] = input_directory + "/" + file
+    return sample_vcf_dict
+
+
+def parse_sample_vcf(vcf_path, sample_name, metrics=None, regions=None):
+    """
+    Parses the VCF of a sample into a dictionary of (chromosome, integer position) to the list of
+    NgswbVariant at that position
+    :param vcf_path:
+    :param sample_name:
+    :param metrics: RunMetrics to count the VCF records and files in
+    :param regions: Regions from tabix.get_regions to restrict the VCF records to, None for all records
+    :return:
+    """
+    sample_variant_dict = {}
+    vcf = open_vcf(vcf_path, regions)
+    if metrics is not None:
+        metrics.add_input(vcf_path)
+    for record in read_vcf_records(vcf):
+        # Only the records on the chr contigs are parsed, the same as before the shared reader
+        if not record.chrom.startswith("chr"):
+            continue
+        chrom = sys.intern(record.chrom)
+        position = record.pos
+        try:
+            ref_depth, alt_depth = get_allele_depth(record)
+            total_depth = ref_depth + alt_depth
+        except ValueError:
+            alt_depth = None
+            total_depth = None
+        variant = NgswbVariant(chrom, record.ref, record.alt.replace(",", ":"), alt_depth, total_depth)
+        position_key = (chrom, int(position))
+        if position_key not in sample_variant_dict:
+            sample_variant_dict[position_key] = [variant]
+        else:
+            # Multi-allelic variants are added to the list of the position
+            print("Duplicate variant position found for: ")
+            print(sample_name + ": " + chrom + " " + position)
+            sample_variant_dict[position_key].append(variant)
+        if metrics is not None:
+            metrics.records_read += 1
+    vcf.close()
+    return sample_variant_dict
+
+
 if __name__ == "__main__":
     main()
@@ -2,15 +2,31 @@
 
 """
 Script to parse the false_positives.vcf and false_negatives.vcf to collect the depth
-and the real allele frequency for each variant
+and the real allele frequency for each variant. With --positions the variant_positions.csv of
+analyze_false_positive_positions.py is made in the same pass over the VCFs
 """
 
 __author__ = "Yuta Sakai"
 
 
 import argparse
+import concurrent.futures
+import itertools
 import os
 
+from analyze_false_positive_positions import aggregate_records, make_result_file, make_result_file_external
+from bgzf import INDEX_EXTENSIONS
+from metrics import RunMetrics, add_metrics_arguments
+from tabix import add_region_arguments, get_regions, open_vcf
+from vcf_reader import read_vcf_records, get_allele_depth
+
+
+# Number of result lines sent back from a worker process at a time
+RESULT_BATCH_SIZE = 10000
+# Content of the sample cells in variant_positions.csv
+POSITION_CELL_ALT = "alt"
+POSITION_CELL_DETAIL = "detail"
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -22,59 +38,232 @@ def main():
         "-o", dest="output_directory", required=True,
         help="Full path to the output directory to save result files"
     )
+    parser.add_argument(
+        "-j", "--workers", dest="workers", type=int, default=1,
+        help="Number of worker processes used to parse the VCF files, default is 1"
+    )
+    parser.add_argument(
+        "--positions", dest="positions", action="store_true",
+        help="Also make variant_positions.csv of analyze_false_positive_positions.py from the same pass over "
+             "the VCFs"
+    )
+    parser.add_argument(
+        "--position-details", dest="position_details", action="store_true",
+        help="Same as --positions, with the depth and real allele frequency in each sample cell as "
+             "alt|DP=depth|AF=frequency"
+    )
+    parser.add_argument(
+        "--max-records", dest="max_records", type=int,
+        help="With --positions or --position-details, bound the memory used for variant_positions.csv, see "
+             "analyze_false_positive_positions.py"
+    )
+    parser.add_argument(
+        "--temp-directory", dest="temporary_directory",
+        help="Directory for the sorted runs used with --max-records, default is the system temporary directory"
+    )
+    add_region_arguments(parser)
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
+    if args.max_records and not (args.positions or args.position_details):
+        parser.error("--max-records requires --positions or --position-details")
+    metrics = RunMetrics("parse_vcfs", args.metrics_path, args.cprofile_path)
+    regions = get_regions(args, parser)
 
     input_directory = os.path.normpath(args.input_directory)
-    file_list = os.listdir(input_directory)
+    # Sort the file list so the result file is in the same order regardless of the number of workers
+    file_list = sorted(os.listdir(input_directory))
     output_directory = os.path.normpath(args.output_directory)
 
     # Make result file and write out headers
-    result_file = open(output_directory + "/parsed_vcf_results.csv", "w")
+    result_file_path = output_directory + "/parsed_vcf_results.csv"
+    result_file = open(result_file_path, "w")
     result_file.write("Sample,CHROM,POS,REF,ALT,DP,Called AF,Real AF\n")
+    metrics.add_output(result_file_path)
+
+    if args.positions or args.position_details:
+        position_cell = POSITION_CELL_DETAIL if args.position_details else POSITION_CELL_ALT
+        # The position records are aggregated while the result lines are written
+        vcf_batches = iterate_vcf_batches(get_vcf_path_list(file_list, input_directory, metrics), args.workers,
+                                          position_cell, regions)
+        position_records = iterate_position_records(vcf_batches, result_file, metrics)
+        if args.max_records:
+            with metrics.phase("parse_vcfs_external_sort"):
+                sample_name_list, location_count = make_result_file_external(
+                    output_directory, position_records, args.max_records, args.temporary_directory)
+        else:
+            with metrics.phase("parse_vcfs"):
+                result_dict, sample_name_list = aggregate_records(position_records)
+            location_count = len(result_dict)
+            with metrics.phase("write_positions"):
+                make_result_file(output_directory, result_dict, sample_name_list).close()
+        result_file.close()
+        print("Number of samples in samples analyzed: " + str(len(sample_name_list)))
+        metrics.add_output(output_directory + "/variant_positions.csv")
+        metrics.records_written = metrics.records_read + location_count
+    else:
+        # Parse the VCF files
+        with metrics.phase("parse_vcfs"):
+            record_count = parse_vcf(file_list, input_directory, result_file, args.workers, metrics, regions)
+        result_file.close()
+        metrics.records_read = record_count
+        metrics.records_written = record_count
+    metrics.finish()
+
+
+def parse_vcf(file_list, input_directory, result_file, workers=1, metrics=None, regions=None):
+    """
+    Parses the VCF files and writes the results to result_file in the order of file_list
+    :param file_list:
+    :param input_directory:
+    :param result_file:
+    :param workers: Number of worker processes, the VCF files are parsed serially if 1
+    :param metrics: RunMetrics to add the VCF files to as inputs
+    :param regions: Regions from tabix.get_regions to restrict the records to, None for all records
+    :return: Number of result lines written
+    """
+    line_count = 0
+    for result_batch, _ in iterate_vcf_batches(get_vcf_path_list(file_list, input_directory, metrics), workers,
+                                               regions=regions):
+        result_file.write(result_batch)
+        line_count += result_batch.count("\n")
+    return line_count
+
+
+def get_vcf_path_list(file_list, input_directory, metrics=None):
+    """
+    Makes the paths of the VCF files in file_list, skipping the tabix index files of bgzipped VCFs
+    :param file_list:
+    :param input_directory:
+    :param metrics: RunMetrics to add the VCF files to as inputs
+    :return:
+    """
+    vcf_path_list = [input_directory + "/" + file for file in file_list if not file.endswith(INDEX_EXTENSIONS)]
+    if metrics is not None:
+        for vcf_path in vcf_path_list:
+            metrics.add_input(vcf_path)
+    return vcf_path_list
+
+
+def iterate_vcf_batches(vcf_path_list, workers=1, position_cell=None, regions=None):
+    """
+    Yields the result batches of the VCF files in the order of vcf_path_list
+    :param vcf_path_list:
+    :param workers: Number of worker processes, the VCF files are parsed serially if 1
+    :param position_cell: POSITION_CELL_ALT or POSITION_CELL_DETAIL to also make the position records
+    :param regions: Regions from tabix.get_regions to restrict the records to, None for all records
+    :return:
+    """
+    if workers > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            # map returns the results in the order of vcf_path_list
+            for result_batches in executor.map(parse_vcf_file, vcf_path_list, itertools.repeat(position_cell),
+                                               itertools.repeat(regions)):
+                for result_batch in result_batches:
+                    yield result_batch
+    else:
+        for vcf_path in vcf_path_list:
+            for result_batch in iterate_result_batches(vcf_path, position_cell, regions):
+                yield result_batch
+
+
+def iterate_position_records(vcf_batches, result_file, metrics=None):
+    """
+    Writes the result lines of the batches to result_file and yields their position records
+    :param vcf_batches: Iterable of the batches from iterate_vcf_batches with position records
+    :param result_file:
+    :param metrics: RunMetrics to count the result lines in as records read, one per VCF record the same
+    as without --positions. The replicate samples have result lines but no position records
+    :return:
+    """
+    for result_batch, position_batch in vcf_batches:
+        result_file.write(result_batch)
+        if metrics is not None:
+            metrics.records_read += result_batch.count("\n")
+        for position_record in position_batch:
+            yield position_record
+
+
+def parse_vcf_file(vcf_path, position_cell=None, regions=None):
+    """
+    Parses a single VCF file in a worker process
+    :param vcf_path:
+    :param position_cell:
+    :param regions:
+    :return: List of result batches to write to the result file
+    """
+    return list(iterate_result_batches(vcf_path, position_cell, regions))
+
+
+def iterate_result_batches(vcf_path, position_cell=None, regions=None):
+    """
+    Parses a VCF file and yields the result lines joined into batches of RESULT_BATCH_SIZE lines.
+    Each batch is yielded with the list of its (sample, chromosome, position, cell) position records
+    if position_cell is given, None otherwise. The bioinformatics replicate samples have no position
+    records, the same as in analyze_false_positive_positions.py
+    :param vcf_path:
+    :param position_cell: None, POSITION_CELL_ALT or POSITION_CELL_DETAIL
+    :param regions: Regions from tabix.get_regions to restrict the records to, None for all records
+    :return:
+    """
+    sample_name = os.path.basename(vcf_path).split(".")[0].split("_")[0]
+    keep_positions = position_cell is not None and "rep" not in sample_name
+    vcf_file = open_vcf(vcf_path, regions)
+    result_lines = []
+    position_batch = [] if position_cell is not None else None
+    for record in read_vcf_records(vcf_file):
+        # Only the records on the chr contigs are parsed, the same as before the shared reader
+        if not record.chrom.startswith("chr"):
+            continue
+        result_items = get_result_items(sample_name, record)
+        result_lines.append(",".join(result_items))
+        if keep_positions:
+            position_batch.append((sample_name, result_items[1], result_items[2],
+                                   get_position_cell(result_items, position_cell)))
+        if len(result_lines) == RESULT_BATCH_SIZE:
+            yield "\n".join(result_lines) + "\n", position_batch
+            result_lines = []
+            position_batch = [] if position_cell is not None else None
+    vcf_file.close()
+    if result_lines:
+        yield "\n".join(result_lines) + "\n", position_batch
+
+
+def get_position_cell(result_items, position_cell):
+    """
+    Makes the sample cell of variant_positions.csv from the items of a result line
+    :param result_items: List from get_result_items
+    :param position_cell: POSITION_CELL_ALT or POSITION_CELL_DETAIL
+    :return:
+    """
+    if position_cell == POSITION_CELL_DETAIL:
+        return result_items[4] + "|DP=" + result_items[5] + "|AF=" + result_items[7]
+    return result_items[4]
+
 
-    # Parse the VCF files
-    parse_vcf(file_list, input_directory, result_file)
-    result_file.close()
-
-
-def parse_vcf(file_list, input_directory, result_file):
-    for file in file_list:
-        vcf_file = open(input_directory + "/" + file, "r")
-        for line in vcf_file:
-            # Get header information
-            if line.startswith("#CHROM"):
-                line = line.rstrip()
-                header_items = line.split("\t")
-                sample_name = file.split(".")[0].split("_")[0]
-            elif line.startswith("chr"):
-                line = line.rstrip()
-                line_item = line.split("\t")
-                chrom = line_item[header_items.index("#CHROM")]
-                position = line_item[header_items.index("POS")]
-                ref = line_item[header_items.index("REF")]
-                alt = line_item[header_items.index("ALT")].replace(",", ":")
-                format_line = line_item[header_items.index("FORMAT")].split(":")
-                sample_result = line_item[-1].split(":")
-                try:
-                    allele_depth = sample_result[format_line.index("AD")].split(",")
-                    ref_depth = allele_depth[0]
-                    alt_depth = allele_depth[1]
-                    total_depth = int(ref_depth) + int(alt_depth)
-                    real_allele_frequency = round(int(alt_depth) / total_depth, 4)
-                except ValueError:
-                    total_depth = "NA"
-                    real_allele_frequency = "NA"
-                # If AF exists, Replaces the "," in case there are multiple allele frequencies reported
-                try:
-                    called_allele_frequency = sample_result[format_line.index("AF")].replace(",", ":")
-                except ValueError:
-                    called_allele_frequency = "NA"
-                line_to_write = [sample_name, chrom, position, ref, alt, str(total_depth), called_allele_frequency,
-                                 str(real_allele_frequency)]
-                result_file.write(",".join(line_to_write))
-                result_file.write("\n")
-        vcf_file.close()
+def get_result_items(sample_name, record):
+    """
+    Collects the depth, called allele frequency and real allele frequency of a VCF record
+    :param sample_name:
+    :param record:
+    :return: List of items for a line of the result file
+    """
+    alt = record.alt.replace(",", ":")
+    try:
+        ref_depth, alt_depth = get_allele_depth(record)
+        total_depth = ref_depth + alt_depth
+        real_allele_frequency = round(alt_depth / total_depth, 4)
+    except ValueError:
+        total_depth = "NA"
+        real_allele_frequency = "NA"
+    # If AF exists, Replaces the "," in case there are multiple allele frequencies reported
+    called_allele_frequency = record.get_format_value("AF")
+    if called_allele_frequency is None:
+        called_allele_frequency = "NA"
+    else:
+        called_allele_frequency = called_allele_frequency.replace(",", ":")
+    return [sample_name, record.chrom, record.pos, record.ref, alt, str(total_depth), called_allele_frequency,
+            str(real_allele_frequency)]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,55 @@
+#!/usr/bin/python3
+
+"""
+Reads the tool paths from config/compareVcf.profile so the Python entry points use the same
+configuration as the bash scripts, and finds the sample directories they are run on
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import glob
+import os
+import re
+
+
+SCRIPT_ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+DEFAULT_PROFILE = SCRIPT_ROOT + "/config/compareVcf.profile"
+PYTHON_SCRIPT_DIR = SCRIPT_ROOT + "/src/python"
+VARIABLE_PATTERN = re.compile(r"\$\{(\w+)\}")
+
+
+def load_profile(profile_path=DEFAULT_PROFILE):
+    """
+    Parses the KEY="value" lines of the profile, expanding ${KEY} references to previously defined keys
+    :param profile_path:
+    :return: Dictionary of key to value
+    """
+    profile = {}
+    profile_file = open(profile_path, "r")
+    for line in profile_file:
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        value = value.strip().strip("\"'")
+        profile[key.strip()] = VARIABLE_PATTERN.sub(lambda match: profile.get(match.group(1), ""), value)
+    profile_file.close()
+    return profile
+
+
+def expand_sample_directories(sample_pattern_list):
+    """
+    Expands the glob patterns and keeps the existing directories, in the given order without duplicates
+    :param sample_pattern_list:
+    :return:
+    """
+    sample_directory_list = []
+    for sample_pattern in sample_pattern_list:
+        for sample_directory in sorted(glob.glob(sample_pattern)) or [sample_pattern]:
+            sample_directory = os.path.normpath(os.path.abspath(sample_directory))
+            if os.path.isdir(sample_directory) and sample_directory not in sample_directory_list:
+                sample_directory_list.append(sample_directory)
+            elif not os.path.isdir(sample_directory):
+                print("Sample directory not found, skipping: " + sample_directory)
+    return sample_directory_list
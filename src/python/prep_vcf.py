@@ -0,0 +1,155 @@
+#!/usr/bin/python3
+
+"""
+Script to prepare a VCF for hap.py in one pass: the records with the excluded FILTER values are
+dropped, the rest is compressed with BGZF in a thread pool and the .tbi index is built while the
+records are written. Replaces running bcftools view -e, bgzip and tabix one after the other
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import argparse
+import os
+
+from bgzf import BgzfWriter, DEFAULT_THREADS, open_input_file
+from metrics import RunMetrics, add_metrics_arguments
+from tabix import TabixIndexBuilder
+
+
+MATCH_EXACT = "exact"
+MATCH_SUBSET = "subset"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", dest="input_vcf", required=True,
+        help="Full path to the input VCF, plain or compressed"
+    )
+    parser.add_argument(
+        "-o", dest="output_vcf", required=True,
+        help="Full path to the bgzipped output VCF, the index is saved as {output}.tbi"
+    )
+    parser.add_argument(
+        "-e", "--exclude-filter", dest="exclude_filters", nargs="+", default=[],
+        help="FILTER values of the records to drop. A value can list several filters separated by ;"
+    )
+    parser.add_argument(
+        "--filter-match", dest="filter_match", choices=[MATCH_EXACT, MATCH_SUBSET], default=MATCH_EXACT,
+        help="exact drops the records whose FILTER is exactly one of the values, the same as "
+             "bcftools view -e 'FILTER=\"value\"', subset drops the records that have all the filters of one of "
+             "the values and maybe others, the same as bcftools view -e 'FILTER~\"value\"', default is exact"
+    )
+    parser.add_argument(
+        "-t", "--threads", dest="threads", type=int, default=DEFAULT_THREADS,
+        help="Number of threads to compress the BGZF blocks, default is " + str(DEFAULT_THREADS)
+    )
+    parser.add_argument(
+        "--no-index", dest="no_index", action="store_true",
+        help="Do not make the .tbi index, for VCFs that are not sorted"
+    )
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    metrics = RunMetrics("prep_vcf", args.metrics_path, args.cprofile_path)
+
+    input_vcf_path = os.path.abspath(args.input_vcf)
+    output_vcf_path = os.path.abspath(args.output_vcf)
+    index_path = output_vcf_path + ".tbi"
+    exclude_filter_sets = get_exclude_filter_sets(args.exclude_filters)
+    match_subset = args.filter_match == MATCH_SUBSET
+
+    index_builder = None if args.no_index else TabixIndexBuilder()
+    vcf_writer = BgzfWriter(output_vcf_path, args.threads)
+    vcf_file = open_input_file(input_vcf_path, args.threads)
+    excluded_count = 0
+    with metrics.phase("prep_vcf"):
+        try:
+            for line in vcf_file:
+                if line.startswith("#"):
+                    vcf_writer.write(line.encode())
+                    continue
+                if not line.strip():
+                    continue
+                if not line.endswith("\n"):
+                    line += "\n"
+                metrics.records_read += 1
+                line_item = line.split("\t", 8)
+                if is_excluded(line_item[6], exclude_filter_sets, match_subset):
+                    excluded_count += 1
+                    continue
+                record_begin = vcf_writer.tell()
+                vcf_writer.write(line.encode())
+                if index_builder is not None:
+                    begin = int(line_item[1]) - 1
+                    index_builder.add_record(line_item[0], begin, get_record_end(begin, line_item),
+                                             record_begin, vcf_writer.tell())
+                metrics.records_written += 1
+        finally:
+            vcf_file.close()
+            vcf_writer.close()
+    if index_builder is not None:
+        with metrics.phase("write_index"):
+            index_builder.write(index_path, vcf_writer.get_virtual_offset)
+        metrics.add_output(index_path)
+    print("Records written: " + str(metrics.records_written) + ", records excluded by FILTER: " +
+          str(excluded_count))
+
+    metrics.labels["excluded_records"] = excluded_count
+    metrics.add_input(input_vcf_path)
+    metrics.add_output(output_vcf_path)
+    metrics.finish()
+
+
+def get_exclude_filter_sets(exclude_filters):
+    """
+    Splits each excluded FILTER value into its set of filters
+    :param exclude_filters:
+    :return: List of frozenset
+    """
+    return [frozenset(exclude_filter.split(";")) for exclude_filter in exclude_filters]
+
+
+def is_excluded(filter_value, exclude_filter_sets, match_subset):
+    """
+    Checks if a record is dropped. With exact matching the filters of the record have to be the same
+    set as one of the excluded values, so strand_artifact;clustered_events is kept when only
+    strand_artifact is excluded. With subset matching the record has to have all the filters of one
+    of the values, so A;B drops A;B;C but not A
+    :param filter_value: FILTER column of the record
+    :param exclude_filter_sets: List from get_exclude_filter_sets
+    :param match_subset:
+    :return:
+    """
+    if not exclude_filter_sets:
+        return False
+    record_filters = frozenset(filter_value.split(";"))
+    if match_subset:
+        return any([exclude_filter_set <= record_filters for exclude_filter_set in exclude_filter_sets])
+    return record_filters in exclude_filter_sets
+
+
+def get_record_end(begin, line_item):
+    """
+    Gets the 0 based end of a record the same as tabix -p vcf, from INFO/END if it is set and
+    otherwise from the length of REF
+    :param begin:
+    :param line_item: Columns of the record, with INFO as the eighth
+    :return:
+    """
+    end = begin + len(line_item[3])
+    info = line_item[7]
+    if "END=" in info:
+        for info_item in info.split(";"):
+            if info_item.startswith("END="):
+                try:
+                    end = max(end, int(info_item[4:]))
+                except ValueError:
+                    pass
+                break
+    return end
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/python3
+
+"""
+Script to run the CLC vs MGC comparison pipeline (compareClcMgcTnhaplotyper2.sh, filterMgcVcf.sh and
+checkFalsePositive.sh) on many sample directories concurrently. Stages are skipped when their outputs
+exist and are newer than their inputs, so an interrupted batch can be resumed by running it again
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import argparse
+import concurrent.futures
+import os
+import shlex
+import sys
+import time
+
+from job_executor import Job, LocalExecutor, DEFAULT_JOB_MEMORY_MB, DEFAULT_JOB_CPUS, add_executor_arguments, \
+    make_executor
+from metrics import RunMetrics, add_metrics_arguments
+from pipeline_profile import DEFAULT_PROFILE, PYTHON_SCRIPT_DIR, expand_sample_directories, load_profile
+from sharded_happy import DEFAULT_SHARD_MEMORY_MB
+
+
+STATUS_COMPLETED = "completed"
+STATUS_UP_TO_DATE = "up_to_date"
+STATUS_FAILED = "failed"
+STATUS_BLOCKED = "blocked"
+STATUS_DRY_RUN = "dry_run"
+SUCCESS_STATUSES = (STATUS_COMPLETED, STATUS_UP_TO_DATE, STATUS_DRY_RUN)
+STAGE_NAMES = ["prepare_clc", "filter_mgc", "happy", "split_happy", "filter_false_sites", "false_positive_bed",
+               "fp_check", "true_positive"]
+# Memory declared for hap.py, the other stages use the default of job_executor.py
+HAPPY_MEMORY_MB = 8192
+
+
+class Stage(object):
+    """
+    A step of the pipeline for one sample: a bash command with its input and output files,
+    the names of the stages that need to finish before it and the memory and CPUs it needs
+    """
+
+    def __init__(self, name, command, inputs, outputs, depends=(), memory_mb=DEFAULT_JOB_MEMORY_MB,
+                 cpus=DEFAULT_JOB_CPUS):
+        self.name = name
+        self.command = command
+        self.inputs = inputs
+        self.outputs = outputs
+        self.depends = list(depends)
+        self.memory_mb = memory_mb
+        self.cpus = cpus
+
+    def is_up_to_date(self):
+        """
+        Checks if all outputs exist and are newer than all existing inputs. Outputs whose inputs were
+        removed are up to date, like the {sample}_final.vcf.gz of the samples processed by
+        compareClcMgcTnhaplotyper2.sh, which ran bgzip in place and deleted {sample}_final.vcf
+        :return:
+        """
+        if not all([os.path.exists(output) for output in self.outputs]):
+            return False
+        existing_inputs = [input_path for input_path in self.inputs if os.path.exists(input_path)]
+        if not existing_inputs:
+            return True
+        oldest_output = min([os.path.getmtime(output) for output in self.outputs])
+        newest_input = max([os.path.getmtime(input_path) for input_path in existing_inputs])
+        return oldest_output >= newest_input
+
+    def remove_outputs(self):
+        """
+        Removes the outputs of a failed run, so partial files are not taken as up to date
+        :return:
+        """
+        for output in self.outputs:
+            if os.path.isfile(output):
+                os.remove(output)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i", dest="sample_directories", nargs="+", default=[],
+        help="Full path to the sample directories, glob patterns are expanded"
+    )
+    parser.add_argument(
+        "-f", dest="sample_list_file",
+        help="Full path to a file with a sample directory or glob pattern per line"
+    )
+    parser.add_argument(
+        "-j", "--workers", dest="workers", type=int, default=4,
+        help="Number of stages run at the same time across all samples, default is 4. The local executor "
+             "also waits for the memory and CPUs of each stage to be free"
+    )
+    parser.add_argument(
+        "-p", dest="profile_path", default=DEFAULT_PROFILE,
+        help="Full path to the pipeline profile, default is config/compareVcf.profile"
+    )
+    parser.add_argument(
+        "--stages", dest="stages", nargs="+", choices=STAGE_NAMES,
+        help="Only run these stages, default is all stages"
+    )
+    parser.add_argument(
+        "--force", dest="force", action="store_true",
+        help="Run the stages even if their outputs are up to date"
+    )
+    parser.add_argument(
+        "--dry-run", dest="dry_run", action="store_true",
+        help="Print the commands of the stages that would run without running them"
+    )
+    parser.add_argument(
+        "--native", dest="native", action="store_true",
+        help="Compare the VCFs with compare_vcfs.py instead of hap.py in the happy stage, a fast pre-check "
+             "that also writes the false positive and false negative VCFs, so there is no split_happy stage"
+    )
+    parser.add_argument(
+        "--happy-shards", dest="happy_shards", type=int, default=1,
+        help="Run hap.py on this many shards of the VCFs of each sample at the same time with sharded_happy.py, "
+             "default is 1"
+    )
+    add_executor_arguments(parser)
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    metrics = RunMetrics("run_pipeline", args.metrics_path, args.cprofile_path)
+
+    sample_pattern_list = list(args.sample_directories)
+    if args.sample_list_file:
+        sample_list_file = open(args.sample_list_file, "r")
+        sample_pattern_list.extend([line.strip() for line in sample_list_file if line.strip()])
+        sample_list_file.close()
+    sample_directory_list = expand_sample_directories(sample_pattern_list)
+    if not sample_directory_list:
+        parser.error("No sample directories found, specify -i or -f")
+
+    profile = load_profile(os.path.abspath(args.profile_path))
+    selected_stages = args.stages if args.stages else STAGE_NAMES
+
+    sample_stage_dict = {}
+    for sample_directory in sample_directory_list:
+        sample_stage_dict[sample_directory] = [stage for stage in build_sample_stages(sample_directory, profile,
+                                                                                      args.native, args.happy_shards)
+                                               if stage.name in selected_stages]
+
+    print("Processing " + str(len(sample_directory_list)) + " samples with " + str(args.workers) + " workers")
+    executor = make_executor(args, profile)
+    status_dict = run_stages(sample_stage_dict, args.workers, args.force, args.dry_run, metrics, executor)
+    metrics.labels["samples"] = len(sample_directory_list)
+    metrics.labels["executor"] = args.executor
+    metrics.labels["retried_stages"] = sum([1 for result in executor.results if result.attempts > 1])
+    metrics.labels["statuses"] = {}
+    for status in status_dict.values():
+        metrics.labels["statuses"][status] = metrics.labels["statuses"].get(status, 0) + 1
+    metrics.records_written = metrics.labels["statuses"].get(STATUS_COMPLETED, 0)
+    metrics.finish()
+
+    # Print the summary of the stage statuses per sample
+    failed_count = 0
+    for sample_directory in sample_directory_list:
+        stage_statuses = [stage.name + "=" + status_dict[(sample_directory, stage.name)]
+                          for stage in sample_stage_dict[sample_directory]]
+        print(os.path.basename(sample_directory) + ": " + ", ".join(stage_statuses))
+        failed_count += sum([1 for stage in sample_stage_dict[sample_directory]
+                             if status_dict[(sample_directory, stage.name)] == STATUS_FAILED])
+    if failed_count:
+        print("Number of failed stages: " + str(failed_count))
+        sys.exit(1)
+
+
+def get_python_command(script_name):
+    """
+    Makes the quoted command that runs a script of src/python with the current python
+    :param script_name:
+    :return:
+    """
+    return shlex.quote(sys.executable) + " " + shlex.quote(PYTHON_SCRIPT_DIR + "/" + script_name)
+
+
+def build_sample_stages(sample_directory, profile, native=False, happy_shards=1):
+    """
+    Makes the pipeline stages of a sample directory with the same file layout as the bash scripts
+    :param sample_directory:
+    :param profile: Dictionary of the tool paths from the pipeline profile
+    :param native: Compare the VCFs with compare_vcfs.py instead of hap.py
+    :param happy_shards: Number of shards hap.py is run on at the same time
+    :return: List of Stage
+    """
+    sample = os.path.basename(sample_directory)
+    quote = shlex.quote
+    original_clc_vcf = sample_directory + "/" + sample + "_final.vcf"
+    clc_vcf = original_clc_vcf + ".gz"
+    mgc_vcf = sample_directory + "/mgc/reports/" + sample + ".vcf"
+    filtered_mgc_vcf = sample_directory + "/mgc/reports/" + sample + "_filtered.vcf.gz"
+    legacy_filtered_mgc_vcf = sample_directory + "/mgc/reports/" + sample + "_filtered.vcf"
+    happy_directory = sample_directory + "/hap.py_out"
+    happy_prefix = happy_directory + "/" + sample + "_CLC_MGC"
+    happy_vcf = happy_prefix + ".vcf.gz"
+    happy_summary = happy_prefix + ".summary.csv"
+    happy_fp_vcf = happy_prefix + "_false_positives.vcf"
+    happy_fn_vcf = happy_prefix + "_false_negatives.vcf"
+    fp_filtered_mgc_vcf = sample_directory + "/" + sample + "_MGC_false_positives.vcf"
+    fn_filtered_clc_vcf = sample_directory + "/" + sample + "_CLC_false_negatives.vcf"
+    sorted_merged_bed = sample_directory + "/" + sample + "_false_positive_sorted_merged.bed"
+    mgc_bam = sample_directory + "/mgc/alignment/" + sample + ".bam"
+    fp_check_vcf = sample_directory + "/" + sample + "_fp_check.vcf"
+    real_positive_vcf = sample_directory + "/" + sample + "_true_positive.vcf"
+
+    if not os.path.exists(filtered_mgc_vcf) and os.path.exists(legacy_filtered_mgc_vcf):
+        # Sample directories processed before prep_vcf.py only have the plain filtered MGC VCF, it is kept
+        # and made with bcftools view as before, so the later stages are not rerun for the new name
+        filtered_mgc_vcf = legacy_filtered_mgc_vcf
+        filter_mgc_stage = Stage("filter_mgc",
+                                 quote(profile["BCFTOOLS"]) + " view -e 'FILTER=\"strand_artifact\"' " +
+                                 quote(mgc_vcf) + " > " + quote(filtered_mgc_vcf),
+                                 [mgc_vcf], [filtered_mgc_vcf])
+    else:
+        # Filter the "strand_artifact" variants from MGC VCF, bgzipped and tabix-ed in the same pass
+        filter_mgc_stage = Stage("filter_mgc",
+                                 get_python_command("prep_vcf.py") + " -i " + quote(mgc_vcf) + " -o " +
+                                 quote(filtered_mgc_vcf) + " -e strand_artifact",
+                                 [mgc_vcf], [filtered_mgc_vcf, filtered_mgc_vcf + ".tbi"])
+
+    if native:
+        # compare_vcfs.py writes the false positive and false negative VCFs itself
+        comparison_stages = [
+            Stage("happy",
+                  "mkdir -p " + quote(happy_directory) + " && " + get_python_command("compare_vcfs.py") + " -t " +
+                  quote(clc_vcf) + " -q " + quote(filtered_mgc_vcf) + " -o " + quote(happy_prefix),
+                  [clc_vcf, filtered_mgc_vcf], [happy_summary, happy_fp_vcf, happy_fn_vcf],
+                  ["prepare_clc", "filter_mgc"])
+        ]
+    else:
+        comparison_stages = [
+            # Run hap.py with python 2.7.10 through the cache of happy_cache.py
+            Stage("happy",
+                  get_python_command("happy_cache.py") + " -t " + quote(clc_vcf) + " -q " + quote(filtered_mgc_vcf) +
+                  " -o " + quote(happy_prefix) + " -r " + quote(profile["REF_GENOME"]) + " --happy " +
+                  quote(profile["HAPPY"]) + " --python2 " + quote(profile["PYTHON2710"]) + " --cache-dir " +
+                  quote(profile.get("HAPPY_CACHE_DIR", "")) + " --happy-args=--engine=scmp-somatic --shards " +
+                  str(happy_shards),
+                  [clc_vcf, filtered_mgc_vcf], [happy_vcf, happy_summary], ["prepare_clc", "filter_mgc"],
+                  max(HAPPY_MEMORY_MB, happy_shards * DEFAULT_SHARD_MEMORY_MB), happy_shards),
+            # Separate the false positives and false negatives in separate VCF files
+            Stage("split_happy",
+                  quote(profile["BCFTOOLS"]) + " view -i 'FORMAT/BD=\"FP\"' " + quote(happy_vcf) + " > " +
+                  quote(happy_fp_vcf) + " && " +
+                  quote(profile["BCFTOOLS"]) + " view -i 'FORMAT/BD=\"FN\"' " + quote(happy_vcf) + " > " +
+                  quote(happy_fn_vcf),
+                  [happy_vcf], [happy_fp_vcf, happy_fn_vcf], ["happy"])
+        ]
+
+    return [
+        # bgzip and tabix the original CLC VCF in one pass, keeping the original so the stage can be rerun
+        Stage("prepare_clc",
+              get_python_command("prep_vcf.py") + " -i " + quote(original_clc_vcf) + " -o " + quote(clc_vcf),
+              [original_clc_vcf], [clc_vcf, clc_vcf + ".tbi"]),
+        filter_mgc_stage
+    ] + comparison_stages + [
+        # Filter the MGC VCF to the false positives and the CLC VCF to the false negatives
+        Stage("filter_false_sites",
+              get_python_command("filter_false_sites.py") + " -p " + quote(happy_fp_vcf) + " -n " +
+              quote(happy_fn_vcf) + " -m " + quote(filtered_mgc_vcf) + " -c " + quote(clc_vcf) + " -s " +
+              quote(sample) + " -o " + quote(sample_directory),
+              [happy_fp_vcf, happy_fn_vcf, filtered_mgc_vcf, clc_vcf], [fp_filtered_mgc_vcf, fn_filtered_clc_vcf],
+              ["happy"] if native else ["split_happy"]),
+        # Make the sorted and merged BED file of the false positives
+        Stage("false_positive_bed",
+              get_python_command("make_bed_from_vcf.py") + " -i " + quote(fp_filtered_mgc_vcf) + " -o " +
+              quote(sample_directory) + " --sorted-merged -n " + quote(sample),
+              [fp_filtered_mgc_vcf], [sorted_merged_bed], ["filter_false_sites"]),
+        # Run samtools mpileup and bcftools call on the false positive regions of the BAM
+        Stage("fp_check",
+              quote(profile["SAMTOOLS"]) + " mpileup -l " + quote(sorted_merged_bed) + " -f " +
+              quote(profile["REF_GENOME"]) + " -g " + quote(mgc_bam) + " | " + quote(profile["BCFTOOLS"]) +
+              " call -c > " + quote(fp_check_vcf),
+              [sorted_merged_bed, mgc_bam], [fp_check_vcf], ["false_positive_bed"]),
+        # Filter the "0/0" calls to keep the true variants found in BAM
+        Stage("true_positive",
+              quote(profile["BCFTOOLS"]) + " view -e 'FORMAT/GT=\"0/0\"' " + quote(fp_check_vcf) + " > " +
+              quote(real_positive_vcf),
+              [fp_check_vcf], [real_positive_vcf], ["fp_check"])
+    ]
+
+
+def run_stage(sample_directory, stage, force, dry_run, metrics=None, executor=None):
+    """
+    Runs the command of a stage with the executor unless its outputs are up to date, the output of
+    the command is saved in {sample_directory}/pipeline_logs/{stage}.log
+    :param sample_directory:
+    :param stage:
+    :param force:
+    :param dry_run:
+    :param metrics: RunMetrics to add the wall time of the stage to as a {sample}/{stage} phase
+    :param executor: Executor of job_executor.py, a LocalExecutor is used if None
+    :return: Status of the stage
+    """
+    sample = os.path.basename(sample_directory)
+    if not force and stage.is_up_to_date():
+        return STATUS_UP_TO_DATE
+    if dry_run:
+        print(sample + " " + stage.name + ": " + stage.command)
+        return STATUS_DRY_RUN
+    missing_inputs = [input_path for input_path in stage.inputs if not os.path.exists(input_path)]
+    if missing_inputs:
+        print(sample + " " + stage.name + ": missing input " + ", ".join(missing_inputs))
+        return STATUS_FAILED
+    log_directory = sample_directory + "/pipeline_logs"
+    os.makedirs(log_directory, exist_ok=True)
+    print(sample + " " + stage.name + ": started")
+    start_time = time.time()
+    log_path = log_directory + "/" + stage.name + ".log"
+    log_file = open(log_path, "w")
+    log_file.write("Executing command: " + stage.command + "\n")
+    log_file.close()
+    if executor is None:
+        executor = LocalExecutor()
+    job = Job(sample + "_" + stage.name, "set -o errexit -o pipefail; " + stage.command, stage.memory_mb,
+              stage.cpus, log_path)
+    exit_status = executor.run_job(job).exit_status
+    if metrics is not None:
+        metrics.add_phase_time(sample + "/" + stage.name, time.time() - start_time)
+    if exit_status != 0:
+        stage.remove_outputs()
+        print(sample + " " + stage.name + ": failed with exit status " + str(exit_status))
+        return STATUS_FAILED
+    print(sample + " " + stage.name + ": completed in " + str(round(time.time() - start_time, 1)) + " seconds")
+    return STATUS_COMPLETED
+
+
+def run_stages(sample_stage_dict, workers, force=False, dry_run=False, metrics=None, executor=None):
+    """
+    Runs the stages of all samples in a pool of workers. A stage is submitted once the stages it
+    depends on have succeeded, the stages after a failed stage are marked as blocked
+    :param sample_stage_dict: Dictionary of sample directory to its list of Stage
+    :param workers:
+    :param force:
+    :param dry_run:
+    :param metrics: Optional RunMetrics for the wall time of each stage
+    :param executor: Executor of job_executor.py that runs the commands, a LocalExecutor is used if None
+    :return: Dictionary of (sample directory, stage name) to status
+    """
+    status_dict = {}
+    waiting_list = [(sample_directory, stage) for sample_directory, stage_list in sample_stage_dict.items()
+                    for stage in stage_list]
+    stage_name_dict = {sample_directory: set([stage.name for stage in stage_list])
+                       for sample_directory, stage_list in sample_stage_dict.items()}
+    running_dict = {}
+    if executor is None:
+        executor = LocalExecutor()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as thread_executor:
+        while waiting_list or running_dict:
+            still_waiting_list = []
+            for sample_directory, stage in waiting_list:
+                # Dependencies that are not selected to run are taken as done
+                dependency_statuses = [status_dict.get((sample_directory, dependency)) for dependency in stage.depends
+                                       if dependency in stage_name_dict[sample_directory]]
+                if any([status not in SUCCESS_STATUSES and status is not None for status in dependency_statuses]):
+                    status_dict[(sample_directory, stage.name)] = STATUS_BLOCKED
+                elif all([status in SUCCESS_STATUSES for status in dependency_statuses]):
+                    future = thread_executor.submit(run_stage, sample_directory, stage, force, dry_run, metrics,
+                                                    executor)
+                    running_dict[future] = (sample_directory, stage)
+                else:
+                    still_waiting_list.append((sample_directory, stage))
+            waiting_list = still_waiting_list
+            if not running_dict:
+                # Nothing is running, so the remaining stages can not be started
+                for sample_directory, stage in waiting_list:
+                    status_dict[(sample_directory, stage.name)] = STATUS_BLOCKED
+                break
+            done_set, _ = concurrent.futures.wait(running_dict, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done_set:
+                sample_directory, stage = running_dict.pop(future)
+                status_dict[(sample_directory, stage.name)] = future.result()
+    return status_dict
+
+
+if __name__ == "__main__":
+    main()
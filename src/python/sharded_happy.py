@@ -0,0 +1,357 @@
+#!/usr/bin/python3
+
+"""
+Script to run hap.py on shards of the CLC and filtered MGC VCFs at the same time. The variants are
+cut into blocks at gaps between variants, so the variants hap.py compares as one haplotype stay in
+the same shard, and the blocks are packed into shards with about the same number of records. The
+annotated VCFs of the shards are merged and the summary.csv is recomputed from the counts of the
+shards, so aggregate_results.py reads it the same as the summary of a single hap.py run
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import argparse
+import heapq
+import os
+import shutil
+import sys
+import tempfile
+
+from bgzf import BgzfWriter, open_input_file
+from compare_vcfs import VARIANT_TYPES, FILTER_ALL, FILTER_PASS, SUMMARY_HEADER, get_ratio
+from happy_cache import DEFAULT_HAPPY_ARGS, get_happy_command
+from job_executor import Job, add_executor_arguments, make_executor
+from metrics import RunMetrics, add_metrics_arguments
+from pipeline_profile import DEFAULT_PROFILE, load_profile
+from prep_vcf import get_record_end
+from tabix import TabixIndexBuilder
+from vcf_reader import chromosome_sort_key
+
+
+# Variants further apart than this are put in different blocks, much more than the window hap.py
+# uses to compare nearby variants as one haplotype
+BLOCK_GAP = 10000
+DEFAULT_SHARD_MEMORY_MB = 4096
+# Count columns of summary.csv that are added up over the shards
+SUMMARY_COUNT_COLUMNS = ["TRUTH.TOTAL", "TRUTH.TP", "TRUTH.FN", "QUERY.TOTAL", "QUERY.FP", "QUERY.UNK", "FP.gt"]
+
+
+class VariantBlock(object):
+    """
+    Records of the truth and query VCFs on one stretch of a chromosome
+    """
+
+    def __init__(self, chromosome, begin, end):
+        self.chromosome = chromosome
+        self.begin = begin
+        self.end = end
+        self.truth_lines = []
+        self.query_lines = []
+
+    def get_record_count(self):
+        return len(self.truth_lines) + len(self.query_lines)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-t", dest="truth_vcf", required=True,
+        help="Full path to the truth VCF, the bgzipped CLC VCF"
+    )
+    parser.add_argument(
+        "-q", dest="query_vcf", required=True,
+        help="Full path to the query VCF, the filtered MGC VCF"
+    )
+    parser.add_argument(
+        "-o", dest="output_prefix", required=True,
+        help="Output prefix the same as hap.py -o, makes {prefix}.summary.csv and {prefix}.vcf.gz"
+    )
+    parser.add_argument(
+        "-s", "--shards", dest="shard_count", type=int, default=os.cpu_count() or 1,
+        help="Number of shards, default is the number of CPUs"
+    )
+    parser.add_argument(
+        "--shard-memory-mb", dest="shard_memory_mb", type=int, default=DEFAULT_SHARD_MEMORY_MB,
+        help="Memory of the hap.py run of each shard in MB, default is " + str(DEFAULT_SHARD_MEMORY_MB)
+    )
+    parser.add_argument(
+        "-p", dest="profile_path", default=DEFAULT_PROFILE,
+        help="Full path to the pipeline profile for the defaults of -r, --happy and --python2, "
+             "default is config/compareVcf.profile"
+    )
+    parser.add_argument(
+        "-r", dest="reference",
+        help="Full path to the reference FASTA, default is REF_GENOME of the profile"
+    )
+    parser.add_argument(
+        "-a", "--happy-args", dest="happy_args", default=DEFAULT_HAPPY_ARGS,
+        help="Other arguments of hap.py as one string, default is " + DEFAULT_HAPPY_ARGS
+    )
+    parser.add_argument(
+        "--happy", dest="happy",
+        help="Full path to hap.py, default is HAPPY of the profile"
+    )
+    parser.add_argument(
+        "--python2", dest="python2_profile",
+        help="Full path to the python 2.7 PKG_PROFILE sourced before hap.py, default is PYTHON2710 of the profile"
+    )
+    parser.add_argument(
+        "--keep-shards", dest="keep_shards", action="store_true",
+        help="Keep the shard VCFs and hap.py outputs of every shard"
+    )
+    add_executor_arguments(parser)
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    metrics = RunMetrics("sharded_happy", args.metrics_path, args.cprofile_path)
+
+    profile = load_profile(os.path.abspath(args.profile_path))
+    reference = args.reference if args.reference else profile["REF_GENOME"]
+    happy = args.happy if args.happy else profile["HAPPY"]
+    python2_profile = args.python2_profile if args.python2_profile is not None else profile.get("PYTHON2710", "")
+    truth_vcf_path = os.path.abspath(args.truth_vcf)
+    query_vcf_path = os.path.abspath(args.query_vcf)
+    output_prefix = os.path.abspath(args.output_prefix)
+    output_directory = os.path.dirname(output_prefix)
+    os.makedirs(output_directory, exist_ok=True)
+
+    with metrics.phase("make_shards"):
+        truth_header_lines, truth_records = load_vcf_lines(truth_vcf_path)
+        query_header_lines, query_records = load_vcf_lines(query_vcf_path)
+        block_list = make_blocks(truth_records, query_records)
+        # Without any records hap.py is still run once, on the headers
+        shard_list = assign_shards(block_list, args.shard_count) or [[]]
+    metrics.records_read = len(truth_records) + len(query_records)
+    print("Number of blocks: " + str(len(block_list)) + ", number of shards: " + str(len(shard_list)))
+
+    shard_directory = tempfile.mkdtemp(prefix=os.path.basename(output_prefix) + "_shards_", dir=output_directory)
+    job_list = []
+    shard_prefix_list = []
+    for shard_index, shard_block_list in enumerate(shard_list):
+        shard_prefix = shard_directory + "/shard" + str(shard_index)
+        shard_truth_vcf = shard_prefix + "_truth.vcf"
+        shard_query_vcf = shard_prefix + "_query.vcf"
+        write_shard_vcf(shard_truth_vcf, truth_header_lines, [block.truth_lines for block in shard_block_list])
+        write_shard_vcf(shard_query_vcf, query_header_lines, [block.query_lines for block in shard_block_list])
+        command = get_happy_command(happy, python2_profile, shard_truth_vcf, shard_query_vcf, shard_prefix, reference,
+                                    args.happy_args)
+        job_list.append(Job(os.path.basename(output_prefix) + "_shard" + str(shard_index),
+                            "set -o errexit -o pipefail; " + command, args.shard_memory_mb, 1, shard_prefix + ".log"))
+        shard_prefix_list.append(shard_prefix)
+
+    executor = make_executor(args, profile)
+    with metrics.phase("happy"):
+        result_list = executor.run_jobs(job_list)
+    failed_result_list = [result for result in result_list if result.exit_status != 0]
+    if failed_result_list:
+        for result in failed_result_list:
+            print(result.name + " failed with exit status " + str(result.exit_status))
+        print("The shards and their logs are kept in " + shard_directory)
+        metrics.finish()
+        sys.exit(1)
+
+    summary_path = output_prefix + ".summary.csv"
+    merged_vcf_path = output_prefix + ".vcf.gz"
+    with metrics.phase("merge"):
+        merge_summary_files([shard_prefix + ".summary.csv" for shard_prefix in shard_prefix_list], summary_path)
+        record_count = merge_annotated_vcfs([shard_prefix + ".vcf.gz" for shard_prefix in shard_prefix_list],
+                                            merged_vcf_path)
+    if not args.keep_shards:
+        shutil.rmtree(shard_directory)
+
+    metrics.labels["shards"] = len(shard_list)
+    metrics.records_written = record_count
+    metrics.add_input(truth_vcf_path)
+    metrics.add_input(query_vcf_path)
+    metrics.add_output(summary_path)
+    metrics.add_output(merged_vcf_path)
+    metrics.add_output(merged_vcf_path + ".tbi")
+    metrics.finish()
+
+
+def load_vcf_lines(vcf_path):
+    """
+    Reads the header lines and the records of a VCF
+    :param vcf_path:
+    :return: List of header lines, list of (chromosome, 0 based begin, 0 based end, line) of the records
+    """
+    header_lines = []
+    record_list = []
+    vcf_file = open_input_file(vcf_path)
+    for line in vcf_file:
+        if line.startswith("#"):
+            header_lines.append(line)
+            continue
+        if not line.strip():
+            continue
+        if not line.endswith("\n"):
+            line += "\n"
+        line_item = line.split("\t", 4)
+        begin = int(line_item[1]) - 1
+        record_list.append((line_item[0], begin, begin + len(line_item[3]), line))
+    vcf_file.close()
+    return header_lines, record_list
+
+
+def get_chromosome_ranks(record_lists):
+    """
+    Ranks the chromosomes in the order they first appear in the records, so the shards keep the
+    order of the input VCFs
+    :param record_lists:
+    :return: Dictionary of chromosome to rank
+    """
+    chromosome_ranks = {}
+    for record_list in record_lists:
+        for record in record_list:
+            if record[0] not in chromosome_ranks:
+                chromosome_ranks[record[0]] = len(chromosome_ranks)
+    return chromosome_ranks
+
+
+def make_blocks(truth_records, query_records):
+    """
+    Cuts the records of both VCFs into blocks where the next record starts more than BLOCK_GAP
+    after the end of the records before it
+    :param truth_records: List from load_vcf_lines
+    :param query_records: List from load_vcf_lines
+    :return: List of VariantBlock in the order of the input VCFs
+    """
+    chromosome_ranks = get_chromosome_ranks([truth_records, query_records])
+    tagged_records = [(record, True) for record in truth_records] + [(record, False) for record in query_records]
+    # The sort is stable, so the records of a VCF keep their order at the same position
+    tagged_records.sort(key=lambda tagged_record: (chromosome_ranks[tagged_record[0][0]], tagged_record[0][1]))
+    block_list = []
+    block = None
+    for (chromosome, begin, end, line), is_truth in tagged_records:
+        if block is None or block.chromosome != chromosome or begin > block.end + BLOCK_GAP:
+            block = VariantBlock(chromosome, begin, end)
+            block_list.append(block)
+        block.end = max(block.end, end)
+        if is_truth:
+            block.truth_lines.append(line)
+        else:
+            block.query_lines.append(line)
+    return block_list
+
+
+def assign_shards(block_list, shard_count):
+    """
+    Packs the blocks into shards, adding each block from the largest to the shard with the fewest
+    records so far. The blocks of each shard are kept in the order of block_list
+    :param block_list:
+    :param shard_count:
+    :return: List of the lists of VariantBlock of the shards, without empty shards
+    """
+    shard_heap = [(0, shard_index) for shard_index in range(max(shard_count, 1))]
+    shard_block_indexes = [[] for _ in shard_heap]
+    for block_index in sorted(range(len(block_list)), key=lambda index: -block_list[index].get_record_count()):
+        record_count, shard_index = heapq.heappop(shard_heap)
+        shard_block_indexes[shard_index].append(block_index)
+        heapq.heappush(shard_heap, (record_count + block_list[block_index].get_record_count(), shard_index))
+    return [[block_list[block_index] for block_index in sorted(block_indexes)]
+            for block_indexes in shard_block_indexes if block_indexes]
+
+
+def write_shard_vcf(shard_vcf_path, header_lines, line_lists):
+    shard_vcf = open(shard_vcf_path, "w")
+    shard_vcf.writelines(header_lines)
+    for line_list in line_lists:
+        shard_vcf.writelines(line_list)
+    shard_vcf.close()
+
+
+def merge_summary_files(summary_path_list, output_path):
+    """
+    Adds up the counts of the summary.csv files of the shards and recomputes the metrics from the
+    sums with the definitions of hap.py, where the query TP are the query variants that are neither
+    FP nor UNK. The Ti/Tv and het/hom ratios can not be recomputed from the summaries, so they are empty
+    :param summary_path_list:
+    :param output_path:
+    :return:
+    """
+    count_dict = {}
+    for summary_path in summary_path_list:
+        summary_file = open(summary_path, "r")
+        header_list = summary_file.readline().rstrip().split(",")
+        type_index = header_list.index("Type")
+        filter_index = header_list.index("Filter")
+        count_index_list = [header_list.index(column) for column in SUMMARY_COUNT_COLUMNS]
+        for line in summary_file:
+            line_item = line.rstrip().split(",")
+            if len(line_item) < len(header_list):
+                continue
+            row_key = (line_item[type_index], line_item[filter_index])
+            counts = count_dict.setdefault(row_key, [0] * len(SUMMARY_COUNT_COLUMNS))
+            for column_index, count_index in enumerate(count_index_list):
+                counts[column_index] += int(line_item[count_index]) if line_item[count_index] else 0
+        summary_file.close()
+
+    output_file = open(output_path, "w")
+    output_file.write(SUMMARY_HEADER + "\n")
+    for variant_type in VARIANT_TYPES:
+        for quality_filter in [FILTER_ALL, FILTER_PASS]:
+            counts = count_dict.get((variant_type, quality_filter))
+            if counts is None:
+                continue
+            truth_total, truth_tp, truth_fn, query_total, query_fp, query_unk, fp_gt = counts
+            query_tp = query_total - query_fp - query_unk
+            recall = get_ratio(truth_tp, truth_tp + truth_fn)
+            precision = get_ratio(query_tp, query_tp + query_fp)
+            frac_na = get_ratio(query_unk, query_total)
+            # 2 * precision * recall / (precision + recall) without rounding precision and recall first
+            f1_score = get_ratio(2 * query_tp * truth_tp,
+                                 query_tp * (truth_tp + truth_fn) + truth_tp * (query_tp + query_fp))
+            output_file.write(",".join([variant_type, quality_filter] + [str(count) for count in counts] +
+                                       [str(recall), str(precision), str(frac_na), str(f1_score), "", "", "", ""]) +
+                              "\n")
+    output_file.close()
+
+
+def get_contig_ranks(header_lines):
+    """
+    Ranks the chromosomes in the order of the ##contig lines of the header
+    :param header_lines:
+    :return: Dictionary of chromosome to rank
+    """
+    contig_ranks = {}
+    for line in header_lines:
+        if line.startswith("##contig=<ID="):
+            contig_ranks[line[len("##contig=<ID="):].split(",")[0].rstrip(">\n")] = len(contig_ranks)
+    return contig_ranks
+
+
+def merge_annotated_vcfs(vcf_path_list, output_vcf_path):
+    """
+    Merges the annotated VCFs of the shards into one bgzipped and tabix-ed VCF with the header of the
+    first shard, sorted in the order of its ##contig lines, and in the natural chromosome order for
+    contigs without one
+    :param vcf_path_list:
+    :param output_vcf_path:
+    :return: Number of records written
+    """
+    header_lines = []
+    record_list = []
+    for vcf_path in vcf_path_list:
+        vcf_header_lines, vcf_records = load_vcf_lines(vcf_path)
+        if not header_lines:
+            header_lines = vcf_header_lines
+        record_list.extend(vcf_records)
+    contig_ranks = get_contig_ranks(header_lines)
+    record_list.sort(key=lambda record: (contig_ranks.get(record[0], len(contig_ranks)),
+                                         chromosome_sort_key(record[0]), record[1]))
+    index_builder = TabixIndexBuilder()
+    output_vcf = BgzfWriter(output_vcf_path)
+    output_vcf.write("".join(header_lines).encode())
+    for chromosome, begin, _, line in record_list:
+        record_begin = output_vcf.tell()
+        output_vcf.write(line.encode())
+        index_builder.add_record(chromosome, begin, get_record_end(begin, line.split("\t", 8)), record_begin,
+                                 output_vcf.tell())
+    output_vcf.close()
+    index_builder.write(output_vcf_path + ".tbi", output_vcf.get_virtual_offset)
+    return len(record_list)
+
+
+if __name__ == "__main__":
+    main()
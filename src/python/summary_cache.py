@@ -0,0 +1,81 @@
+#!/usr/bin/python3
+
+"""
+On-disk cache of the parsed hap.py summary.csv rows, so reruns of aggregate_results.py only
+parse the summary files that are new or changed since the last run
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import json
+import os
+
+
+CACHE_VERSION = 1
+
+
+class SummaryCache(object):
+    """
+    JSON cache of parsed summary rows keyed by the full path of the summary file. An entry is only
+    used while the size and modification time of the file are unchanged
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.isfile(cache_path):
+            with open(cache_path, "r") as cache_file:
+                cache_content = json.load(cache_file)
+            # Ignore caches written by a different version of the cache format
+            if cache_content.get("version") == CACHE_VERSION:
+                self.entries = cache_content["entries"]
+
+    def get(self, file_path):
+        """
+        Returns the cached rows of the file, None if the file is not cached or has changed
+        :param file_path:
+        :return:
+        """
+        file_path = os.path.abspath(file_path)
+        entry = self.entries.get(file_path)
+        file_stat = os.stat(file_path)
+        if entry is not None and entry["size"] == file_stat.st_size and entry["mtime"] == file_stat.st_mtime_ns:
+            self.hits += 1
+            return entry["rows"]
+        self.misses += 1
+        return None
+
+    def put(self, file_path, rows):
+        """
+        Adds the parsed rows of the file to the cache
+        :param file_path:
+        :param rows:
+        :return:
+        """
+        file_path = os.path.abspath(file_path)
+        file_stat = os.stat(file_path)
+        self.entries[file_path] = {"size": file_stat.st_size, "mtime": file_stat.st_mtime_ns, "rows": rows}
+
+    def evict_missing(self):
+        """
+        Removes the entries of files that no longer exist
+        :return: Number of entries removed
+        """
+        missing_paths = [file_path for file_path in self.entries if not os.path.isfile(file_path)]
+        for file_path in missing_paths:
+            del self.entries[file_path]
+        return len(missing_paths)
+
+    def save(self):
+        """
+        Writes the cache to a temporary file and moves it in place, so an interrupted run does not
+        leave a truncated cache behind
+        :return:
+        """
+        temporary_path = self.cache_path + ".tmp"
+        with open(temporary_path, "w") as cache_file:
+            json.dump({"version": CACHE_VERSION, "entries": self.entries}, cache_file)
+        os.replace(temporary_path, self.cache_path)
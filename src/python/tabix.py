@@ -0,0 +1,523 @@
+#!/usr/bin/python3
+
+"""
+Reader for the tabix (.tbi) and CSI (.csi) indexes of bgzipped VCFs. The index gives the BGZF
+blocks that hold the records of a region, so only those blocks are read and decompressed.
+TabixIndexBuilder makes the .tbi of a VCF while it is written with BgzfWriter
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import os
+import struct
+import sys
+
+from bgzf import BgzfReader, BgzfWriter, open_input_file, read_bgzf_block, decompress_bgzf_block
+from vcf_reader import parse_region, chromosome_sort_key
+
+
+TBI_MAGIC = b"TBI\x01"
+CSI_MAGIC = b"CSI\x01"
+# Bin layout of the .tbi index, CSI indexes store their own
+TBI_MIN_SHIFT = 14
+TBI_DEPTH = 5
+# Preset of tabix -p vcf: format, col_seq, col_beg, col_end, meta character and lines to skip
+TBI_VCF_PRESET = (2, 1, 2, 0, ord("#"), 0)
+# Bin holding the offsets and the record count of a reference instead of chunks
+TBI_PSEUDO_BIN = 37450
+
+
+def add_region_arguments(parser):
+    """
+    Adds the --region and --regions options to the argument parser of a script
+    :param parser:
+    :return:
+    """
+    parser.add_argument(
+        "--region", dest="region_strings", nargs="+", default=[],
+        help="Only read the records in these regions, given as chr, chr:pos or chr:start-end, 1 based and "
+             "inclusive. Bgzipped VCFs with a .tbi or .csi index are read through the index"
+    )
+    parser.add_argument(
+        "--regions", dest="regions_bed",
+        help="Full path to a BED file of the regions to read, combined with --region"
+    )
+
+
+def get_regions(args, parser):
+    """
+    Collects the regions of --region and --regions
+    :param args:
+    :param parser: Used to report invalid regions
+    :return: Sorted and merged list of (chromosome, 1 based start, 1 based end), None if no region is given
+    """
+    if not args.region_strings and not args.regions_bed:
+        return None
+    regions = []
+    try:
+        for region_string in args.region_strings:
+            regions.append(parse_region(region_string))
+    except ValueError as error:
+        parser.error(str(error))
+    if args.regions_bed:
+        regions.extend(read_bed_regions(args.regions_bed))
+    return merge_regions(regions)
+
+
+def read_bed_regions(bed_path):
+    """
+    Reads the regions of a BED file, converting the 0 based starts to 1 based
+    :param bed_path:
+    :return: List of (chromosome, 1 based start, 1 based end)
+    """
+    regions = []
+    bed_file = open_input_file(bed_path)
+    for line in bed_file:
+        if not line.strip() or line.startswith(("#", "track", "browser")):
+            continue
+        line_item = line.rstrip("\n").split("\t")
+        regions.append((line_item[0], int(line_item[1]) + 1, int(line_item[2])))
+    bed_file.close()
+    return regions
+
+
+def merge_regions(regions):
+    """
+    Sorts the regions in natural chromosome order and merges the overlapping and adjacent regions,
+    a whole chromosome region has None as start and end
+    :param regions:
+    :return:
+    """
+    merged_regions = []
+    for chromosome, start, end in sorted(regions, key=lambda region: (chromosome_sort_key(region[0]),
+                                                                      region[1] or 0)):
+        if start is None:
+            start, end = 1, sys.maxsize
+        if merged_regions and merged_regions[-1][0] == chromosome and start <= merged_regions[-1][2] + 1:
+            if end > merged_regions[-1][2]:
+                merged_regions[-1] = (chromosome, merged_regions[-1][1], end)
+        else:
+            merged_regions.append((chromosome, start, end))
+    return merged_regions
+
+
+def region_to_bed_interval(region):
+    """
+    Converts a region to the 0 based half open interval used by the index
+    :param region:
+    :return: chromosome, begin, end
+    """
+    chromosome, start, end = region
+    return chromosome, start - 1, end
+
+
+def reg2bins(begin, end, min_shift, depth):
+    """
+    Lists the bins that can hold records overlapping [begin, end), the same as hts_reg2bins of htslib
+    :param begin: 0 based begin
+    :param end: 0 based end, exclusive
+    :param min_shift:
+    :param depth:
+    :return:
+    """
+    max_position = 1 << (min_shift + depth * 3)
+    end = min(end, max_position)
+    if begin >= end:
+        return []
+    end -= 1
+    bins = []
+    level_start = 0
+    shift = min_shift + depth * 3
+    for level in range(depth + 1):
+        bins.extend(range(level_start + (begin >> shift), level_start + (end >> shift) + 1))
+        shift -= 3
+        level_start += 1 << (level * 3)
+    return bins
+
+
+def reg2bin(begin, end, min_shift, depth):
+    """
+    Finds the smallest bin that holds [begin, end), the same as hts_reg2bin of htslib
+    :param begin: 0 based begin
+    :param end: 0 based end, exclusive
+    :param min_shift:
+    :param depth:
+    :return:
+    """
+    end -= 1
+    shift = min_shift
+    level_start = ((1 << (depth * 3)) - 1) // 7
+    for level in range(depth, 0, -1):
+        if begin >> shift == end >> shift:
+            return level_start + (begin >> shift)
+        shift += 3
+        level_start -= 1 << ((level - 1) * 3)
+    return 0
+
+
+class TabixIndexBuilder(object):
+    """
+    Builds the .tbi index of a bgzipped VCF from the records as they are written. The records must be
+    sorted by position within each chromosome, with each chromosome in one stretch, the same as tabix
+    requires. The offsets are positions from BgzfWriter.tell(), turned into virtual offsets in write()
+    """
+
+    def __init__(self):
+        self.names = []
+        # Per reference: dictionary of bin to list of [begin, end] chunks, linear index, first and last offset
+        # and record count
+        self.bin_list = []
+        self.linear_index_list = []
+        self.offset_range_list = []
+        self.record_count_list = []
+        self._bin = None
+        self._chunk_begin = None
+        self._last_begin = -1
+
+    def _finish_reference(self):
+        if self._bin is not None:
+            self.bin_list[-1].setdefault(self._bin, []).append([self._chunk_begin, self.offset_range_list[-1][1]])
+        self._bin = None
+
+    def add_record(self, chromosome, begin, end, record_begin, record_end):
+        """
+        Adds a record to the index
+        :param chromosome:
+        :param begin: 0 based begin
+        :param end: 0 based end, exclusive
+        :param record_begin: Position of the start of the record line
+        :param record_end: Position after the end of the record line
+        :return:
+        """
+        if not self.names or self.names[-1] != chromosome:
+            if chromosome in self.names:
+                raise ValueError("The records of " + chromosome + " are not together, sort the VCF first")
+            self._finish_reference()
+            self.names.append(chromosome)
+            self.bin_list.append({})
+            self.linear_index_list.append([])
+            self.offset_range_list.append([record_begin, record_end])
+            self.record_count_list.append(0)
+            self._last_begin = -1
+        if begin < self._last_begin:
+            raise ValueError("The records of " + chromosome + " are not sorted at position " + str(begin + 1) +
+                             ", sort the VCF first")
+        self._last_begin = begin
+        end = max(end, begin + 1)
+        linear_index = self.linear_index_list[-1]
+        for window in range(begin >> TBI_MIN_SHIFT, ((end - 1) >> TBI_MIN_SHIFT) + 1):
+            if window >= len(linear_index):
+                linear_index.extend([None] * (window + 1 - len(linear_index)))
+            if linear_index[window] is None:
+                linear_index[window] = record_begin
+        # Records in a row with the same bin make one chunk
+        record_bin = reg2bin(begin, end, TBI_MIN_SHIFT, TBI_DEPTH)
+        if record_bin != self._bin:
+            if self._bin is not None:
+                self.bin_list[-1].setdefault(self._bin, []).append([self._chunk_begin, record_begin])
+            self._bin = record_bin
+            self._chunk_begin = record_begin
+        self.offset_range_list[-1][1] = record_end
+        self.record_count_list[-1] += 1
+
+    def write(self, index_path, get_virtual_offset):
+        """
+        Writes the .tbi index
+        :param index_path:
+        :param get_virtual_offset: BgzfWriter.get_virtual_offset of the closed VCF writer
+        :return:
+        """
+        self._finish_reference()
+        name_data = b"".join([name.encode() + b"\x00" for name in self.names])
+        index_data = [TBI_MAGIC, struct.pack("<i6i", len(self.names), *TBI_VCF_PRESET),
+                      struct.pack("<i", len(name_data)), name_data]
+        for reference_index in range(len(self.names)):
+            bin_dict = self.bin_list[reference_index]
+            index_data.append(struct.pack("<i", len(bin_dict) + 1))
+            for bin_number in sorted(bin_dict):
+                chunks = []
+                for chunk_begin, chunk_end in bin_dict[bin_number]:
+                    chunk_begin = get_virtual_offset(chunk_begin)
+                    chunk_end = get_virtual_offset(chunk_end)
+                    # Chunks that meet in the same BGZF block are merged, the same as htslib
+                    if chunks and chunks[-1][1] >> 16 >= chunk_begin >> 16:
+                        chunks[-1][1] = max(chunks[-1][1], chunk_end)
+                    else:
+                        chunks.append([chunk_begin, chunk_end])
+                index_data.append(struct.pack("<Ii", bin_number, len(chunks)))
+                index_data.extend([struct.pack("<QQ", chunk_begin, chunk_end) for chunk_begin, chunk_end in chunks])
+            offset_begin, offset_end = self.offset_range_list[reference_index]
+            index_data.append(struct.pack("<IiQQQQ", TBI_PSEUDO_BIN, 2, get_virtual_offset(offset_begin),
+                                          get_virtual_offset(offset_end), self.record_count_list[reference_index], 0))
+            # Windows without a record starting in them take the offset of the next window
+            linear_index = [get_virtual_offset(offset) if offset is not None else None
+                            for offset in self.linear_index_list[reference_index]]
+            for window in range(len(linear_index) - 2, -1, -1):
+                if linear_index[window] is None:
+                    linear_index[window] = linear_index[window + 1]
+            index_data.append(struct.pack("<i" + str(len(linear_index)) + "Q", len(linear_index), *linear_index))
+        # Number of records without coordinates
+        index_data.append(struct.pack("<Q", 0))
+        index_writer = BgzfWriter(index_path, threads=1)
+        index_writer.write(b"".join(index_data))
+        index_writer.close()
+
+
+class TabixIndex(object):
+    """
+    Bins, chunks and linear index of a .tbi or .csi index. Chunks are pairs of BGZF virtual offsets,
+    the compressed offset of a block shifted left by 16 bits plus the offset in the uncompressed block
+    """
+
+    def __init__(self, index_path):
+        self.index_path = index_path
+        # Per reference: dictionary of bin to list of (begin, end) chunks, and the linear index
+        self.bin_list = []
+        self.linear_index_list = []
+        self.names = []
+        # Both index formats are BGZF compressed
+        reader = BgzfReader(index_path, threads=1)
+        data = reader.readall()
+        reader.close()
+        if data[:4] == TBI_MAGIC:
+            self._parse_tbi(data)
+        elif data[:4] == CSI_MAGIC:
+            self._parse_csi(data)
+        else:
+            raise IOError("Not a tabix or CSI index: " + index_path)
+        self.name_index = {name: index for index, name in enumerate(self.names)}
+
+    def _parse_names(self, data, offset):
+        (name_length,) = struct.unpack_from("<i", data, offset)
+        offset += 4
+        self.names = [name.decode() for name in data[offset:offset + name_length].split(b"\x00") if name]
+        return offset + name_length
+
+    def _parse_bins(self, data, offset, has_loffset):
+        (bin_count,) = struct.unpack_from("<i", data, offset)
+        offset += 4
+        bin_dict = {}
+        for _ in range(bin_count):
+            (bin_number,) = struct.unpack_from("<I", data, offset)
+            offset += 4
+            if has_loffset:
+                offset += 8
+            (chunk_count,) = struct.unpack_from("<i", data, offset)
+            offset += 4
+            chunks = struct.unpack_from("<" + str(chunk_count * 2) + "Q", data, offset)
+            offset += chunk_count * 16
+            bin_dict[bin_number] = list(zip(chunks[0::2], chunks[1::2]))
+        return bin_dict, offset
+
+    def _parse_tbi(self, data):
+        self.min_shift = TBI_MIN_SHIFT
+        self.depth = TBI_DEPTH
+        (reference_count,) = struct.unpack_from("<i", data, 4)
+        # Skip format, col_seq, col_beg, col_end, meta and skip
+        self._parse_linear_references(data, self._parse_names(data, 32), reference_count)
+
+    def _parse_linear_references(self, data, offset, reference_count):
+        """
+        Parses the bins and the linear index of each reference, the layout shared by .tbi and .bai
+        :param data:
+        :param offset:
+        :param reference_count:
+        :return: Offset after the last reference
+        """
+        for _ in range(reference_count):
+            bin_dict, offset = self._parse_bins(data, offset, False)
+            (interval_count,) = struct.unpack_from("<i", data, offset)
+            offset += 4
+            linear_index = struct.unpack_from("<" + str(interval_count) + "Q", data, offset)
+            offset += interval_count * 8
+            self.bin_list.append(bin_dict)
+            self.linear_index_list.append(linear_index)
+        return offset
+
+    def _parse_csi(self, data):
+        self.min_shift, self.depth, auxiliary_length = struct.unpack_from("<iii", data, 4)
+        # The auxiliary data of a tabix style CSI holds the same header as a .tbi, followed by the names
+        if auxiliary_length >= 28:
+            self._parse_names(data, 16 + 24)
+        offset = 16 + auxiliary_length
+        (reference_count,) = struct.unpack_from("<i", data, offset)
+        offset += 4
+        for _ in range(reference_count):
+            bin_dict, offset = self._parse_bins(data, offset, True)
+            self.bin_list.append(bin_dict)
+            self.linear_index_list.append(())
+
+    def get_chunks(self, chromosome, begin, end):
+        """
+        Finds the chunks that can hold records overlapping [begin, end), merged and sorted
+        :param chromosome:
+        :param begin: 0 based begin
+        :param end: 0 based end, exclusive
+        :return: List of (begin, end) virtual offsets
+        """
+        reference_index = self.name_index.get(chromosome)
+        if reference_index is None:
+            return []
+        bin_dict = self.bin_list[reference_index]
+        linear_index = self.linear_index_list[reference_index]
+        # Records before the smallest offset of the linear index window of begin do not overlap the region
+        minimum_offset = 0
+        if linear_index:
+            window = min(begin >> TBI_MIN_SHIFT, len(linear_index) - 1)
+            minimum_offset = linear_index[window]
+        chunks = []
+        for bin_number in reg2bins(begin, end, self.min_shift, self.depth):
+            for chunk_begin, chunk_end in bin_dict.get(bin_number, []):
+                if chunk_end > minimum_offset:
+                    chunks.append((max(chunk_begin, minimum_offset), chunk_end))
+        chunks.sort()
+        merged_chunks = []
+        for chunk_begin, chunk_end in chunks:
+            if merged_chunks and chunk_begin <= merged_chunks[-1][1]:
+                if chunk_end > merged_chunks[-1][1]:
+                    merged_chunks[-1] = (merged_chunks[-1][0], chunk_end)
+            else:
+                merged_chunks.append((chunk_begin, chunk_end))
+        return merged_chunks
+
+
+def find_index(vcf_path):
+    """
+    Finds the .tbi or .csi index next to a VCF
+    :param vcf_path:
+    :return: Path to the index, None if there is none
+    """
+    for extension in (".tbi", ".csi"):
+        if os.path.isfile(vcf_path + extension):
+            return vcf_path + extension
+    return None
+
+
+def read_chunk(handle, chunk_begin, chunk_end):
+    """
+    Reads the uncompressed data between two virtual offsets
+    :param handle: BGZF file opened in binary mode
+    :param chunk_begin:
+    :param chunk_end:
+    :return:
+    """
+    block_offset = chunk_begin >> 16
+    end_block_offset = chunk_end >> 16
+    handle.seek(block_offset)
+    data_list = []
+    while block_offset <= end_block_offset:
+        block = read_bgzf_block(handle)
+        if block is None:
+            break
+        data = decompress_bgzf_block(block)
+        if block_offset == end_block_offset:
+            data = data[:chunk_end & 0xFFFF]
+        data_list.append(data)
+        block_offset += len(block)
+    return b"".join(data_list)[chunk_begin & 0xFFFF:]
+
+
+def overlaps(line_item, chromosome, begin, end):
+    """
+    Checks if a VCF data line overlaps the 0 based interval [begin, end) of chromosome
+    :param line_item: Split VCF data line
+    :param chromosome:
+    :param begin:
+    :param end:
+    :return:
+    """
+    if line_item[0] != chromosome:
+        return False
+    record_begin = int(line_item[1]) - 1
+    return record_begin < end and record_begin + max(len(line_item[3]), 1) > begin
+
+
+def iterate_header_lines(vcf_path):
+    """
+    Yields the header lines at the start of a VCF
+    :param vcf_path:
+    :return:
+    """
+    vcf_file = open_input_file(vcf_path, threads=1)
+    for line in vcf_file:
+        if not line.startswith("#"):
+            break
+        yield line
+    vcf_file.close()
+
+
+def iterate_region_lines(vcf_path, regions, index_path):
+    """
+    Yields the header lines of the VCF and then the data lines overlapping the regions, read through
+    the index. A record overlapping two regions is only yielded for the first one
+    :param vcf_path:
+    :param regions: Merged regions from merge_regions
+    :param index_path:
+    :return:
+    """
+    for line in iterate_header_lines(vcf_path):
+        yield line
+    index = TabixIndex(index_path)
+    handle = open(vcf_path, "rb")
+    try:
+        previous_interval = None
+        for region in regions:
+            chromosome, begin, end = region_to_bed_interval(region)
+            for chunk_begin, chunk_end in index.get_chunks(chromosome, begin, end):
+                for line in read_chunk(handle, chunk_begin, chunk_end).decode().splitlines(True):
+                    if line.startswith("#"):
+                        continue
+                    line_item = line.split("\t", 4)
+                    if not overlaps(line_item, chromosome, begin, end):
+                        continue
+                    if previous_interval is not None and overlaps(line_item, *previous_interval):
+                        continue
+                    yield line
+            previous_interval = (chromosome, begin, end)
+    finally:
+        handle.close()
+
+
+def iterate_filtered_lines(vcf_path, regions):
+    """
+    Yields the header lines and the data lines overlapping the regions by reading the whole VCF,
+    used for VCFs without an index
+    :param vcf_path:
+    :param regions: Merged regions from merge_regions
+    :return:
+    """
+    interval_dict = {}
+    for region in regions:
+        chromosome, begin, end = region_to_bed_interval(region)
+        interval_dict.setdefault(chromosome, []).append((begin, end))
+    vcf_file = open_input_file(vcf_path)
+    try:
+        for line in vcf_file:
+            if line.startswith("#"):
+                yield line
+                continue
+            line_item = line.split("\t", 4)
+            for begin, end in interval_dict.get(line_item[0], []):
+                if overlaps(line_item, line_item[0], begin, end):
+                    yield line
+                    break
+    finally:
+        vcf_file.close()
+
+
+def open_vcf(vcf_path, regions=None):
+    """
+    Opens a VCF for reading lines. With regions, only the header lines and the records overlapping
+    the regions are read, through the .tbi or .csi index if the VCF has one
+    :param vcf_path:
+    :param regions: Merged regions from get_regions, None to read the whole VCF
+    :return: Iterable of lines with a close() method
+    """
+    if regions is None:
+        return open_input_file(vcf_path)
+    index_path = find_index(vcf_path)
+    if index_path is None:
+        print("No index found for " + vcf_path + ", reading the whole file for the regions")
+        return iterate_filtered_lines(vcf_path, regions)
+    return iterate_region_lines(vcf_path, regions, index_path)
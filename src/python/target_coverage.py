@@ -0,0 +1,321 @@
+#!/usr/bin/python3
+
+"""
+Script to compute the coverage of the target regions from a BAM without GATK DepthOfCoverage.
+The reads of each cluster of nearby targets are read once through the .bai index and their aligned
+bases are added to a fixed size depth buffer, and the per-target and per-sample summaries are written in the format of
+the DepthOfCoverage .sample_interval_summary and .sample_summary files
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import argparse
+import math
+import os
+
+import numpy
+
+from bam_reader import BamFile, DEFAULT_SKIP_FLAGS, CIGAR_MATCH, CIGAR_INSERTION, CIGAR_DELETION, CIGAR_SKIP, \
+    CIGAR_SOFT_CLIP, CIGAR_SEQUENCE_MATCH, CIGAR_SEQUENCE_MISMATCH
+from metrics import RunMetrics, add_metrics_arguments
+from tabix import read_bed_regions, merge_regions
+
+
+# Number of bases in the depth buffer, longer targets are counted in windows of this size
+DEPTH_BUFFER_SIZE = 1 << 20
+# Targets closer than this are counted with one fetch of the reads
+TARGET_CLUSTER_DISTANCE = 1000
+ALIGNED_OPERATIONS = (CIGAR_MATCH, CIGAR_SEQUENCE_MATCH, CIGAR_SEQUENCE_MISMATCH)
+QUERY_OPERATIONS = (CIGAR_INSERTION, CIGAR_SOFT_CLIP)
+REFERENCE_SKIP_OPERATIONS = (CIGAR_DELETION, CIGAR_SKIP)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-b", dest="bam", required=True,
+        help="Full path to the BAM, indexed with a .bai index"
+    )
+    parser.add_argument(
+        "-t", dest="target_bed", required=True,
+        help="Full path to the BED file of the target regions, overlapping and adjacent targets are merged "
+             "the same as DepthOfCoverage"
+    )
+    parser.add_argument(
+        "-o", dest="output_prefix", required=True,
+        help="Output prefix the same as DepthOfCoverage -O, makes {prefix}.sample_interval_summary and "
+             "{prefix}.sample_summary"
+    )
+    parser.add_argument(
+        "-s", dest="sample_name",
+        help="Sample name used in the result files, default is the name of the BAM"
+    )
+    parser.add_argument(
+        "-c", "--summary-coverage-threshold", dest="coverage_thresholds", type=int, nargs="+", default=[15],
+        help="Coverage thresholds for the percentage of bases at or above the threshold, default is 15"
+    )
+    parser.add_argument(
+        "-q", "--min-MQ", dest="min_mapping_quality", type=int, default=1,
+        help="Skip the reads with a mapping quality below this, default is 1 the same as the read filters "
+             "of DepthOfCoverage"
+    )
+    parser.add_argument(
+        "-Q", "--min-BQ", dest="min_base_quality", type=int, default=0,
+        help="Skip the bases with a base quality below this, default is 0"
+    )
+    add_metrics_arguments(parser)
+
+    args = parser.parse_args()
+    metrics = RunMetrics("target_coverage", args.metrics_path, args.cprofile_path)
+
+    bam_path = os.path.abspath(args.bam)
+    sample_name = args.sample_name if args.sample_name else os.path.basename(bam_path).split(".")[0]
+    coverage_thresholds = sorted(set(args.coverage_thresholds))
+    output_prefix = os.path.abspath(args.output_prefix)
+    metrics.labels["sample"] = sample_name
+
+    target_list = merge_regions(read_bed_regions(os.path.abspath(args.target_bed)))
+    print("Number of targets after merging: " + str(len(target_list)))
+
+    interval_summary_path = output_prefix + ".sample_interval_summary"
+    interval_summary_file = open(interval_summary_path, "w")
+    interval_summary_file.write(get_interval_summary_header(sample_name, coverage_thresholds) + "\n")
+    sample_histogram = numpy.zeros(1, dtype=numpy.int64)
+    depth_buffer = numpy.zeros(DEPTH_BUFFER_SIZE + 1, dtype=numpy.int32)
+    bam_file = BamFile(bam_path)
+    with metrics.phase("target_coverage"):
+        for chromosome, begin, end, cluster in cluster_targets(target_list, DEPTH_BUFFER_SIZE):
+            histogram_list = get_cluster_histograms(bam_file, chromosome, begin, end, cluster, depth_buffer,
+                                                    args.min_mapping_quality, args.min_base_quality, metrics)
+            for (start, target_end), histogram in zip(cluster, histogram_list):
+                interval_summary_file.write(get_interval_summary_line(
+                    chromosome + ":" + str(start) + "-" + str(target_end), histogram, coverage_thresholds) + "\n")
+                sample_histogram = add_histograms(sample_histogram, histogram)
+    bam_file.close()
+    interval_summary_file.close()
+
+    sample_summary_path = output_prefix + ".sample_summary"
+    write_sample_summary(sample_summary_path, sample_name, sample_histogram, coverage_thresholds)
+
+    metrics.records_written = len(target_list)
+    metrics.add_input(bam_path)
+    metrics.add_output(interval_summary_path)
+    metrics.add_output(sample_summary_path)
+    metrics.finish()
+
+
+def add_histograms(histogram, other_histogram):
+    """
+    Adds two depth histograms of different lengths
+    :param histogram:
+    :param other_histogram:
+    :return: The sum, histogram is reused if it is long enough
+    """
+    if len(other_histogram) > len(histogram):
+        histogram, other_histogram = other_histogram.astype(numpy.int64), histogram
+    histogram[:len(other_histogram)] += other_histogram
+    return histogram
+
+
+def cluster_targets(target_list, max_cluster_length):
+    """
+    Groups the merged targets into clusters of nearby targets on the same chromosome, a cluster spans at
+    most max_cluster_length bases so its depth fits in the depth buffer. Longer targets are a cluster alone
+    :param target_list: Sorted list of (chromosome, 1 based start, end) without overlaps
+    :param max_cluster_length:
+    :return: List of (chromosome, 0 based begin, end, [(start, end) of the targets of the cluster])
+    """
+    cluster_list = []
+    for chromosome, start, end in target_list:
+        cluster = cluster_list[-1] if cluster_list else None
+        if cluster is not None and cluster[0] == chromosome and start <= cluster[2] + TARGET_CLUSTER_DISTANCE and \
+                end - cluster[1] <= max_cluster_length:
+            cluster[3].append((start, end))
+            cluster_list[-1] = (chromosome, cluster[1], end, cluster[3])
+        else:
+            cluster_list.append((chromosome, start - 1, end, [(start, end)]))
+    return cluster_list
+
+
+def get_cluster_histograms(bam_file, chromosome, begin, end, cluster, depth_buffer, min_mapping_quality,
+                           min_base_quality, metrics=None):
+    """
+    Counts the depth of every base of the targets of a cluster from a single fetch of the reads of the cluster
+    :param bam_file: BamFile
+    :param chromosome:
+    :param begin: 0 based begin of the cluster
+    :param end: 0 based end of the cluster, exclusive
+    :param cluster: List of (1 based start, end) of the targets
+    :param depth_buffer: Buffer reused for every cluster, one longer than the window size
+    :param min_mapping_quality:
+    :param min_base_quality:
+    :param metrics: RunMetrics to count the reads in
+    :return: List of the depth histogram of each target
+    """
+    if len(cluster) == 1:
+        # A target longer than the depth buffer is counted in windows
+        return [get_target_histogram(bam_file, chromosome, begin, end, depth_buffer, min_mapping_quality,
+                                     min_base_quality, metrics)]
+    depth = count_window_depth(bam_file, chromosome, begin, end, depth_buffer, min_mapping_quality,
+                               min_base_quality, metrics)
+    return [numpy.bincount(depth[start - 1 - begin:target_end - begin]) for start, target_end in cluster]
+
+
+def get_target_histogram(bam_file, chromosome, begin, end, depth_buffer, min_mapping_quality, min_base_quality,
+                         metrics=None):
+    """
+    Counts the depth of every base of a target in windows of the depth buffer size
+    :param bam_file: BamFile
+    :param chromosome:
+    :param begin: 0 based begin
+    :param end: 0 based end, exclusive
+    :param depth_buffer: Buffer reused for every window, one longer than the window size
+    :param min_mapping_quality:
+    :param min_base_quality:
+    :param metrics: RunMetrics to count the reads in
+    :return: Histogram of the number of bases at each depth
+    """
+    histogram = numpy.zeros(1, dtype=numpy.int64)
+    window_size = len(depth_buffer) - 1
+    for window_begin in range(begin, end, window_size):
+        window_end = min(window_begin + window_size, end)
+        depth = count_window_depth(bam_file, chromosome, window_begin, window_end, depth_buffer,
+                                   min_mapping_quality, min_base_quality, metrics)
+        histogram = add_histograms(histogram, numpy.bincount(depth))
+    return histogram
+
+
+def count_window_depth(bam_file, chromosome, window_begin, window_end, depth_buffer, min_mapping_quality,
+                       min_base_quality, metrics=None):
+    """
+    Counts the depth of the bases in [window_begin, window_end). The start and end of every aligned block
+    of the reads are marked in the buffer, and the cumulative sum of the marks is the depth.
+    Deletions are not counted, the same as DepthOfCoverage
+    :param bam_file:
+    :param chromosome:
+    :param window_begin:
+    :param window_end:
+    :param depth_buffer:
+    :param min_mapping_quality:
+    :param min_base_quality:
+    :param metrics:
+    :return: View of the buffer with the depth of each base of the window
+    """
+    window_length = window_end - window_begin
+    marks = depth_buffer[:window_length + 1]
+    marks.fill(0)
+    block_starts = []
+    block_ends = []
+    read_count = 0
+    for read in bam_file.fetch(chromosome, window_begin, window_end):
+        if read.flag & DEFAULT_SKIP_FLAGS or read.mapping_quality < min_mapping_quality:
+            continue
+        read_count += 1
+        reference_position = read.reference_start
+        query_index = 0
+        for operation, length in read.cigar:
+            if reference_position >= window_end:
+                break
+            if operation in ALIGNED_OPERATIONS:
+                block_start = max(reference_position, window_begin)
+                block_end = min(reference_position + length, window_end)
+                if block_start < block_end:
+                    block_starts.append(block_start - window_begin)
+                    block_ends.append(block_end - window_begin)
+                    if min_base_quality > 0:
+                        # Take out the low quality bases as blocks of one base
+                        qualities = numpy.frombuffer(read.qualities, dtype=numpy.uint8,
+                                                     count=block_end - block_start,
+                                                     offset=query_index + block_start - reference_position)
+                        low_quality_offsets = numpy.flatnonzero(qualities < min_base_quality)
+                        if len(low_quality_offsets):
+                            low_quality_offsets += block_start - window_begin
+                            block_ends.extend(low_quality_offsets.tolist())
+                            block_starts.extend((low_quality_offsets + 1).tolist())
+                reference_position += length
+                query_index += length
+            elif operation in QUERY_OPERATIONS:
+                query_index += length
+            elif operation in REFERENCE_SKIP_OPERATIONS:
+                reference_position += length
+    if metrics is not None:
+        metrics.records_read += read_count
+    numpy.add.at(marks, block_starts, 1)
+    numpy.add.at(marks, block_ends, -1)
+    depth = marks[:window_length]
+    numpy.cumsum(depth, out=depth)
+    return depth
+
+
+def get_granular_quantile(histogram, quantile):
+    """
+    Returns the lowest depth with at least the quantile of the bases at or below it, the same as the
+    granular quartiles of DepthOfCoverage
+    :param histogram:
+    :param quantile:
+    :return:
+    """
+    base_count = histogram.sum()
+    if base_count == 0:
+        return 0
+    return int(numpy.searchsorted(numpy.cumsum(histogram), math.ceil(quantile * base_count)))
+
+
+def get_coverage_statistics(histogram, coverage_thresholds):
+    """
+    Summarizes a depth histogram
+    :param histogram:
+    :param coverage_thresholds:
+    :return: total coverage, mean coverage, [Q1, median, Q3], [% of bases at or above each threshold]
+    """
+    base_count = histogram.sum()
+    total_coverage = int(numpy.dot(histogram, numpy.arange(len(histogram))))
+    mean_coverage = total_coverage / base_count if base_count else 0.0
+    quartiles = [get_granular_quantile(histogram, quantile) for quantile in [0.25, 0.5, 0.75]]
+    above_threshold_percentages = [100 * histogram[threshold:].sum() / base_count if base_count else 0.0
+                                   for threshold in coverage_thresholds]
+    return total_coverage, mean_coverage, quartiles, above_threshold_percentages
+
+
+def get_interval_summary_header(sample_name, coverage_thresholds):
+    header_list = ["Target", "total_coverage", "average_coverage", sample_name + "_total_cvg",
+                   sample_name + "_mean_cvg", sample_name + "_granular_Q1", sample_name + "_granular_median",
+                   sample_name + "_granular_Q3"]
+    header_list.extend([sample_name + "_%_above_" + str(threshold) for threshold in coverage_thresholds])
+    return ",".join(header_list)
+
+
+def get_interval_summary_line(target, histogram, coverage_thresholds):
+    total_coverage, mean_coverage, quartiles, above_threshold_percentages = \
+        get_coverage_statistics(histogram, coverage_thresholds)
+    line_items = [target, str(total_coverage), "%.2f" % mean_coverage, str(total_coverage), "%.2f" % mean_coverage]
+    line_items.extend([str(quartile) for quartile in quartiles])
+    line_items.extend(["%.1f" % percentage for percentage in above_threshold_percentages])
+    return ",".join(line_items)
+
+
+def write_sample_summary(sample_summary_path, sample_name, histogram, coverage_thresholds):
+    """
+    Writes the per-sample summary over all target bases
+    :param sample_summary_path:
+    :param sample_name:
+    :param histogram: Depth histogram of all target bases
+    :param coverage_thresholds:
+    :return:
+    """
+    total_coverage, mean_coverage, quartiles, above_threshold_percentages = \
+        get_coverage_statistics(histogram, coverage_thresholds)
+    sample_summary_file = open(sample_summary_path, "w")
+    sample_summary_file.write(
+        "sample_id,total,mean,granular_third_quartile,granular_median,granular_first_quartile," +
+        ",".join(["%_bases_above_" + str(threshold) for threshold in coverage_thresholds]) + "\n")
+    sample_summary_file.write(
+        ",".join([sample_name, str(total_coverage), "%.2f" % mean_coverage, str(quartiles[2]), str(quartiles[1]),
+                  str(quartiles[0])] + ["%.1f" % percentage for percentage in above_threshold_percentages]) + "\n")
+    sample_summary_file.write("Total," + str(total_coverage) + "," + "%.2f" % mean_coverage + ",N/A,N/A,N/A\n")
+    sample_summary_file.close()
+
+
+if __name__ == "__main__":
+    main()
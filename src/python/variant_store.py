@@ -0,0 +1,315 @@
+#!/usr/bin/python3
+
+"""
+Script to keep the false positive and false negative variants of all runs in a SQLite database.
+The ingest command loads the VCFs with the same items as parse_vcfs.py, and the query command
+looks up variants by region, sample, class and run without rescanning the VCFs
+"""
+
+__author__ = "Yuta Sakai"
+
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+from bgzf import open_input_file
+from metrics import RunMetrics, add_metrics_arguments
+from parse_vcfs import get_result_items
+from vcf_reader import read_vcf_records, parse_region
+
+
+# Number of rows inserted per executemany call
+INSERT_BATCH_SIZE = 10000
+# Files taken from the input directories, the other files such as the hap.py CSVs are left out
+VCF_EXTENSIONS = (".vcf", ".vcf.gz")
+VARIANT_CLASS_FALSE_POSITIVE = "FP"
+VARIANT_CLASS_FALSE_NEGATIVE = "FN"
+VARIANT_CLASS_UNKNOWN = "NA"
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS variants ("
+    "sample TEXT NOT NULL, chrom TEXT NOT NULL, pos INTEGER NOT NULL, ref TEXT NOT NULL, alt TEXT NOT NULL, "
+    "depth INTEGER, called_af TEXT, real_af REAL, variant_class TEXT NOT NULL, run_id TEXT NOT NULL, "
+    "source_file TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS variants_position_index ON variants (chrom, pos)",
+    "CREATE INDEX IF NOT EXISTS variants_sample_index ON variants (sample)",
+    "CREATE INDEX IF NOT EXISTS variants_source_index ON variants (run_id, source_file)",
+    "CREATE TABLE IF NOT EXISTS ingested_files ("
+    "run_id TEXT NOT NULL, source_file TEXT NOT NULL, record_count INTEGER NOT NULL, ingested_at TEXT NOT NULL, "
+    "PRIMARY KEY (run_id, source_file))"
+]
+QUERY_COLUMNS = ["sample", "chrom", "pos", "ref", "alt", "depth", "called_af", "real_af", "variant_class", "run_id"]
+QUERY_HEADER = "Sample,CHROM,POS,REF,ALT,DP,Called AF,Real AF,Class,Run"
+
+
+def main():
+    # Options shared by the commands
+    common_parser = argparse.ArgumentParser(add_help=False)
+    common_parser.add_argument(
+        "-d", dest="database_path", required=True,
+        help="Full path to the SQLite database, it is created if it does not exist"
+    )
+    add_metrics_arguments(common_parser)
+
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command")
+
+    ingest_parser = subparsers.add_parser("ingest", parents=[common_parser], help="Load VCFs into the database")
+    ingest_parser.add_argument(
+        "-i", dest="inputs", required=True, nargs="+",
+        help="Full path to the VCF files or directories with VCF files"
+    )
+    ingest_parser.add_argument(
+        "-r", dest="run_id", required=True,
+        help="Run ID stored with the records, files ingested again with the same run ID are replaced"
+    )
+    ingest_parser.add_argument(
+        "-c", dest="variant_class",
+        help="Class stored with the records, default is FP for *false_positive* files, FN for "
+             "*false_negative* files and NA for other files"
+    )
+
+    query_parser = subparsers.add_parser("query", parents=[common_parser], help="Query the variants in the database")
+    query_parser.add_argument(
+        "--region", dest="regions", nargs="+", default=[],
+        help="Regions to look up as chr, chr:pos or chr:start-end, 1 based and inclusive"
+    )
+    query_parser.add_argument(
+        "--sample", dest="samples", nargs="+", default=[],
+        help="Samples to look up"
+    )
+    query_parser.add_argument(
+        "--class", dest="variant_classes", nargs="+", default=[],
+        choices=[VARIANT_CLASS_FALSE_POSITIVE, VARIANT_CLASS_FALSE_NEGATIVE, VARIANT_CLASS_UNKNOWN],
+        help="Classes to look up"
+    )
+    query_parser.add_argument(
+        "--run", dest="run_ids", nargs="+", default=[],
+        help="Run IDs to look up"
+    )
+    query_parser.add_argument(
+        "--count-by", dest="count_by", choices=["sample", "position"],
+        help="Write the number of records per sample or per position instead of the records"
+    )
+    query_parser.add_argument(
+        "-o", dest="output_file",
+        help="Full path to the CSV file to save the result, default is the standard output"
+    )
+
+    args = parser.parse_args()
+    if args.command is None:
+        parser.error("Specify the ingest or query command")
+    metrics = RunMetrics("variant_store_" + args.command, args.metrics_path, args.cprofile_path)
+
+    database_path = os.path.abspath(args.database_path)
+    connection = open_database(database_path)
+
+    if args.command == "ingest":
+        vcf_path_list = get_vcf_path_list(args.inputs)
+        with metrics.phase("ingest"):
+            for vcf_path in vcf_path_list:
+                try:
+                    record_count = ingest_vcf(connection, vcf_path, args.run_id, args.variant_class)
+                except (ValueError, IndexError, EOFError, OSError) as error:
+                    print("Skipping " + vcf_path + ", it can not be read as a VCF: " + str(error))
+                    continue
+                print("Ingested " + str(record_count) + " records from " + vcf_path)
+                metrics.records_read += record_count
+                metrics.add_input(vcf_path)
+        metrics.records_written = metrics.records_read
+        metrics.add_output(database_path)
+    else:
+        try:
+            regions = [parse_region(region) for region in args.regions]
+        except ValueError as error:
+            parser.error(str(error))
+        if args.output_file:
+            output_file = open(args.output_file, "w")
+        else:
+            output_file = sys.stdout
+        with metrics.phase("query"):
+            metrics.records_written = query_variants(connection, output_file, regions, args.samples,
+                                                     args.variant_classes, args.run_ids, args.count_by)
+        if args.output_file:
+            output_file.close()
+            metrics.add_output(args.output_file)
+        metrics.add_input(database_path)
+
+    connection.close()
+    metrics.finish()
+
+
+def open_database(database_path):
+    """
+    Opens the database and creates the tables and indexes if they do not exist
+    :param database_path:
+    :return: sqlite3 connection
+    """
+    connection = sqlite3.connect(database_path)
+    # WAL lets the queries run while another process ingests
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    with connection:
+        for statement in SCHEMA:
+            connection.execute(statement)
+    return connection
+
+
+def get_vcf_path_list(input_list):
+    """
+    Expands the directories in input_list to the .vcf and .vcf.gz files in them
+    :param input_list:
+    :return:
+    """
+    vcf_path_list = []
+    for input_path in input_list:
+        input_path = os.path.abspath(input_path)
+        if os.path.isdir(input_path):
+            vcf_path_list.extend([input_path + "/" + file for file in sorted(os.listdir(input_path))
+                                  if file.endswith(VCF_EXTENSIONS)])
+        else:
+            vcf_path_list.append(input_path)
+    return vcf_path_list
+
+
+def get_variant_class(vcf_path):
+    """
+    Gets the class of the variants from the VCF file name
+    :param vcf_path:
+    :return:
+    """
+    file_name = os.path.basename(vcf_path)
+    if "false_positive" in file_name:
+        return VARIANT_CLASS_FALSE_POSITIVE
+    elif "false_negative" in file_name:
+        return VARIANT_CLASS_FALSE_NEGATIVE
+    return VARIANT_CLASS_UNKNOWN
+
+
+def get_variant_row(result_items, variant_class, run_id, source_file):
+    """
+    Converts the result items of parse_vcfs.py to a row of the variants table, NA values are stored as NULL
+    :param result_items: List from parse_vcfs.get_result_items
+    :param variant_class:
+    :param run_id:
+    :param source_file:
+    :return:
+    """
+    sample_name, chromosome, position, ref, alt, depth, called_allele_frequency, real_allele_frequency = \
+        result_items
+    return (sample_name, chromosome, int(position), ref, alt, None if depth == "NA" else int(depth),
+            None if called_allele_frequency == "NA" else called_allele_frequency,
+            None if real_allele_frequency == "NA" else float(real_allele_frequency),
+            variant_class, run_id, source_file)
+
+
+def ingest_vcf(connection, vcf_path, run_id, variant_class=None):
+    """
+    Loads the records on the chr contigs of a VCF in one transaction, the same records as parse_vcfs.py,
+    replacing the records of an earlier ingest of the same file with the same run ID. Raises the error of
+    the first line that can not be parsed, with nothing of the file loaded
+    :param connection:
+    :param vcf_path:
+    :param run_id:
+    :param variant_class: Class of the records, taken from the file name if None
+    :return: Number of records loaded
+    """
+    if variant_class is None:
+        variant_class = get_variant_class(vcf_path)
+    sample_name = os.path.basename(vcf_path).split(".")[0].split("_")[0]
+    record_count = 0
+    vcf_file = open_input_file(vcf_path)
+    try:
+        # The with block commits the transaction, or rolls it back if the VCF can not be parsed
+        with connection:
+            connection.execute("DELETE FROM variants WHERE run_id = ? AND source_file = ?", (run_id, vcf_path))
+            row_batch = []
+            for record in read_vcf_records(vcf_file):
+                if not record.chrom.startswith("chr"):
+                    continue
+                row_batch.append(get_variant_row(get_result_items(sample_name, record), variant_class, run_id,
+                                                 vcf_path))
+                if len(row_batch) == INSERT_BATCH_SIZE:
+                    connection.executemany("INSERT INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                           row_batch)
+                    record_count += len(row_batch)
+                    row_batch = []
+            if row_batch:
+                connection.executemany("INSERT INTO variants VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row_batch)
+                record_count += len(row_batch)
+            connection.execute("INSERT OR REPLACE INTO ingested_files VALUES (?, ?, ?, ?)",
+                               (run_id, vcf_path, record_count, time.strftime("%Y-%m-%dT%H:%M:%S")))
+    finally:
+        vcf_file.close()
+    return record_count
+
+
+def build_query_filter(regions, samples, variant_classes, run_ids):
+    """
+    Makes the WHERE clause and its parameters, the regions are combined with OR and the other filters with AND
+    :param regions: List of (chromosome, start, end) from parse_region
+    :param samples:
+    :param variant_classes:
+    :param run_ids:
+    :return: where_clause, parameter_list
+    """
+    condition_list = []
+    parameter_list = []
+    region_condition_list = []
+    for chromosome, start, end in regions:
+        if start is None:
+            region_condition_list.append("chrom = ?")
+            parameter_list.append(chromosome)
+        else:
+            region_condition_list.append("(chrom = ? AND pos BETWEEN ? AND ?)")
+            parameter_list.extend([chromosome, start, end])
+    if region_condition_list:
+        condition_list.append("(" + " OR ".join(region_condition_list) + ")")
+    for column, values in [("sample", samples), ("variant_class", variant_classes), ("run_id", run_ids)]:
+        if values:
+            condition_list.append(column + " IN (" + ", ".join(["?"] * len(values)) + ")")
+            parameter_list.extend(values)
+    if not condition_list:
+        return "", parameter_list
+    return " WHERE " + " AND ".join(condition_list), parameter_list
+
+
+def query_variants(connection, output_file, regions, samples, variant_classes, run_ids, count_by=None):
+    """
+    Writes the matching records, or their counts per sample or position, to output_file in CSV format
+    :param connection:
+    :param output_file:
+    :param regions:
+    :param samples:
+    :param variant_classes:
+    :param run_ids:
+    :param count_by: None, "sample" or "position"
+    :return: Number of lines written
+    """
+    where_clause, parameter_list = build_query_filter(regions, samples, variant_classes, run_ids)
+    if count_by == "sample":
+        output_file.write("Sample,Records,Positions\n")
+        cursor = connection.execute(
+            "SELECT sample, COUNT(*), COUNT(DISTINCT chrom || ':' || pos) FROM variants" + where_clause +
+            " GROUP BY sample ORDER BY sample", parameter_list)
+    elif count_by == "position":
+        output_file.write("CHROM,POS,Records,Samples\n")
+        cursor = connection.execute(
+            "SELECT chrom, pos, COUNT(*), COUNT(DISTINCT sample) FROM variants" + where_clause +
+            " GROUP BY chrom, pos ORDER BY chrom, pos", parameter_list)
+    else:
+        output_file.write(QUERY_HEADER + "\n")
+        cursor = connection.execute(
+            "SELECT " + ", ".join(QUERY_COLUMNS) + " FROM variants" + where_clause +
+            " ORDER BY chrom, pos, sample, run_id", parameter_list)
+    line_count = 0
+    for row in cursor:
+        output_file.write(",".join(["NA" if value is None else str(value) for value in row]) + "\n")
+        line_count += 1
+    return line_count
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+#!/usr/bin/python3
+
+"""
+Shared streaming VCF reader used by the parsing scripts. The #CHROM header is parsed once
+and the FORMAT key positions are resolved once per distinct FORMAT string, so the per record
+work is a single split of the line
+"""
+
+__author__ = "Yuta Sakai"
+
+
+# Standard VCF columns, used when a file has no #CHROM header line
+VCF_HEADER_ITEMS = ["#CHROM", "POS", "ID", "REF", "ALT", "QUAL", "FILTER", "INFO", "FORMAT"]
+# Order of the non-numbered chromosomes after the autosomes
+SEX_AND_MITOCHONDRIAL_ORDER = {"X": 23, "Y": 24, "M": 25, "MT": 25}
+
+
+class VcfRecord(object):
+    """
+    Lightweight VCF data record. The FORMAT and sample columns are kept as split lists and
+    format_index maps each FORMAT key to its position in sample_values
+    """
+    __slots__ = ("chrom", "pos", "ref", "alt", "filter", "info", "format_index", "sample_values", "line_item")
+
+    def __init__(self, chrom, pos, ref, alt, filter, info, format_index, sample_values, line_item):
+        self.chrom = chrom
+        self.pos = pos
+        self.ref = ref
+        self.alt = alt
+        self.filter = filter
+        self.info = info
+        self.format_index = format_index
+        self.sample_values = sample_values
+        self.line_item = line_item
+
+    def get_format_value(self, key):
+        """
+        Returns the value of the FORMAT key for the last sample column, None if the key does not exist
+        :param key:
+        :return:
+        """
+        index = self.format_index.get(key)
+        if index is None or index >= len(self.sample_values):
+            return None
+        return self.sample_values[index]
+
+
+class ColumnIndex(object):
+    """
+    Column positions resolved from the #CHROM header line
+    """
+    __slots__ = ("chrom", "pos", "ref", "alt", "filter", "info", "format", "header_items")
+
+    def __init__(self, header_items):
+        self.header_items = header_items
+        self.chrom = header_items.index("#CHROM")
+        self.pos = header_items.index("POS")
+        self.ref = header_items.index("REF")
+        self.alt = header_items.index("ALT")
+        self.filter = header_items.index("FILTER")
+        self.info = header_items.index("INFO")
+        if "FORMAT" in header_items:
+            self.format = header_items.index("FORMAT")
+        else:
+            self.format = None
+
+
+def read_vcf_records(vcf_file, header_callback=None):
+    """
+    Generator that yields a VcfRecord for every data line in vcf_file
+    :param vcf_file: Iterable of VCF lines, typically an open file
+    :param header_callback: Optional function called with every header line, including #CHROM
+    :return:
+    """
+    columns = ColumnIndex(VCF_HEADER_ITEMS)
+    format_cache = {}
+    for line in vcf_file:
+        if line.startswith("#"):
+            if line.startswith("#CHROM"):
+                columns = ColumnIndex(line.rstrip().split("\t"))
+            if header_callback is not None:
+                header_callback(line)
+            continue
+        line = line.rstrip()
+        if not line:
+            continue
+        line_item = line.split("\t")
+        if columns.format is not None and len(line_item) > columns.format + 1:
+            format_string = line_item[columns.format]
+            format_index = format_cache.get(format_string)
+            if format_index is None:
+                format_index = {key: index for index, key in enumerate(format_string.split(":"))}
+                format_cache[format_string] = format_index
+            sample_values = line_item[-1].split(":")
+        else:
+            format_index = {}
+            sample_values = []
+        yield VcfRecord(
+            line_item[columns.chrom],
+            line_item[columns.pos],
+            line_item[columns.ref],
+            line_item[columns.alt],
+            line_item[columns.filter],
+            line_item[columns.info],
+            format_index,
+            sample_values,
+            line_item
+        )
+
+
+def get_allele_depth(record):
+    """
+    Gets the ref and alt depth from the AD FORMAT field
+    Raises ValueError if AD does not exist or is not numeric
+    :param record:
+    :return: ref_depth, alt_depth as int
+    """
+    allele_depth = record.get_format_value("AD")
+    if allele_depth is None:
+        raise ValueError("AD is not found in FORMAT")
+    allele_depth = allele_depth.split(",")
+    return int(allele_depth[0]), int(allele_depth[1])
+
+
+def chromosome_sort_key(chromosome):
+    """
+    Sort key for the natural chromosome order: chr1, chr2, ..., chr22, chrX, chrY, chrM and then
+    any other contigs in alphabetical order. Works with and without the "chr" prefix
+    :param chromosome:
+    :return:
+    """
+    name = chromosome[3:] if chromosome.startswith("chr") else chromosome
+    if name.isdigit():
+        return 0, int(name), chromosome
+    elif name in SEX_AND_MITOCHONDRIAL_ORDER:
+        return 0, SEX_AND_MITOCHONDRIAL_ORDER[name], chromosome
+    else:
+        return 1, 0, chromosome
+
+
+def parse_info(info):
+    """
+    Parses the INFO column into a dictionary of key to value, flags without a value are set to None
+    :param info:
+    :return:
+    """
+    info_dict = {}
+    for info_item in info.split(";"):
+        key, separator, value = info_item.partition("=")
+        info_dict[key] = value if separator else None
+    return info_dict
+
+
+def parse_region(region):
+    """
+    Parses a samtools style region: chr17, chr17:7577120 or chr17:7570000-7590000, thousands
+    separators are allowed in the positions
+    :param region:
+    :return: chromosome, 1 based start and 1 based inclusive end, start and end are None if not given
+    """
+    chromosome, separator, position_range = region.strip().rpartition(":")
+    if not separator:
+        return position_range, None, None
+    position_range = position_range.replace(",", "")
+    start, separator, end = position_range.partition("-")
+    if not chromosome or not start.isdigit() or (separator and not end.isdigit()):
+        raise ValueError("Invalid region: " + region)
+    start = int(start)
+    end = int(end) if separator else start
+    if end < start:
+        raise ValueError("Invalid region, end is before start: " + region)
+    return chromosome, start, end
@@ -0,0 +1,41 @@
+"""
+Shared setup of the tests: the scripts of src/python are imported as top level modules, the same
+as when they are run from that directory
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "python"))
+
+VCF_HEADER_LINES = [
+    "##fileformat=VCFv4.2\n",
+    "##contig=<ID=chr1,length=30000000>\n",
+    "##contig=<ID=chr2,length=30000000>\n",
+    "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE\n"
+]
+
+
+@pytest.fixture
+def vcf_lines():
+    """
+    Header and sorted records on two chromosomes with SNPs, short indels and long deletions that span
+    several 16 kb windows of the linear index, enough records for several BGZF blocks
+    :return:
+    """
+    random_generator = random.Random(18)
+    lines = list(VCF_HEADER_LINES)
+    for chromosome in ["chr1", "chr2"]:
+        position = 1
+        for _ in range(3000):
+            position += random_generator.choice([1, 5, 50, 400, 3000, 40000])
+            ref_length = 40000 if random_generator.random() < 0.01 else random_generator.choice([1, 1, 1, 3, 20])
+            ref = "".join([random_generator.choice("ACGT") for _ in range(min(ref_length, 5))]) + \
+                "A" * max(ref_length - 5, 0)
+            lines.append(chromosome + "\t" + str(position) + "\t.\t" + ref + "\t" + ref[0] + "T\t50\tPASS\tDP=30\t"
+                         "GT:AD\t0/1:15,15\n")
+    return lines
@@ -0,0 +1,124 @@
+"""
+Tests of the CSV output of aggregate_results.py against the script before the NumPy rewrite, and of
+the invalidation of the summary cache
+"""
+
+import json
+import os
+import sys
+
+import aggregate_results
+import summary_cache
+from summary_cache import SummaryCache
+
+
+TEST_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TEST_DIRECTORY, "..", "benchmarks"))
+
+import synthetic_data  # noqa: E402
+
+
+# INDEL.csv, SNP.csv and ALL.csv written by aggregate_results.py before the NumPy rewrite, from the
+# summary files of synthetic_data.generate_summary_directory with 12 samples and seed 7, with the rows
+# in sample order
+GOLDEN_DIRECTORY = os.path.join(TEST_DIRECTORY, "data", "aggregate_results")
+GOLDEN_SAMPLE_COUNT = 12
+GOLDEN_SEED = 7
+
+
+def run_aggregate(monkeypatch, argument_list):
+    monkeypatch.setattr(sys, "argv", ["aggregate_results.py"] + argument_list)
+    aggregate_results.main()
+
+
+def read_file(file_path):
+    with open(file_path, "rb") as input_file:
+        return input_file.read()
+
+
+def test_output_matches_golden_files(tmp_path, monkeypatch):
+    input_directory = str(tmp_path / "summaries")
+    output_directory = tmp_path / "output"
+    output_directory.mkdir()
+    synthetic_data.generate_summary_directory(input_directory, GOLDEN_SAMPLE_COUNT, GOLDEN_SEED)
+    run_aggregate(monkeypatch, ["-i", input_directory, "-o", str(output_directory)])
+    for variant_type in ["INDEL", "SNP", "ALL"]:
+        assert read_file(str(output_directory / (variant_type + ".csv"))) == \
+            read_file(os.path.join(GOLDEN_DIRECTORY, variant_type + ".csv"))
+
+
+def test_cached_run_matches_golden_files(tmp_path, monkeypatch, capsys):
+    input_directory = str(tmp_path / "summaries")
+    output_directory = tmp_path / "output"
+    output_directory.mkdir()
+    cache_path = str(tmp_path / "summary_cache.json")
+    synthetic_data.generate_summary_directory(input_directory, GOLDEN_SAMPLE_COUNT, GOLDEN_SEED)
+    run_aggregate(monkeypatch, ["-i", input_directory, "-o", str(output_directory), "--cache", cache_path])
+    run_aggregate(monkeypatch, ["-i", input_directory, "-o", str(output_directory), "--cache", cache_path])
+    assert capsys.readouterr().out.splitlines() == [
+        "Summary files parsed: 12, read from cache: 0, removed from cache: 0",
+        "Summary files parsed: 0, read from cache: 12, removed from cache: 0"]
+    for variant_type in ["INDEL", "SNP", "ALL"]:
+        assert read_file(str(output_directory / (variant_type + ".csv"))) == \
+            read_file(os.path.join(GOLDEN_DIRECTORY, variant_type + ".csv"))
+
+
+def write_summary(summary_path, content):
+    summary_file = open(summary_path, "w")
+    summary_file.write(content)
+    summary_file.close()
+
+
+def test_cache_entry_invalidated_on_size_change(tmp_path):
+    summary_path = str(tmp_path / "S1_CLC_MGC.summary.csv")
+    write_summary(summary_path, "first\n")
+    file_stat = os.stat(summary_path)
+    cache = SummaryCache(str(tmp_path / "cache.json"))
+    cache.put(summary_path, {"SNP": [1]})
+    assert cache.get(summary_path) == {"SNP": [1]}
+
+    # Same modification time, different size
+    write_summary(summary_path, "changed\n")
+    os.utime(summary_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+    assert cache.get(summary_path) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_entry_invalidated_on_mtime_change(tmp_path):
+    summary_path = str(tmp_path / "S1_CLC_MGC.summary.csv")
+    write_summary(summary_path, "first\n")
+    file_stat = os.stat(summary_path)
+    cache = SummaryCache(str(tmp_path / "cache.json"))
+    cache.put(summary_path, {"SNP": [1]})
+
+    # Same size, one nanosecond later
+    os.utime(summary_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns + 1))
+    assert cache.get(summary_path) is None
+    os.utime(summary_path, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+    assert cache.get(summary_path) == {"SNP": [1]}
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cache_saved_and_reloaded(tmp_path):
+    summary_path = str(tmp_path / "S1_CLC_MGC.summary.csv")
+    missing_path = str(tmp_path / "S2_CLC_MGC.summary.csv")
+    cache_path = str(tmp_path / "cache.json")
+    write_summary(summary_path, "first\n")
+    write_summary(missing_path, "second\n")
+    cache = SummaryCache(cache_path)
+    cache.put(summary_path, {"SNP": [1]})
+    cache.put(missing_path, {"SNP": [2]})
+    os.remove(missing_path)
+    assert cache.evict_missing() == 1
+    cache.save()
+    # The temporary file is moved in place
+    assert sorted(os.listdir(str(tmp_path))) == ["S1_CLC_MGC.summary.csv", "cache.json"]
+    assert SummaryCache(cache_path).get(summary_path) == {"SNP": [1]}
+
+    # A cache written by another version of the format is ignored
+    with open(cache_path, "r") as cache_file:
+        cache_content = json.load(cache_file)
+    cache_content["version"] = summary_cache.CACHE_VERSION + 1
+    with open(cache_path, "w") as cache_file:
+        json.dump(cache_content, cache_file)
+    assert SummaryCache(cache_path).entries == {}
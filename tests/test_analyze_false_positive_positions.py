@@ -0,0 +1,86 @@
+"""
+Tests of the external sort of analyze_false_positive_positions.py against the in-memory path
+"""
+
+import os
+import random
+import sys
+
+import analyze_false_positive_positions
+
+
+def write_input_file(input_path):
+    """
+    Writes a parse_vcfs.py result file sorted by chromosome and position, so the in-memory path writes
+    the positions in the same order as the external sort
+    :param input_path:
+    :return:
+    """
+    random_generator = random.Random(9)
+    sample_names = ["S" + str(sample_number) for sample_number in range(6)] + ["S2rep"]
+    input_file = open(input_path, "w")
+    input_file.write("Sample,CHROM,POS,REF,ALT,DP,Called AF,Real AF\n")
+    for chromosome in ["chr1", "chr2", "chr10", "chrX"]:
+        position = 0
+        for _ in range(60):
+            position += random_generator.randrange(1, 5000)
+            # A sample can have two records at a position, the alt of the last one is kept
+            for sample_name in random_generator.sample(sample_names + ["S1"], random_generator.randrange(1, 5)):
+                input_file.write(sample_name + "," + chromosome + "," + str(position) + ",A," +
+                                 random_generator.choice(["C", "G", "T", "AT"]) + ",30,0.5,0.5\n")
+    input_file.close()
+
+
+def run_analyze(monkeypatch, argument_list):
+    monkeypatch.setattr(sys, "argv", ["analyze_false_positive_positions.py"] + argument_list)
+    analyze_false_positive_positions.main()
+
+
+def read_file(file_path):
+    with open(file_path, "rb") as input_file:
+        return input_file.read()
+
+
+def test_external_sort_matches_in_memory(tmp_path, monkeypatch):
+    input_path = str(tmp_path / "parsed_vcf_results.csv")
+    write_input_file(input_path)
+    memory_directory = tmp_path / "memory"
+    external_directory = tmp_path / "external"
+    temporary_directory = tmp_path / "runs"
+    for directory in [memory_directory, external_directory, temporary_directory]:
+        directory.mkdir()
+
+    merged_run_counts = []
+    merge_run_files = analyze_false_positive_positions.merge_run_files
+
+    def count_merged_runs(run_path_list, run_directory):
+        merged_run_counts.append(len(run_path_list))
+        return merge_run_files(run_path_list, run_directory)
+
+    monkeypatch.setattr(analyze_false_positive_positions, "merge_run_files", count_merged_runs)
+    run_analyze(monkeypatch, ["-i", input_path, "-o", str(memory_directory)])
+    run_analyze(monkeypatch, ["-i", input_path, "-o", str(external_directory), "--max-records", "3",
+                              "--temp-directory", str(temporary_directory)])
+
+    # More runs than are merged at once, so the runs are merged in several passes
+    assert merged_run_counts[0] > analyze_false_positive_positions.MAX_MERGE_RUNS
+    assert read_file(str(external_directory / "variant_positions.csv")) == \
+        read_file(str(memory_directory / "variant_positions.csv"))
+    assert os.listdir(str(temporary_directory)) == []
+
+
+def test_merge_run_files_passes(tmp_path):
+    run_path_list = []
+    for run_number in range(10):
+        run_records = [("chr1", position, 0, run_number, "A") for position in range(run_number, 40, 10)]
+        run_path_list.append(analyze_false_positive_positions.write_sorted_run(run_records, str(tmp_path)))
+    merged_path_list = analyze_false_positive_positions.merge_run_files(run_path_list, str(tmp_path), 3)
+    # 10 runs make 4 runs in the first pass and 2 in the second
+    assert len(merged_path_list) == 2
+    assert sorted(os.listdir(str(tmp_path))) == sorted([os.path.basename(path) for path in merged_path_list])
+    positions = []
+    for run_path in merged_path_list:
+        run_positions = [run_record[1] for run_record in analyze_false_positive_positions.iterate_run_file(run_path)]
+        assert run_positions == sorted(run_positions)
+        positions.extend(run_positions)
+    assert sorted(positions) == list(range(40))
@@ -0,0 +1,79 @@
+"""
+Tests of the allele trimming, MNP splitting and counting of compare_vcfs.py
+"""
+
+import pytest
+
+from compare_vcfs import get_record_keys, get_summary_rows, load_variants, normalize_allele
+from conftest import VCF_HEADER_LINES
+from vcf_reader import read_vcf_records
+
+
+@pytest.mark.parametrize("pos, ref, alt, expected", [
+    # SNPs and already trimmed indels are kept as is
+    (100, "A", "G", [("chr1", 100, "A", "G")]),
+    (100, "A", "AT", [("chr1", 100, "A", "AT")]),
+    (100, "AT", "A", [("chr1", 100, "AT", "A")]),
+    # The shared end is trimmed first, then the shared start moves the position
+    (100, "ACGT", "ACT", [("chr1", 101, "CG", "C")]),
+    (100, "CTT", "CT", [("chr1", 100, "CT", "C")]),
+    (100, "GCAT", "GCAAT", [("chr1", 101, "C", "CA")]),
+    # Trimming a substitution leaves a SNP
+    (100, "ACG", "ATG", [("chr1", 101, "C", "T")]),
+    # MNPs are split into SNPs, skipping the bases that are the same
+    (100, "ACG", "TCA", [("chr1", 100, "A", "T"), ("chr1", 102, "G", "A")]),
+    (100, "AC", "GT", [("chr1", 100, "A", "G"), ("chr1", 101, "C", "T")]),
+    # Complex alleles of different lengths are only trimmed
+    (100, "ACGT", "TGA", [("chr1", 100, "ACGT", "TGA")]),
+    (100, "acgt", "act", [("chr1", 101, "CG", "C")]),
+])
+def test_normalize_allele(pos, ref, alt, expected):
+    assert normalize_allele("chr1", pos, ref, alt) == expected
+
+
+def read_records(data_lines):
+    return list(read_vcf_records(VCF_HEADER_LINES + data_lines))
+
+
+def test_get_record_keys_skips_symbolic_alleles():
+    record_list = read_records([
+        "chr1\t100\t.\tACGT\tACT,*,<DEL>,.\t50\tPASS\t.\tGT\t1/2\n",
+        "chr1\t200\t.\tA\tA[chr2:300[\t50\tPASS\t.\tGT\t0/1\n",
+        "chr1\t300\t.\tAC\tGT,A\t50\tPASS\t.\tGT\t1/2\n",
+    ])
+    assert get_record_keys(record_list[0]) == [("chr1", 101, "CG", "C")]
+    assert get_record_keys(record_list[1]) == []
+    assert get_record_keys(record_list[2]) == [("chr1", 300, "A", "G"), ("chr1", 301, "C", "T"),
+                                               ("chr1", 300, "AC", "A")]
+
+
+def test_load_variants_passes_if_any_record_passes(tmp_path):
+    vcf_path = str(tmp_path / "input.vcf")
+    vcf_file = open(vcf_path, "w")
+    vcf_file.writelines(VCF_HEADER_LINES + [
+        "chr1\t100\t.\tAC\tGT\t50\tstrand_artifact\t.\tGT\t0/1\n",
+        "chr1\t100\t.\tA\tG\t50\tPASS\t.\tGT\t0/1\n",
+        "chr1\t200\t.\tA\tC\t50\tlow_depth\t.\tGT\t0/1\n",
+    ])
+    vcf_file.close()
+    assert load_variants(vcf_path) == {("chr1", 100, "A", "G"): True, ("chr1", 101, "C", "T"): False,
+                                       ("chr1", 200, "A", "C"): False}
+
+
+def test_get_summary_rows():
+    truth_variants = {("chr1", 100, "A", "G"): True, ("chr1", 200, "C", "T"): True, ("chr1", 300, "A", "C"): False,
+                      ("chr1", 400, "AT", "A"): True}
+    query_variants = {("chr1", 100, "A", "G"): True, ("chr1", 300, "A", "C"): True, ("chr1", 500, "G", "T"): False,
+                      ("chr1", 400, "AT", "A"): False}
+    summary_rows = get_summary_rows(truth_variants, query_variants)
+    assert [summary_row[:2] for summary_row in summary_rows] == [["INDEL", "ALL"], ["INDEL", "PASS"],
+                                                                  ["SNP", "ALL"], ["SNP", "PASS"]]
+    # The PASS rows only count the alleles that pass in their own VCF
+    assert summary_rows[0][2:13] == ["1", "1", "0", "1", "0", "0", "0", "1.0", "1.0", "0.0", "1.0"]
+    assert summary_rows[1][2:13] == ["1", "0", "1", "0", "0", "0", "0", "0.0", "0.0", "0.0", "0.0"]
+    # SNP ALL: truth 3, query 3, TP 2, recall = precision = F1 = 2/3
+    assert summary_rows[2][2:] == ["3", "2", "1", "3", "1", "0", "0", "0.666667", "0.666667", "0.0", "0.666667",
+                                   "2.0", "0.5", "", ""]
+    # SNP PASS: truth A>G and C>T, query A>G and A>C
+    assert summary_rows[3][2:] == ["2", "1", "1", "2", "1", "0", "0", "0.5", "0.5", "0.0", "0.5", "", "1.0", "",
+                                   ""]
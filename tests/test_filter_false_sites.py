@@ -0,0 +1,38 @@
+"""
+Tests of the allele matching of filter_false_sites.py against the decomposed records of hap.py
+"""
+
+from conftest import VCF_HEADER_LINES
+from filter_false_sites import filter_vcf, load_sites
+
+
+def write_vcf(vcf_path, data_lines):
+    vcf_file = open(vcf_path, "w")
+    vcf_file.writelines(VCF_HEADER_LINES + data_lines)
+    vcf_file.close()
+
+
+def test_filter_vcf_matches_decomposed_happy_records(tmp_path):
+    happy_vcf_path = str(tmp_path / "happy_false_positives.vcf")
+    mgc_vcf_path = str(tmp_path / "mgc.vcf")
+    output_vcf_path = str(tmp_path / "MGC_false_positives.vcf")
+    # hap.py splits the MNP into SNPs and trims the padded deletion
+    write_vcf(happy_vcf_path, [
+        "chr1\t102\t.\tG\tA\t.\t.\t.\tGT\t0/1\n",
+        "chr1\t201\t.\tCG\tC\t.\t.\t.\tGT\t0/1\n",
+        "chr2\t300\t.\tA\t<DEL>\t.\t.\t.\tGT\t0/1\n",
+    ])
+    mgc_lines = [
+        "chr1\t100\t.\tACG\tTCA\t50\tPASS\t.\tGT:AD\t0/1:10,10\n",
+        "chr1\t200\t.\tACGT\tACT\t50\tPASS\t.\tGT:AD\t0/1:10,10\n",
+        "chr2\t300\t.\tA\t<DEL>\t50\tPASS\tEND=400\tGT:AD\t0/1:10,10\n",
+        # Same position as a false positive, different allele
+        "chr1\t102\t.\tG\tC\t50\tPASS\t.\tGT:AD\t0/1:10,10\n",
+        "chr1\t500\t.\tA\tG\t50\tPASS\t.\tGT:AD\t0/1:10,10\n",
+    ]
+    write_vcf(mgc_vcf_path, mgc_lines)
+
+    assert filter_vcf(mgc_vcf_path, load_sites(happy_vcf_path), output_vcf_path) == 3
+    output_vcf = open(output_vcf_path, "r")
+    assert output_vcf.readlines() == VCF_HEADER_LINES + mgc_lines[:3]
+    output_vcf.close()
@@ -0,0 +1,53 @@
+"""
+Tests of the hap.py commands of happy_cache.py with paths that have spaces
+"""
+
+import os
+import shlex
+import sys
+
+from happy_cache import HappyRunner, get_happy_command
+from pipeline_profile import PYTHON_SCRIPT_DIR
+
+
+def test_happy_command_runs_with_spaces(tmp_path):
+    work_directory = tmp_path / "work dir"
+    work_directory.mkdir()
+    arguments_path = str(work_directory / "arguments.txt")
+    # Stand-in for hap.py and the python 2.7 profile that record what bash ran
+    happy_path = str(work_directory / "hap py")
+    happy_file = open(happy_path, "w")
+    happy_file.write("#!/bin/bash\nfor argument in \"$@\"; do echo \"$argument\"; done > \"$PROFILE_ARGUMENTS\"\n")
+    happy_file.close()
+    os.chmod(happy_path, 0o755)
+    python2_profile = str(work_directory / "python 2.7 profile")
+    profile_file = open(python2_profile, "w")
+    profile_file.write("export PROFILE_ARGUMENTS=" + shlex.quote(arguments_path) + "\n")
+    profile_file.close()
+
+    happy_runner = HappyRunner(happy_path, python2_profile, str(work_directory / "ref genome.fa"),
+                               "--engine=scmp-somatic --threads 2")
+    exit_status = happy_runner.run(str(work_directory / "truth file.vcf.gz"), str(work_directory / "query file.vcf.gz"),
+                                   str(work_directory / "out prefix"))
+    assert exit_status == 0
+    arguments_file = open(arguments_path, "r")
+    assert arguments_file.read().splitlines() == [
+        str(work_directory / "truth file.vcf.gz"), str(work_directory / "query file.vcf.gz"),
+        "-o", str(work_directory / "out prefix"), "-r", str(work_directory / "ref genome.fa"),
+        "--engine=scmp-somatic", "--threads", "2"]
+    arguments_file.close()
+
+
+def test_sharded_command_quotes_paths():
+    happy_runner = HappyRunner("/opt/hap py/hap.py", "/opt/python 2/profile", "/ref dir/ref.fa", "--engine=xcmp -V",
+                               shard_count=4, profile_path="/config dir/profile")
+    assert shlex.split(happy_runner.get_command("/in dir/truth.vcf.gz", "/in dir/query.vcf.gz", "/out dir/s1")) == [
+        sys.executable, PYTHON_SCRIPT_DIR + "/sharded_happy.py", "-t", "/in dir/truth.vcf.gz",
+        "-q", "/in dir/query.vcf.gz", "-o", "/out dir/s1", "-s", "4", "-p", "/config dir/profile",
+        "-r", "/ref dir/ref.fa", "--happy", "/opt/hap py/hap.py", "--python2", "/opt/python 2/profile",
+        "--happy-args=--engine=xcmp -V"]
+
+
+def test_happy_command_without_profile():
+    assert shlex.split(get_happy_command("hap.py", "", "a b.vcf", "c.vcf", "o", "r.fa", "--engine=xcmp")) == [
+        "hap.py", "a b.vcf", "c.vcf", "-o", "o", "-r", "r.fa", "--engine=xcmp"]
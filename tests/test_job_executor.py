@@ -0,0 +1,135 @@
+"""
+Tests of the retries, the budget scheduler and the thread pool size of job_executor.py
+"""
+
+import threading
+import time
+
+import job_executor
+from job_executor import Executor, Job, LocalExecutor
+
+
+class ScriptedExecutor(Executor):
+    """
+    Executor whose attempts return the exit statuses given for each job in turn
+    """
+
+    def __init__(self, exit_status_dict, retries=0):
+        super().__init__(retries)
+        self.exit_status_dict = exit_status_dict
+        self.attempt_names = []
+
+    def _run_attempt(self, job, log_file):
+        self.attempt_names.append(job.name)
+        return self.exit_status_dict[job.name].pop(0)
+
+
+def test_retries_until_success(tmp_path):
+    log_path = str(tmp_path / "flaky.log")
+    executor = ScriptedExecutor({"flaky": [1, 2, 0], "broken": [1, 1, 1], "fine": [0]}, retries=2)
+    result_list = executor.run_jobs([Job("flaky", "", log_path=log_path), Job("broken", ""), Job("fine", "")])
+    assert [(result.name, result.exit_status, result.attempts) for result in result_list] == [
+        ("flaky", 0, 3), ("broken", 1, 3), ("fine", 0, 1)]
+    log_file = open(log_path, "r")
+    assert log_file.read() == "Retrying flaky, attempt 2\nRetrying flaky, attempt 3\n"
+    log_file.close()
+    assert sorted([result.name for result in executor.results]) == ["broken", "fine", "flaky"]
+
+
+def test_no_retries():
+    executor = ScriptedExecutor({"broken": [3, 0]})
+    assert executor.run_job(Job("broken", "")).exit_status == 3
+    assert executor.attempt_names == ["broken"]
+
+
+def wait_for_queue(executor, queue_length):
+    deadline = time.time() + 5
+    while len(executor._queue) != queue_length:
+        assert time.time() < deadline
+        time.sleep(0.001)
+
+
+def start_acquire(executor, job, acquired_names):
+    def acquire():
+        executor._acquire(job)
+        acquired_names.append(job.name)
+
+    thread = threading.Thread(target=acquire)
+    thread.start()
+    return thread
+
+
+def test_budget_queue_is_first_in_first_out():
+    executor = LocalExecutor(max_memory_mb=1000, max_cpus=4)
+    big_job = Job("big", "", memory_mb=600)
+    second_big_job = Job("second_big", "", memory_mb=600)
+    small_job = Job("small", "", memory_mb=300)
+    acquired_names = []
+    executor._acquire(big_job)
+    second_big_thread = start_acquire(executor, second_big_job, acquired_names)
+    wait_for_queue(executor, 1)
+    # The small job fits next to the big job, but waits behind the second big job
+    small_thread = start_acquire(executor, small_job, acquired_names)
+    wait_for_queue(executor, 2)
+    time.sleep(0.05)
+    assert acquired_names == []
+
+    executor._release(big_job)
+    second_big_thread.join(5)
+    small_thread.join(5)
+    assert acquired_names == ["second_big", "small"]
+    assert (executor._used_memory_mb, executor._used_cpus, executor._running_count) == (900, 2, 2)
+
+
+def test_oversized_job_runs_alone():
+    executor = LocalExecutor(max_memory_mb=1000, max_cpus=2)
+    small_job = Job("small", "", memory_mb=100)
+    huge_job = Job("huge", "", memory_mb=5000, cpus=8)
+    acquired_names = []
+    executor._acquire(small_job)
+    huge_thread = start_acquire(executor, huge_job, acquired_names)
+    wait_for_queue(executor, 1)
+    time.sleep(0.05)
+    assert acquired_names == []
+    executor._release(small_job)
+    huge_thread.join(5)
+    assert acquired_names == ["huge"]
+    # Nothing else runs next to it
+    assert not executor._fits(small_job)
+    executor._release(huge_job)
+    assert executor._fits(huge_job)
+
+
+def test_run_jobs_stays_in_budget(monkeypatch):
+    executor = LocalExecutor(max_memory_mb=1000, max_cpus=3)
+    usage_list = []
+    thread_names = set()
+
+    def fake_call(arguments, **kwargs):
+        with executor._condition:
+            usage_list.append((executor._used_memory_mb, executor._used_cpus))
+        thread_names.add(threading.current_thread().name)
+        time.sleep(0.01)
+        return 0 if arguments[-1] != "exit 1" else 1
+
+    monkeypatch.setattr(job_executor.subprocess, "call", fake_call)
+    job_list = [Job("job" + str(job_number), "true", memory_mb=300, cpus=1) for job_number in range(12)]
+    job_list.append(Job("failing", "exit 1", memory_mb=300, cpus=1))
+    result_list = executor.run_jobs(job_list)
+    assert [result.name for result in result_list] == [job.name for job in job_list]
+    assert [result.exit_status for result in result_list] == [0] * 12 + [1]
+    assert len(usage_list) == 13
+    assert max([memory_mb for memory_mb, _ in usage_list]) <= 1000
+    assert max([cpus for _, cpus in usage_list]) <= 3
+    # Three 300 MB jobs fit in 1000 MB, so three threads are enough
+    assert len(thread_names) <= 3
+    assert (executor._used_memory_mb, executor._used_cpus, executor._running_count) == (0, 0, 0)
+
+
+def test_max_workers():
+    executor = LocalExecutor(max_memory_mb=1000, max_cpus=4)
+    assert executor.get_max_workers([Job("job", "", memory_mb=300)] * 10) == 3
+    assert executor.get_max_workers([Job("job", "", memory_mb=100, cpus=2)] * 10) == 2
+    assert executor.get_max_workers([Job("job", "", memory_mb=10)] * 2) == 2
+    assert executor.get_max_workers([Job("job", "", memory_mb=5000, cpus=8)] * 3) == 1
+    assert ScriptedExecutor({}).get_max_workers([Job("job", "")] * 7) == 7
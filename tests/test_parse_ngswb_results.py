@@ -0,0 +1,71 @@
+"""
+Tests of the NGSWB join of parse_ngswb_results.py with and without --per-sample
+"""
+
+import sys
+
+import pytest
+
+import parse_ngswb_results
+from conftest import VCF_HEADER_LINES
+
+
+NGSWB_LINES = [
+    "Sample,Gene,Genomic\n",
+    "S1,GENE1,chr1:g.100A>G\n",
+    "S3,GENE2,chr1:g.100A>G\n",
+    "S1,GENE3,chr1:g.200C>T\n",
+    "S2,GENE1,chr2:g.300G>A\n",
+    "S3,GENE4,chr2:g.300G>A\n"
+]
+
+
+def write_inputs(tmp_path):
+    """
+    Writes the VCFs of S1 and S2 and an NGSWB file that also has rows of S3, which has no VCF
+    :param tmp_path:
+    :return: Path to the VCF directory and the NGSWB file
+    """
+    vcf_directory = tmp_path / "vcfs"
+    vcf_directory.mkdir()
+    sample_record_dict = {
+        "S1": ["chr1\t100\t.\tA\tG\t50\tPASS\t.\tGT:AD\t0/1:30,10\n"],
+        "S2": ["chr2\t300\t.\tG\tA\t50\tPASS\t.\tGT:AD\t0/1:5,15\n"]
+    }
+    for sample, record_lines in sample_record_dict.items():
+        vcf_file = open(str(vcf_directory / (sample + "_MGC.vcf")), "w")
+        vcf_file.write("".join(VCF_HEADER_LINES + record_lines))
+        vcf_file.close()
+    ngswb_path = str(tmp_path / "ngswb.csv")
+    ngswb_file = open(ngswb_path, "w")
+    ngswb_file.write("".join(NGSWB_LINES))
+    ngswb_file.close()
+    return str(vcf_directory), ngswb_path
+
+
+def run_parse(monkeypatch, tmp_path, argument_list):
+    vcf_directory, ngswb_path = write_inputs(tmp_path)
+    output_directory = tmp_path / "output"
+    output_directory.mkdir(exist_ok=True)
+    monkeypatch.setattr(sys, "argv", ["parse_ngswb_results.py", "-i", vcf_directory, "-f", ngswb_path,
+                                      "-o", str(output_directory)] + argument_list)
+    parse_ngswb_results.main()
+    result_file = open(str(output_directory / "NGSWB_Compare_Results.csv"), "r")
+    result_lines = result_file.read().splitlines()
+    result_file.close()
+    return result_lines
+
+
+@pytest.mark.parametrize("argument_list", [[], ["--per-sample", "--keep-order"]])
+def test_sample_without_vcf_is_not_found(tmp_path, monkeypatch, capsys, argument_list):
+    result_lines = run_parse(monkeypatch, tmp_path, argument_list)
+    assert result_lines == [
+        "Sample,Gene,Genomic" + parse_ngswb_results.RESULT_HEADER_SUFFIX.rstrip(),
+        "S1,GENE1,chr1:g.100A>G,Y,chr1:g.100A>G,40,10,0.25,100",
+        "S3,GENE2,chr1:g.100A>G,N",
+        "S1,GENE3,chr1:g.200C>T,N",
+        "S2,GENE1,chr2:g.300G>A,Y,chr2:g.300G>A,20,15,0.75,300",
+        "S3,GENE4,chr2:g.300G>A,N"
+    ]
+    # The missing VCF is reported once
+    assert capsys.readouterr().out.count("No VCF found for sample: S3") == 1
@@ -0,0 +1,41 @@
+"""
+Tests of the --max-records option of parse_vcfs.py
+"""
+
+import sys
+
+import pytest
+
+import parse_vcfs
+from conftest import VCF_HEADER_LINES
+
+
+def run_parse(monkeypatch, tmp_path, argument_list):
+    vcf_directory = tmp_path / "vcfs"
+    vcf_directory.mkdir()
+    for sample in ["S1", "S2"]:
+        vcf_file = open(str(vcf_directory / (sample + "_MGC.vcf")), "w")
+        vcf_file.write("".join(VCF_HEADER_LINES) +
+                       "chr1\t100\t.\tA\tG\t50\tPASS\tDP=40;AF=0.25\tGT:AD\t0/1:30,10\n" +
+                       "chr2\t300\t.\tG\tA\t50\tPASS\tDP=20;AF=0.75\tGT:AD\t0/1:5,15\n")
+        vcf_file.close()
+    output_directory = tmp_path / "output"
+    output_directory.mkdir()
+    monkeypatch.setattr(sys, "argv", ["parse_vcfs.py", "-i", str(vcf_directory), "-o", str(output_directory)] +
+                        argument_list)
+    parse_vcfs.main()
+    return output_directory
+
+
+def test_max_records_requires_positions(tmp_path, monkeypatch, capsys):
+    with pytest.raises(SystemExit) as exit_info:
+        run_parse(monkeypatch, tmp_path, ["--max-records", "1"])
+    assert exit_info.value.code == 2
+    assert "--max-records requires --positions or --position-details" in capsys.readouterr().err
+
+
+def test_max_records_with_positions(tmp_path, monkeypatch):
+    output_directory = run_parse(monkeypatch, tmp_path, ["--positions", "--max-records", "1"])
+    positions_file = open(str(output_directory / "variant_positions.csv"), "r")
+    assert positions_file.read().splitlines() == [",S1,S2,Total Count", "chr1:100,G,G,2", "chr2:300,A,A,2"]
+    positions_file.close()
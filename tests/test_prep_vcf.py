@@ -0,0 +1,173 @@
+"""
+Tests of the FILTER matching of prep_vcf.py, the virtual offsets of BgzfWriter and the index made by
+TabixIndexBuilder, checked against an index made by htslib through pysam
+"""
+
+import gzip
+import random
+import shutil
+import sys
+
+import pytest
+
+import prep_vcf
+from bgzf import BGZF_BLOCK_SIZE, BgzfWriter, decompress_bgzf_block, read_bgzf_block
+from tabix import TBI_PSEUDO_BIN, TabixIndex, TabixIndexBuilder
+
+
+def test_is_excluded_exact_and_subset():
+    exclude_filter_sets = prep_vcf.get_exclude_filter_sets(["strand_artifact", "A;B"])
+    assert prep_vcf.is_excluded("strand_artifact", exclude_filter_sets, False)
+    assert prep_vcf.is_excluded("B;A", exclude_filter_sets, False)
+    assert not prep_vcf.is_excluded("strand_artifact;clustered_events", exclude_filter_sets, False)
+    assert not prep_vcf.is_excluded("A;B;C", exclude_filter_sets, False)
+    # Subset drops the records that have all the filters of a value, the same as bcftools FILTER~
+    assert prep_vcf.is_excluded("strand_artifact;clustered_events", exclude_filter_sets, True)
+    assert prep_vcf.is_excluded("A;B;C", exclude_filter_sets, True)
+    assert not prep_vcf.is_excluded("A;C", exclude_filter_sets, True)
+    assert not prep_vcf.is_excluded("PASS", exclude_filter_sets, True)
+    assert not prep_vcf.is_excluded("PASS", [], False)
+
+
+def test_get_record_end():
+    assert prep_vcf.get_record_end(99, "chr1\t100\t.\tACG\tA\t50\tPASS\tDP=3".split("\t")) == 102
+    assert prep_vcf.get_record_end(99, "chr1\t100\t.\tA\t<DEL>\t50\tPASS\tSVTYPE=DEL;END=500".split("\t")) == 500
+    assert prep_vcf.get_record_end(99, "chr1\t100\t.\tA\t<DEL>\t50\tPASS\tEND=.".split("\t")) == 100
+
+
+def test_bgzf_writer_virtual_offsets(tmp_path):
+    bgzf_path = str(tmp_path / "lines.gz")
+    random_generator = random.Random(25)
+    writer = BgzfWriter(bgzf_path, threads=2)
+    lines = [(str(line_number) + "\t" + "ACGT" * random_generator.randrange(1, 3000) + "\n").encode()
+             for line_number in range(300)]
+    positions = []
+    for line in lines:
+        positions.append(writer.tell())
+        writer.write(line)
+    end_position = writer.tell()
+    writer.close()
+    assert positions[-1][0] > 5
+
+    bgzf_file = open(bgzf_path, "rb")
+    data = b"".join(lines)
+    data_offset = 0
+    for line, position in zip(lines, positions):
+        virtual_offset = writer.get_virtual_offset(position)
+        assert virtual_offset & 0xFFFF == data_offset % BGZF_BLOCK_SIZE
+        bgzf_file.seek(virtual_offset >> 16)
+        block_data = decompress_bgzf_block(read_bgzf_block(bgzf_file))
+        # The line can go on in the next block
+        assert block_data[virtual_offset & 0xFFFF:] == data[data_offset:data_offset + len(block_data) -
+                                                             (virtual_offset & 0xFFFF)]
+        assert data[data_offset:].startswith(line)
+        data_offset += len(line)
+    # The end of the data is the end of the last block
+    end_virtual_offset = writer.get_virtual_offset(end_position)
+    bgzf_file.seek(end_virtual_offset >> 16)
+    assert len(decompress_bgzf_block(read_bgzf_block(bgzf_file))) == end_virtual_offset & 0xFFFF
+    bgzf_file.close()
+
+    gzip_file = gzip.open(bgzf_path, "rb")
+    assert gzip_file.read() == data
+    gzip_file.close()
+
+
+def test_bgzf_writer_rejects_unwritten_blocks(tmp_path):
+    writer = BgzfWriter(str(tmp_path / "lines.gz"), threads=1)
+    writer.write(b"line\n")
+    with pytest.raises(ValueError):
+        writer.get_virtual_offset(writer.tell())
+    writer.close()
+    assert writer.get_virtual_offset((0, 5)) == 5
+
+
+def test_index_builder_bins_and_linear_index(tmp_path):
+    index_path = str(tmp_path / "input.vcf.gz.tbi")
+    index_builder = TabixIndexBuilder()
+    # The offsets stand for virtual offsets that are all in the first BGZF block, so the chunks of a bin
+    # are merged the same as htslib
+    index_builder.add_record("chr1", 100, 101, 0, 10)
+    index_builder.add_record("chr1", 50000, 50001, 10, 20)
+    # Spans the windows 3 to 7
+    index_builder.add_record("chr1", 60000, 120000, 20, 30)
+    index_builder.add_record("chr1", 60001, 60002, 30, 40)
+    index_builder.add_record("chr2", 16384, 16385, 40, 50)
+    index_builder.write(index_path, lambda offset: offset)
+
+    index = TabixIndex(index_path)
+    assert index.names == ["chr1", "chr2"]
+    # The windows 1 and 2 have no record and take the offset of window 3
+    assert index.linear_index_list[0] == (0, 10, 10, 10, 20, 20, 20, 20)
+    assert index.bin_list[0] == {4681: [(0, 10)], 4684: [(10, 40)], 585: [(20, 30)],
+                                 TBI_PSEUDO_BIN: [(0, 40), (4, 0)]}
+    # The window 0 of chr2 has no record either
+    assert index.linear_index_list[1] == (40, 40)
+    assert index.bin_list[1] == {4682: [(40, 50)], TBI_PSEUDO_BIN: [(40, 50), (1, 0)]}
+
+
+def test_index_builder_rejects_unsorted_records():
+    index_builder = TabixIndexBuilder()
+    index_builder.add_record("chr1", 100, 101, 0, 10)
+    with pytest.raises(ValueError):
+        index_builder.add_record("chr1", 99, 100, 10, 20)
+    index_builder = TabixIndexBuilder()
+    index_builder.add_record("chr1", 100, 101, 0, 10)
+    index_builder.add_record("chr2", 100, 101, 10, 20)
+    with pytest.raises(ValueError):
+        index_builder.add_record("chr1", 200, 201, 20, 30)
+
+
+def run_prep_vcf(monkeypatch, argument_list):
+    monkeypatch.setattr(sys, "argv", ["prep_vcf.py"] + argument_list)
+    prep_vcf.main()
+
+
+def test_prep_vcf_index_matches_htslib(tmp_path, monkeypatch, vcf_lines):
+    pysam = pytest.importorskip("pysam")
+    input_vcf_path = str(tmp_path / "input.vcf")
+    output_vcf_path = str(tmp_path / "output.vcf.gz")
+    htslib_vcf_path = str(tmp_path / "htslib.vcf.gz")
+    random_generator = random.Random(31)
+    data_lines = []
+    for line in vcf_lines:
+        if not line.startswith("#") and random_generator.random() < 0.1:
+            line_item = line.split("\t")
+            line_item[6] = random_generator.choice(["strand_artifact", "strand_artifact;clustered_events"])
+            if random_generator.random() < 0.2:
+                # Symbolic deletions end at INFO/END, not at the end of REF
+                line_item[4] = "<DEL>"
+                line_item[7] = "SVTYPE=DEL;END=" + str(int(line_item[1]) + 30000)
+            line = "\t".join(line_item)
+        data_lines.append(line)
+    input_vcf = open(input_vcf_path, "w")
+    input_vcf.writelines(data_lines)
+    input_vcf.close()
+
+    run_prep_vcf(monkeypatch, ["-i", input_vcf_path, "-o", output_vcf_path, "-e", "strand_artifact", "-t", "2"])
+    kept_lines = [line for line in data_lines if line.startswith("#") or line.split("\t")[6] != "strand_artifact"]
+    output_vcf = gzip.open(output_vcf_path, "rt")
+    assert output_vcf.readlines() == kept_lines
+    output_vcf.close()
+
+    shutil.copyfile(output_vcf_path, htslib_vcf_path)
+    pysam.tabix_index(htslib_vcf_path, preset="vcf", keep_original=True)
+    index = TabixIndex(output_vcf_path + ".tbi")
+    htslib_index = TabixIndex(htslib_vcf_path + ".tbi")
+    assert index.names == htslib_index.names
+    # htslib also moves the chunks of small bins up to the parent bins, so only the linear index is the same
+    assert index.linear_index_list == htslib_index.linear_index_list
+
+    tabix_file = pysam.TabixFile(output_vcf_path, index=output_vcf_path + ".tbi")
+    htslib_tabix_file = pysam.TabixFile(htslib_vcf_path)
+    found_count = 0
+    for _ in range(100):
+        chromosome = random_generator.choice(["chr1", "chr2"])
+        start = random_generator.randrange(22000000)
+        end = start + random_generator.choice([1, 100, 50000, 2000000])
+        region_lines = list(tabix_file.fetch(chromosome, start, end))
+        assert region_lines == list(htslib_tabix_file.fetch(chromosome, start, end))
+        found_count += len(region_lines)
+    tabix_file.close()
+    htslib_tabix_file.close()
+    assert found_count > 0
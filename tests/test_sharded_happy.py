@@ -0,0 +1,79 @@
+"""
+Tests of the block cutting, shard packing and summary merging of sharded_happy.py
+"""
+
+from compare_vcfs import SUMMARY_HEADER
+from sharded_happy import BLOCK_GAP, VariantBlock, assign_shards, make_blocks, merge_summary_files
+
+
+def make_block(record_count):
+    block = VariantBlock("chr1", 0, 1)
+    block.truth_lines = ["line\n"] * record_count
+    return block
+
+
+def make_record(chromosome, begin, ref_length=1):
+    return chromosome, begin, begin + ref_length, chromosome + ":" + str(begin) + "\n"
+
+
+def test_make_blocks_splits_on_gap_and_chromosome():
+    truth_records = [make_record("chr2", 100), make_record("chr2", 100 + BLOCK_GAP + 1), make_record("chr1", 50)]
+    # The deletion ends at 5100, so the query record at 5100 + BLOCK_GAP is still in its block
+    query_records = [make_record("chr2", 100, 5000), make_record("chr2", 5100 + BLOCK_GAP), make_record("chr1", 60)]
+    block_list = make_blocks(truth_records, query_records)
+    # The chromosomes keep the order they first appear in
+    assert [(block.chromosome, block.begin, block.end) for block in block_list] == [
+        ("chr2", 100, 5100 + BLOCK_GAP + 1), ("chr1", 50, 61)]
+    assert block_list[0].truth_lines == [truth_records[0][3], truth_records[1][3]]
+    assert block_list[0].query_lines == [query_records[0][3], query_records[1][3]]
+    assert block_list[1].get_record_count() == 2
+
+    block_list = make_blocks([make_record("chr1", 100), make_record("chr1", 101 + BLOCK_GAP + 1)], [])
+    assert [block.begin for block in block_list] == [100, 101 + BLOCK_GAP + 1]
+
+
+def test_assign_shards_balances_records():
+    block_list = [make_block(record_count) for record_count in [5, 4, 3, 3, 1]]
+    shard_list = assign_shards(block_list, 2)
+    # 5 and 4 start the shards, 3 goes to the shard of 4, the next 3 to the shard of 5 and 1 to the shard of 7
+    assert shard_list == [[block_list[0], block_list[3]], [block_list[1], block_list[2], block_list[4]]]
+
+
+def test_assign_shards_drops_empty_shards():
+    block_list = [make_block(2), make_block(1)]
+    assert assign_shards(block_list, 4) == [[block_list[0]], [block_list[1]]]
+    assert assign_shards(block_list, 0) == [block_list]
+    assert assign_shards([], 3) == []
+
+
+def write_summary(summary_path, rows):
+    summary_file = open(summary_path, "w")
+    summary_file.write(SUMMARY_HEADER + "\n")
+    for row in rows:
+        summary_file.write(row + "\n")
+    summary_file.close()
+
+
+def test_merge_summary_files(tmp_path):
+    first_path = str(tmp_path / "shard1.summary.csv")
+    second_path = str(tmp_path / "shard2.summary.csv")
+    output_path = str(tmp_path / "merged.summary.csv")
+    write_summary(first_path, [
+        "SNP,ALL,10,8,2,12,3,1,0,0.8,0.727273,0.083333,0.761905,2.1,2.0,1.5,1.4",
+    ])
+    # hap.py leaves FP.gt empty for some rows
+    write_summary(second_path, [
+        "INDEL,PASS,0,0,0,2,2,0,,0.0,0.0,0.0,0.0,,,,",
+        "SNP,ALL,5,4,1,6,1,0,1,0.8,0.833333,0.0,0.816327,2.0,2.2,1.0,1.1",
+    ])
+    merge_summary_files([first_path, second_path], output_path)
+    output_file = open(output_path, "r")
+    lines = output_file.read().splitlines()
+    output_file.close()
+    # SNP ALL: query TP = 18 - 4 - 1 = 13, recall = 12 / 15, precision = 13 / 17, Frac_NA = 1 / 18,
+    # F1 = 2 * 13 * 12 / (13 * 15 + 12 * 17) = 312 / 399
+    assert lines == [
+        SUMMARY_HEADER,
+        "INDEL,PASS,0,0,0,2,2,0,0,0.0,0.0,0.0,0.0,,,,",
+        "SNP,ALL,15,12,3,18,4,1,1,0.8,0.764706,0.055556,0.781955,,,,",
+    ]
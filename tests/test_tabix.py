@@ -0,0 +1,115 @@
+"""
+Tests of the bin and linear index math of tabix.py and of the region reads through .tbi and .csi indexes
+"""
+
+import random
+
+import pytest
+
+from conftest import VCF_HEADER_LINES
+from tabix import TBI_DEPTH, TBI_MIN_SHIFT, TabixIndex, iterate_filtered_lines, iterate_region_lines, reg2bin, \
+    reg2bins
+
+
+# Depth of the CSI indexes made by htslib with the default min_shift of 14
+CSI_DEPTH = 6
+
+
+def test_reg2bins_first_base():
+    # One bin on each level: the root, then the first bin of levels 1 to 5
+    assert reg2bins(0, 1, TBI_MIN_SHIFT, TBI_DEPTH) == [0, 1, 9, 73, 585, 4681]
+
+
+def test_reg2bins_two_windows():
+    # 16383-16385 crosses the first 16 kb window, so both level 5 bins are listed
+    assert reg2bins(16383, 16385, TBI_MIN_SHIFT, TBI_DEPTH) == [0, 1, 9, 73, 585, 4681, 4682]
+
+
+def test_reg2bins_empty_and_clipped():
+    assert reg2bins(10, 10, TBI_MIN_SHIFT, TBI_DEPTH) == []
+    # The end is clipped to the 512 Mb covered by the tbi bins
+    assert reg2bins((1 << 29) - 1, 1 << 31, TBI_MIN_SHIFT, TBI_DEPTH)[-1] == 4681 + (1 << 15) - 1
+
+
+def test_reg2bin_levels():
+    assert reg2bin(0, 1, TBI_MIN_SHIFT, TBI_DEPTH) == 4681
+    assert reg2bin(16384, 16385, TBI_MIN_SHIFT, TBI_DEPTH) == 4682
+    # Crosses a 16 kb window, fits in the first 128 kb bin of level 4
+    assert reg2bin(16383, 16385, TBI_MIN_SHIFT, TBI_DEPTH) == 585
+    # Crosses a 128 kb bin, fits in the first 1 Mb bin of level 3
+    assert reg2bin(131071, 131073, TBI_MIN_SHIFT, TBI_DEPTH) == 73
+    assert reg2bin(0, 1 << 29, TBI_MIN_SHIFT, TBI_DEPTH) == 0
+
+
+@pytest.mark.parametrize("depth", [TBI_DEPTH, CSI_DEPTH])
+def test_record_bin_is_in_overlapping_region_bins(depth):
+    random_generator = random.Random(depth)
+    max_position = 1 << (TBI_MIN_SHIFT + depth * 3)
+    for _ in range(2000):
+        record_begin = random_generator.randrange(max_position - 1)
+        record_end = min(record_begin + random_generator.choice([1, 10, 20000, 300000]), max_position)
+        region_begin = random_generator.randrange(max(record_begin - 50000, 0), record_end)
+        region_end = max(region_begin + random_generator.choice([1, 100, 100000]), record_begin + 1)
+        region_bins = reg2bins(region_begin, region_end, TBI_MIN_SHIFT, depth)
+        assert reg2bin(record_begin, record_end, TBI_MIN_SHIFT, depth) in region_bins
+
+
+def make_index(bin_dict, linear_index):
+    """
+    Makes a TabixIndex of one chromosome without reading an index file
+    :param bin_dict: Dictionary of bin to list of (begin, end) chunks
+    :param linear_index:
+    :return:
+    """
+    index = TabixIndex.__new__(TabixIndex)
+    index.names = ["chr1"]
+    index.name_index = {"chr1": 0}
+    index.bin_list = [bin_dict]
+    index.linear_index_list = [linear_index]
+    index.min_shift = TBI_MIN_SHIFT
+    index.depth = TBI_DEPTH
+    return index
+
+
+def test_get_chunks_linear_index():
+    index = make_index({4681: [(100, 200)], 4682: [(300, 400)], 585: [(10, 90), (50, 350)]}, (100, 300))
+    # The window of 16384 starts at offset 300: the chunk of bin 4681 and (10, 90) end before it and
+    # (50, 350) is clipped to (300, 350) and merged with (300, 400)
+    assert index.get_chunks("chr1", 16384, 16390) == [(300, 400)]
+    # The first window starts at 100, so only (10, 90) is left out
+    assert index.get_chunks("chr1", 0, 10) == [(100, 350)]
+    assert index.get_chunks("chr2", 0, 10) == []
+
+
+def test_get_chunks_past_linear_index():
+    # Regions after the last window use the offset of the last window
+    index = make_index({4681: [(100, 200)], 4683: [(500, 600)]}, (100, 100, 500))
+    assert index.get_chunks("chr1", 10 << TBI_MIN_SHIFT, (10 << TBI_MIN_SHIFT) + 1) == []
+    assert index.get_chunks("chr1", 2 << TBI_MIN_SHIFT, (2 << TBI_MIN_SHIFT) + 1) == [(500, 600)]
+
+
+@pytest.mark.parametrize("csi", [False, True])
+def test_region_lines_match_full_scan(tmp_path, vcf_lines, csi):
+    pysam = pytest.importorskip("pysam")
+    plain_vcf_path = str(tmp_path / "input.vcf")
+    vcf_path = plain_vcf_path + ".gz"
+    plain_vcf = open(plain_vcf_path, "w")
+    plain_vcf.writelines(vcf_lines)
+    plain_vcf.close()
+    pysam.tabix_compress(plain_vcf_path, vcf_path)
+    pysam.tabix_index(vcf_path, preset="vcf", csi=csi, keep_original=True)
+    index_path = vcf_path + (".csi" if csi else ".tbi")
+    index = TabixIndex(index_path)
+    assert index.names == ["chr1", "chr2"]
+    assert (index.min_shift, index.depth) == ((TBI_MIN_SHIFT, CSI_DEPTH) if csi else (TBI_MIN_SHIFT, TBI_DEPTH))
+
+    random_generator = random.Random(7)
+    found_count = 0
+    for _ in range(60):
+        chromosome = random_generator.choice(["chr1", "chr2"])
+        start = random_generator.randrange(1, 22000000)
+        regions = [(chromosome, start, start + random_generator.choice([0, 100, 50000, 2000000]))]
+        region_lines = list(iterate_region_lines(vcf_path, regions, index_path))
+        assert region_lines == list(iterate_filtered_lines(vcf_path, regions))
+        found_count += len(region_lines) - len(VCF_HEADER_LINES)
+    assert found_count > 0
@@ -0,0 +1,120 @@
+"""
+Tests of the per-base depth of target_coverage.py against pysam count_coverage, and of the clustering of
+nearby targets into one fetch of the reads
+"""
+
+import random
+import sys
+
+import numpy
+import pytest
+
+import target_coverage
+from bam_reader import BamFile
+
+
+pysam = pytest.importorskip("pysam")
+
+REFERENCE_LENGTH = 20000
+TARGET_LIST = [("chr1", 101, 180), ("chr1", 400, 650), ("chr1", 1200, 1300), ("chr1", 5000, 5100),
+               ("chr1", 5150, 5160), ("chr2", 50, 900), ("chr2", 19000, 20000)]
+
+
+def write_bam(bam_path):
+    """
+    Writes an indexed BAM of random reads on chr1 and chr2 with soft clips, insertions, deletions, low
+    base qualities and reads skipped for their flags
+    :param bam_path:
+    :return:
+    """
+    random_generator = random.Random(21)
+    header = {"HD": {"VN": "1.6", "SO": "coordinate"},
+              "SQ": [{"SN": "chr1", "LN": REFERENCE_LENGTH}, {"SN": "chr2", "LN": REFERENCE_LENGTH}]}
+    read_list = []
+    for reference_id in range(2):
+        for read_number in range(1500):
+            read = pysam.AlignedSegment()
+            read.query_name = "read" + str(reference_id) + "_" + str(read_number)
+            read.reference_id = reference_id
+            read.reference_start = random_generator.randrange(0, REFERENCE_LENGTH - 200)
+            read.mapping_quality = 60
+            read.flag = random_generator.choice([0, 0, 0, 16, 0x400, 0x100])
+            read.cigarstring = random_generator.choice(["100M", "10S90M", "40M2I58M", "30M5D70M", "50M3D20M1I29M"])
+            read.query_sequence = "".join([random_generator.choice("ACGT") for _ in range(100)])
+            read.query_qualities = pysam.qualitystring_to_array(
+                "".join([random_generator.choice("#5?I") for _ in range(100)]))
+            read_list.append(read)
+    read_list.sort(key=lambda read: (read.reference_id, read.reference_start))
+    bam_file = pysam.AlignmentFile(bam_path, "wb", header=header)
+    for read in read_list:
+        bam_file.write(read)
+    bam_file.close()
+    pysam.index(bam_path)
+
+
+def get_pysam_depth(bam_path, chromosome, begin, end, min_base_quality):
+    bam_file = pysam.AlignmentFile(bam_path, "rb")
+    depth = numpy.sum(bam_file.count_coverage(chromosome, begin, end, quality_threshold=min_base_quality), axis=0)
+    bam_file.close()
+    return depth
+
+
+@pytest.mark.parametrize("min_base_quality", [0, 20])
+def test_cluster_histograms_match_pysam(tmp_path, min_base_quality):
+    bam_path = str(tmp_path / "sample.bam")
+    write_bam(bam_path)
+    bam_file = BamFile(bam_path)
+    depth_buffer = numpy.zeros(target_coverage.DEPTH_BUFFER_SIZE + 1, dtype=numpy.int32)
+    cluster_list = target_coverage.cluster_targets(TARGET_LIST, target_coverage.DEPTH_BUFFER_SIZE)
+    for chromosome, begin, end, cluster in cluster_list:
+        histogram_list = target_coverage.get_cluster_histograms(bam_file, chromosome, begin, end, cluster,
+                                                                depth_buffer, 0, min_base_quality)
+        for (start, target_end), histogram in zip(cluster, histogram_list):
+            expected_histogram = numpy.bincount(get_pysam_depth(bam_path, chromosome, start - 1, target_end,
+                                                                min_base_quality))
+            assert numpy.trim_zeros(histogram, "b").tolist() == numpy.trim_zeros(expected_histogram, "b").tolist()
+    bam_file.close()
+
+
+def test_cluster_targets():
+    assert target_coverage.cluster_targets(TARGET_LIST, target_coverage.DEPTH_BUFFER_SIZE) == [
+        ("chr1", 100, 1300, [(101, 180), (400, 650), (1200, 1300)]),
+        ("chr1", 4999, 5160, [(5000, 5100), (5150, 5160)]),
+        ("chr2", 49, 900, [(50, 900)]),
+        ("chr2", 18999, 20000, [(19000, 20000)])]
+    # A cluster never spans more than the depth buffer
+    assert target_coverage.cluster_targets(TARGET_LIST[:3], 600) == [
+        ("chr1", 100, 650, [(101, 180), (400, 650)]), ("chr1", 1199, 1300, [(1200, 1300)])]
+
+
+def test_one_fetch_per_cluster(tmp_path, monkeypatch):
+    bam_path = str(tmp_path / "sample.bam")
+    write_bam(bam_path)
+    bed_path = str(tmp_path / "targets.bed")
+    bed_file = open(bed_path, "w")
+    for chromosome, start, end in TARGET_LIST:
+        bed_file.write(chromosome + "\t" + str(start - 1) + "\t" + str(end) + "\n")
+    bed_file.close()
+
+    fetched_regions = []
+    fetch = BamFile.fetch
+
+    def record_fetch(bam_file, chromosome, begin, end):
+        fetched_regions.append((chromosome, begin, end))
+        return fetch(bam_file, chromosome, begin, end)
+
+    monkeypatch.setattr(BamFile, "fetch", record_fetch)
+    output_prefix = str(tmp_path / "sample")
+    monkeypatch.setattr(sys, "argv", ["target_coverage.py", "-b", bam_path, "-t", bed_path, "-o", output_prefix,
+                                      "-q", "0"])
+    target_coverage.main()
+    assert fetched_regions == [("chr1", 100, 1300), ("chr1", 4999, 5160), ("chr2", 49, 900), ("chr2", 18999, 20000)]
+
+    # Every target still has its own line, with the depth of pysam count_coverage
+    interval_summary_file = open(output_prefix + ".sample_interval_summary", "r")
+    interval_summary_lines = interval_summary_file.read().splitlines()
+    interval_summary_file.close()
+    assert [line.split(",")[0] for line in interval_summary_lines[1:]] == [
+        chromosome + ":" + str(start) + "-" + str(end) for chromosome, start, end in TARGET_LIST]
+    for line, (chromosome, start, end) in zip(interval_summary_lines[1:], TARGET_LIST):
+        assert int(line.split(",")[1]) == int(get_pysam_depth(bam_path, chromosome, start - 1, end, 0).sum())
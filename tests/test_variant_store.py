@@ -0,0 +1,53 @@
+"""
+Tests of the ingest of variant_store.py
+"""
+
+import sqlite3
+import sys
+
+import variant_store
+from conftest import VCF_HEADER_LINES
+
+
+def write_file(file_path, lines):
+    output_file = open(file_path, "w")
+    output_file.writelines(lines)
+    output_file.close()
+
+
+def run_variant_store(monkeypatch, argument_list):
+    monkeypatch.setattr(sys, "argv", ["variant_store.py"] + argument_list)
+    variant_store.main()
+
+
+def test_ingest_directory_skips_other_files(tmp_path, monkeypatch, capsys):
+    input_directory = tmp_path / "happy_out"
+    input_directory.mkdir()
+    write_file(str(input_directory / "sample1_false_positives.vcf"), VCF_HEADER_LINES + [
+        "chr1\t100\t.\tA\tG\t50\tPASS\t.\tGT:AD:AF\t0/1:30,10:0.25\n",
+        "GL000220.1\t100\t.\tA\tG\t50\tPASS\t.\tGT:AD:AF\t0/1:30,10:0.25\n",
+        "chr2\t200\t.\tAT\tA\t50\tPASS\t.\tGT\t0/1\n",
+    ])
+    # A truncated record: nothing of the file is loaded and the other files are still ingested
+    write_file(str(input_directory / "sample2_false_negatives.vcf"), VCF_HEADER_LINES + [
+        "chr1\t300\t.\tC\tT\t50\tPASS\t.\tGT:AD\t0/1:5,5\n",
+        "chr1\t400\n",
+    ])
+    write_file(str(input_directory / "sample1.summary.csv"), ["Type,Filter,TRUTH.TOTAL\n", "SNP,ALL,1\n"])
+    write_file(str(input_directory / "sample1_false_positives.vcf.gz.tbi"), ["not a VCF\n"])
+    database_path = str(tmp_path / "variants.db")
+
+    run_variant_store(monkeypatch, ["ingest", "-d", database_path, "-i", str(input_directory), "-r", "run1"])
+    output = capsys.readouterr().out
+    assert "Ingested 2 records from " + str(input_directory / "sample1_false_positives.vcf") in output
+    assert "Skipping " + str(input_directory / "sample2_false_negatives.vcf") in output
+    assert "summary.csv" not in output
+
+    connection = sqlite3.connect(database_path)
+    rows = connection.execute("SELECT sample, chrom, pos, ref, alt, depth, called_af, real_af, variant_class "
+                              "FROM variants ORDER BY chrom, pos").fetchall()
+    ingested_files = connection.execute("SELECT source_file FROM ingested_files").fetchall()
+    connection.close()
+    assert rows == [("sample1", "chr1", 100, "A", "G", 40, "0.25", 0.25, "FP"),
+                    ("sample1", "chr2", 200, "AT", "A", None, None, None, "FP")]
+    assert ingested_files == [(str(input_directory / "sample1_false_positives.vcf"),)]